@@ -0,0 +1,263 @@
+"""
+Microbenchmark suite for the scoring engine hot path
+
+Benchmarks:
+  - norm / extract_size_and_count (cold = no LRU cache, warm = cached)
+  - parse_price, phash_similarity
+  - _score_offers_for_extension on synthetic offer sets of 10 .. 10k offers,
+    with cached hashes (pHash lookups are free) and uncached (every offer
+    thumbnail is decoded + hashed from in-memory bytes; no network)
+  - _score_offers_for_extension on replayed offer sets from a cassette
+    corpus (--corpus, see cassettes.py)
+
+Reports ops/sec and peak allocated KiB per op (tracemalloc, measured in a
+separate pass so it doesn't skew timings). Save a baseline and compare
+later runs against it:
+
+    python benchmarks/bench_scoring.py --save baseline.json
+    python benchmarks/bench_scoring.py --compare baseline.json
+
+--compare exits 1 if any benchmark is slower than baseline by more than
+--tolerance (default 10%).
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from io import BytesIO
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from PIL import Image  # noqa: E402
+import imagehash  # noqa: E402
+
+import utils  # noqa: E402
+import services  # noqa: E402
+from models import ExtensionFullProduct, ParsedOffer  # noqa: E402
+from cassettes import iter_serp  # noqa: E402
+from bench_titles import make_titles  # noqa: E402
+
+N_IMAGES = 16
+
+
+# ---------------------------------------------------------------------
+# Synthetic data
+# ---------------------------------------------------------------------
+def make_images(n=N_IMAGES, seed=11):
+    rnd = random.Random(seed)
+    out = []
+    for _ in range(n):
+        img = Image.new("RGB", (64, 64))
+        img.putdata([(rnd.randrange(256), rnd.randrange(256), rnd.randrange(256)) for _ in range(64 * 64)])
+        buf = BytesIO()
+        img.save(buf, format="PNG")
+        out.append(buf.getvalue())
+    return out
+
+
+IMAGES = make_images()
+IMAGE_BY_URL = {f"synthetic://img/{i}": data for i, data in enumerate(IMAGES)}
+HASH_BY_URL = {
+    url: imagehash.phash(Image.open(BytesIO(data)).convert("RGB"))
+    for url, data in IMAGE_BY_URL.items()
+}
+
+
+def make_offers(n, amz_price, seed=3):
+    rnd = random.Random(seed)
+    titles = make_titles(n, seed=seed)
+    return [
+        ParsedOffer(
+            merchant="google_shopping",
+            source_domain=f"shop{i % 50}.com",
+            title=t,
+            price=round(amz_price * rnd.uniform(0.5, 1.3), 2),
+            url=f"https://shop{i % 50}.com/p/{i}",
+            thumbnail=f"synthetic://img/{i % N_IMAGES}",
+        )
+        for i, t in enumerate(titles)
+    ]
+
+
+def amazon_payload(title="Logitech Wireless Mouse Model 42", price=29.99):
+    return ExtensionFullProduct(
+        asin="B0BENCH000", title=title, price=price,
+        brand=title.split(" ")[0], thumbnail="synthetic://img/0",
+    )
+
+
+def replayed_sets(corpus):
+    """(payload, offers) for every google_shopping response in the corpus."""
+    out = []
+    for entry in iter_serp(corpus):
+        if entry["params"].get("engine") != "google_shopping":
+            continue
+
+        async def fake_serp(url, q, _resp=entry["response"]):
+            return _resp
+
+        with patch.object(services, "serp_get", fake_serp):
+            offers = asyncio.run(services.provider_google_shopping(entry["params"]["q"]))
+        if not offers:
+            continue
+        prices = sorted(o.price for o in offers)
+        out.append((amazon_payload(entry["params"]["q"], prices[len(prices) // 2] * 1.2), offers))
+    return out
+
+
+# ---------------------------------------------------------------------
+# pHash modes
+# ---------------------------------------------------------------------
+async def phash_cached(url):
+    return HASH_BY_URL.get(url)
+
+
+async def fetch_in_memory(url):
+    return IMAGE_BY_URL.get(url)
+
+
+def phash_patches(cached):
+    if cached:
+        return [patch.object(utils, "compute_phash", phash_cached)]
+    return [
+        patch.object(utils, "fetch_image_bytes", fetch_in_memory),
+        patch.object(utils.PHASH_CACHE, "enabled", False),
+    ]
+
+
+# ---------------------------------------------------------------------
+# Runner
+# ---------------------------------------------------------------------
+def measure(fn, min_time):
+    """ops/sec of fn() (best of 3 runs of >= min_time/3 each) + peak KiB/op."""
+    fn()  # warm-up
+
+    best = 0.0
+    for _ in range(3):
+        n, t0 = 0, time.perf_counter()
+        while True:
+            fn()
+            n += 1
+            elapsed = time.perf_counter() - t0
+            if elapsed >= min_time / 3:
+                break
+        best = max(best, n / elapsed)
+
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    base, _ = tracemalloc.get_traced_memory()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {"ops_per_sec": best, "peak_kib": max(0, peak - base) / 1024.0}
+
+
+def scoring_fn(payload, offers, cached):
+    loop = asyncio.new_event_loop()
+    patches = phash_patches(cached)
+
+    def run():
+        for p in patches:
+            p.start()
+        try:
+            return loop.run_until_complete(utils._score_offers_for_extension(payload, offers))
+        finally:
+            for p in patches:
+                p.stop()
+
+    return run
+
+
+def build_suite(sizes, corpus):
+    titles = make_titles(500)
+    prices = ["$12.99", "19", {"extracted": "7.49"}, 24.5, "1,299.00"]
+    h1, h2 = HASH_BY_URL["synthetic://img/0"], HASH_BY_URL["synthetic://img/1"]
+
+    suite = {
+        "norm_cold": lambda: [utils.analyze_title.__wrapped__(t).title_norm for t in titles],
+        "norm_warm": lambda: [utils.norm(t) for t in titles],
+        "extract_size_and_count": lambda: [utils.extract_size_and_count(t) for t in titles],
+        "parse_price": lambda: [utils.parse_price(p) for p in prices * 100],
+        "phash_similarity": lambda: [utils.phash_similarity(h1, h2) for _ in range(500)],
+    }
+
+    payload = amazon_payload()
+    for n in sizes:
+        offers = make_offers(n, payload.price)
+        suite[f"score_{n}_cached_hash"] = scoring_fn(payload, offers, cached=True)
+        suite[f"score_{n}_uncached_hash"] = scoring_fn(payload, offers, cached=False)
+
+    if corpus:
+        for i, (p, offers) in enumerate(replayed_sets(corpus)):
+            suite[f"replay_{i}_{len(offers)}_offers"] = scoring_fn(p, offers, cached=False)
+
+    return suite
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    print(f"\n{'benchmark':<32}{'baseline':>12}{'now':>12}{'change':>9}")
+    for name, r in results.items():
+        b = baseline.get("results", {}).get(name)
+        if not b:
+            continue
+        change = r["ops_per_sec"] / b["ops_per_sec"] - 1.0
+        flag = ""
+        if change < -tolerance:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<32}{b['ops_per_sec']:>12.1f}{r['ops_per_sec']:>12.1f}{change * 100:>8.1f}%{flag}")
+    return regressions
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", default="10,100,1000,10000")
+    ap.add_argument("--corpus", default=None)
+    ap.add_argument("--min-time", type=float, default=1.5, help="seconds per benchmark")
+    ap.add_argument("--only", default=None, help="substring filter on benchmark names")
+    ap.add_argument("--save", default=None)
+    ap.add_argument("--compare", default=None)
+    ap.add_argument("--tolerance", type=float, default=0.10)
+    args = ap.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    suite = build_suite(sizes, args.corpus)
+
+    results = {}
+    print(f"{'benchmark':<32}{'ops/sec':>12}{'peak KiB/op':>14}")
+    for name, fn in suite.items():
+        if args.only and args.only not in name:
+            continue
+        results[name] = r = measure(fn, args.min_time)
+        print(f"{name:<32}{r['ops_per_sec']:>12.1f}{r['peak_kib']:>14.1f}")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({
+                "meta": {"python": platform.python_version(), "machine": platform.machine(),
+                         "created": time.strftime("%Y-%m-%dT%H:%M:%S")},
+                "results": results,
+            }, f, indent=2)
+        print(f"\nBaseline saved to {args.save}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
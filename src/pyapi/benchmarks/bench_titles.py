@@ -0,0 +1,134 @@
+"""
+Micro-benchmark: title normalization + size parsing + multipack detection
+
+Compares, per title:
+  - legacy:  norm() + extract_size_and_count() + the 4 scraper regexes,
+             as they were before utils.analyze_title existed
+  - cold:    utils.analyze_title without the LRU cache (single pass only)
+  - warm:    utils.analyze_title with the LRU cache hit
+
+Also checks every title gives identical results on both paths.
+
+Usage (from src/pyapi):
+    python benchmarks/bench_titles.py [--titles 2000] [--repeat 5]
+"""
+
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import analyze_title, STOPWORDS, SIZE_RE, _to_grams  # noqa: E402
+
+
+# ---------------------------------------------------------------------
+# Legacy reference implementation (pre-analyze_title)
+# ---------------------------------------------------------------------
+def legacy_norm(s):
+    if not s:
+        return ""
+    s = re.sub(r"[^a-z0-9 ]+", " ", s.lower())
+    toks = [t for t in s.split() if t and t not in STOPWORDS]
+    return " ".join(toks)
+
+
+def legacy_size(title):
+    grams = None
+    count = 1
+    if not title:
+        return {"grams": None, "count": 1}
+    for m in SIZE_RE.finditer(title):
+        qty, unit, pack_of, ct_alt, pack_alt = m.groups()
+        if qty and unit:
+            g = _to_grams(float(qty), unit)
+            if g:
+                grams = max(grams or 0, g)
+        for v in (pack_of, ct_alt, pack_alt):
+            if v and v.isdigit():
+                count = max(count, int(v))
+    return {"grams": grams, "count": count}
+
+
+def legacy_multipack(title):
+    t = title.lower()
+    if "pack of" in t:
+        return True
+    if re.search(r"\b\d+\s*(pack|packet|bundle|variety|ct|count)\b", t):
+        return True
+    if re.search(r"\b\d+\s*pk\b", t):
+        return True
+    if re.search(r"\b\d+\s*x\s*\d+", t):
+        return True
+    return False
+
+
+def legacy(title):
+    size = legacy_size(title)
+    return legacy_norm(title), size["grams"], size["count"], legacy_multipack(title)
+
+
+# ---------------------------------------------------------------------
+# Synthetic corpus
+# ---------------------------------------------------------------------
+BRANDS = ["Logitech", "MUD\\WTR", "Cetaphil", "Wahl", "Nature's Bounty", "OXO", "Anker"]
+NOUNS = ["Wireless Mouse", "Coffee Alternative", "Moisturizing Cream", "Hair Clippers",
+         "Vitamin D3 Softgels", "Salad Spinner", "USB-C Charger"]
+SIZES = ["", "12 oz", "1.5 lb", "500 ml", "2 L", "100 ct", "Pack of 3", "6-Pack", "4 pk", "2 x 8"]
+EXTRAS = ["", "with Case", "for Men & Women", "(Black)", "- Fragrance Free", "Cordless, Rechargeable"]
+
+
+def make_titles(n, seed=7):
+    rnd = random.Random(seed)
+    return [
+        " ".join(filter(None, (
+            rnd.choice(BRANDS), rnd.choice(NOUNS), rnd.choice(SIZES),
+            rnd.choice(EXTRAS), f"Model {rnd.randint(1, 9999)}",
+        )))
+        for _ in range(n)
+    ]
+
+
+def per_title_us(fn, titles, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for t in titles:
+            fn(t)
+        best = min(best, time.perf_counter() - t0)
+    return best / len(titles) * 1e6
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--titles", type=int, default=2000)
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+
+    titles = make_titles(args.titles)
+
+    # Correctness: new path must match legacy exactly
+    for t in titles:
+        a = analyze_title.__wrapped__(t)
+        assert (a.title_norm, a.grams, a.count, a.multipack) == legacy(t), t
+
+    legacy_us = per_title_us(legacy, titles, args.repeat)
+    cold_us = per_title_us(analyze_title.__wrapped__, titles, args.repeat)
+
+    analyze_title.cache_clear()
+    for t in titles:
+        analyze_title(t)
+    warm_us = per_title_us(analyze_title, titles, args.repeat)
+
+    print(f"titles: {len(titles)}  (best of {args.repeat})")
+    print(f"legacy  {legacy_us:8.2f} us/title")
+    print(f"cold    {cold_us:8.2f} us/title  ({legacy_us / cold_us:5.1f}x)")
+    print(f"warm    {warm_us:8.2f} us/title  ({legacy_us / warm_us:5.1f}x)")
+    print(analyze_title.cache_info())
+
+
+if __name__ == "__main__":
+    main()
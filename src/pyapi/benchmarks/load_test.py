@@ -0,0 +1,159 @@
+"""
+Offline load harness for the pyapi service
+
+Drives a running API (ideally pointed at benchmarks/serp_replay.py) with a
+weighted mix of endpoints from N concurrent workers, then reports per
+endpoint: requests, errors, throughput and p50/p95/p99 latency.
+
+Usage (from src/pyapi):
+    python benchmarks/load_test.py --api http://localhost:8001 \
+        --corpus ./corpus --concurrency 16 --duration 60 \
+        --mix find-deals=8,deals=4,feed=2,scrape=1,index=1
+
+find-deals payloads come from Amazon results in the corpus (falls back to
+a few synthetic products). scrape/index write to --amz-coll/--match-coll,
+so use scratch collections.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cassettes import iter_serp  # noqa: E402
+from utils import parse_price  # noqa: E402
+
+SYNTHETIC_PRODUCTS = [
+    {"asin": "B0SYNTH001", "title": "Logitech M510 Wireless Mouse", "price": 29.99, "brand": "Logitech"},
+    {"asin": "B0SYNTH002", "title": "MUD WTR Coffee Alternative 30 Servings", "price": 45.00, "brand": "MUD WTR"},
+    {"asin": "B0SYNTH003", "title": "Wahl Color Pro Cordless Hair Clippers", "price": 39.99, "brand": "Wahl"},
+]
+
+
+def corpus_products(corpus):
+    """Amazon organic results from the corpus, shaped like extension payloads."""
+    products, queries = [], []
+    if not corpus:
+        return products, queries
+    for entry in iter_serp(corpus):
+        if entry["params"].get("engine") != "amazon":
+            continue
+        queries.append(entry["params"].get("k"))
+        for it in entry["response"].get("organic_results") or []:
+            price = parse_price(it.get("price"))
+            if it.get("title") and price:
+                products.append({
+                    "asin": it.get("asin"),
+                    "title": it["title"],
+                    "price": price,
+                    "brand": it.get("brand"),
+                    "thumbnail": it.get("thumbnail"),
+                })
+    return products, [q for q in queries if q]
+
+
+def build_requests(args, products, queries):
+    """endpoint name -> fn() returning (method, path, params, json)."""
+    return {
+        "find-deals": lambda: ("POST", "/extension/find-deals", None, random.choice(products)),
+        "deals": lambda: ("GET", "/deals/google", {"match_coll": args.match_coll, "limit": 100}, None),
+        "feed": lambda: ("GET", "/deals/feed", {"limit": 50}, None),
+        "scrape": lambda: (
+            "POST", "/amazon/scrape-category", {"amz_coll": args.amz_coll},
+            {"query": random.choice(queries), "pages": 1, "max_products": 20},
+        ),
+        "index": lambda: (
+            "POST", "/google-shopping/index-by-title",
+            {"amz_coll": args.amz_coll, "match_coll": args.match_coll,
+             "limit_items": 20, "per_call_delay_ms": 0},
+            None,
+        ),
+    }
+
+
+def percentile(sorted_vals, p):
+    if not sorted_vals:
+        return 0.0
+    idx = min(len(sorted_vals) - 1, int(round(p / 100.0 * (len(sorted_vals) - 1))))
+    return sorted_vals[idx]
+
+
+async def worker(client, deadline, choices, weights, makers, latencies, errors):
+    while time.perf_counter() < deadline:
+        name = random.choices(choices, weights)[0]
+        method, path, params, body = makers[name]()
+        t0 = time.perf_counter()
+        try:
+            r = await client.request(method, path, params=params, json=body)
+            ok = r.status_code < 400
+        except httpx.HTTPError:
+            ok = False
+        latencies[name].append(time.perf_counter() - t0)
+        if not ok:
+            errors[name] += 1
+
+
+async def run(args):
+    products, queries = corpus_products(args.corpus)
+    products = products or SYNTHETIC_PRODUCTS
+    queries = queries or ["logitech mouse"]
+
+    mix = dict(item.split("=") for item in args.mix.split(","))
+    makers = build_requests(args, products, queries)
+    unknown = set(mix) - set(makers)
+    if unknown:
+        raise SystemExit(f"Unknown endpoints in --mix: {sorted(unknown)}")
+
+    choices = list(mix)
+    weights = [float(mix[c]) for c in choices]
+
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+
+    timeout = httpx.Timeout(args.timeout)
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.api, timeout=timeout, limits=limits) as client:
+        t0 = time.perf_counter()
+        deadline = t0 + args.duration
+        await asyncio.gather(*(
+            worker(client, deadline, choices, weights, makers, latencies, errors)
+            for _ in range(args.concurrency)
+        ))
+        elapsed = time.perf_counter() - t0
+
+    print(f"duration {elapsed:.1f}s  concurrency {args.concurrency}")
+    print(f"{'endpoint':<12}{'reqs':>7}{'errs':>6}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    total = 0
+    for name in choices:
+        vals = sorted(latencies[name])
+        total += len(vals)
+        print(
+            f"{name:<12}{len(vals):>7}{errors[name]:>6}{len(vals) / elapsed:>9.1f}"
+            f"{percentile(vals, 50) * 1000:>9.0f}{percentile(vals, 95) * 1000:>9.0f}"
+            f"{percentile(vals, 99) * 1000:>9.0f}"
+        )
+    print(f"{'total':<12}{total:>7}{sum(errors.values()):>6}{total / elapsed:>9.1f}")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--api", default="http://localhost:8001")
+    ap.add_argument("--corpus", default=None)
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--duration", type=float, default=30.0)
+    ap.add_argument("--timeout", type=float, default=120.0)
+    ap.add_argument("--mix", default="find-deals=8,deals=4,feed=2,scrape=1,index=1")
+    ap.add_argument("--amz-coll", default="amz_loadtest")
+    ap.add_argument("--match-coll", default="match_loadtest")
+    asyncio.run(run(ap.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Local SerpAPI stand-in that replays a recorded cassette corpus
+
+Record a corpus by running the API with SERP_RECORD_DIR set (see
+cassettes.py), then serve it back:
+
+    python benchmarks/serp_replay.py --corpus ./corpus --port 8010 \
+        --latency-ms 800 --jitter-ms 300 --rate-429 0.05
+
+and point the API at it:
+
+    SERPAPI_BASE_URL=http://localhost:8010 uvicorn main:app --port 8001
+
+- GET /search.json  -> recorded response for the same params (api_key and
+                       no_cache ignored), 404 if never recorded
+- GET /img/<key>    -> recorded thumbnail bytes
+- Thumbnail URLs in replayed responses are rewritten to /img/<key> so
+  image downloads + pHash hit the corpus too
+- Latency (mean + uniform jitter) and random 429s are injected per call
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cassettes import serp_key, image_key, iter_serp, load_image  # noqa: E402
+
+IMAGE_FIELDS = {"thumbnail", "image"}
+
+
+def rewrite_images(obj, base_url, known):
+    """Point recorded image URLs at this server (only those in the corpus)."""
+    if isinstance(obj, dict):
+        out = {}
+        for k, v in obj.items():
+            if k in IMAGE_FIELDS and isinstance(v, str) and image_key(v) in known:
+                out[k] = f"{base_url}/img/{image_key(v)}"
+            else:
+                out[k] = rewrite_images(v, base_url, known)
+        return out
+    if isinstance(obj, list):
+        return [rewrite_images(v, base_url, known) for v in obj]
+    return obj
+
+
+def build_app(corpus, latency_ms=0.0, jitter_ms=0.0, rate_429=0.0,
+              image_latency_ms=0.0, base_url="http://localhost:8010"):
+    app = FastAPI(title="SerpAPI replay")
+
+    img_dir = os.path.join(corpus, "images")
+    known_images = {
+        name[: -len(".bin.gz")]
+        for name in (os.listdir(img_dir) if os.path.isdir(img_dir) else [])
+        if name.endswith(".bin.gz")
+    }
+
+    # Preload so disk reads don't show up in latency numbers
+    responses = {}
+    for entry in iter_serp(corpus):
+        responses[serp_key(entry["params"])] = rewrite_images(
+            entry["response"], base_url, known_images
+        )
+    images = {k: load_image(corpus, k) for k in known_images}
+
+    stats = {"served": 0, "missing": 0, "throttled": 0}
+    print(f"Replay corpus: {len(responses)} responses, {len(images)} images")
+
+    async def delay(mean_ms):
+        if mean_ms or jitter_ms:
+            ms = max(0.0, mean_ms + random.uniform(-jitter_ms, jitter_ms))
+            await asyncio.sleep(ms / 1000.0)
+
+    @app.get("/search.json")
+    async def search(request: Request):
+        await delay(latency_ms)
+
+        if rate_429 and random.random() < rate_429:
+            stats["throttled"] += 1
+            return JSONResponse({"error": "Injected rate limit"}, status_code=429)
+
+        data = responses.get(serp_key(dict(request.query_params)))
+        if data is None:
+            stats["missing"] += 1
+            return JSONResponse({"error": "Query not in corpus"}, status_code=404)
+
+        stats["served"] += 1
+        return data
+
+    @app.get("/img/{key}")
+    async def image(key: str):
+        await delay(image_latency_ms)
+        data = images.get(key)
+        if data is None:
+            return Response(status_code=404)
+        return Response(data, media_type="application/octet-stream")
+
+    @app.get("/stats")
+    async def get_stats():
+        return stats
+
+    return app
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--corpus", required=True)
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8010)
+    ap.add_argument("--latency-ms", type=float, default=0.0)
+    ap.add_argument("--jitter-ms", type=float, default=0.0)
+    ap.add_argument("--rate-429", type=float, default=0.0)
+    ap.add_argument("--image-latency-ms", type=float, default=0.0)
+    args = ap.parse_args()
+
+    app = build_app(
+        args.corpus,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        rate_429=args.rate_429,
+        image_latency_ms=args.image_latency_ms,
+        base_url=f"http://{args.host}:{args.port}",
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+import os, re, time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Optional
+from metrics import CACHE
+
+# Two-tier cache shared by all uvicorn workers
+#
+#   L1: per-process bounded LRU with expiry (no I/O)
+#   L2: Mongo collection SHARED_CACHE_COLL, TTL-indexed on expiresAt
+#
+# Until init_shared_cache(db) runs (scripts, benchmarks, debug runner) only
+# L1 is used.
+
+SHARED_CACHE_COLL = os.getenv("SHARED_CACHE_COLL", "shared_cache")
+
+_db = None
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+def init_shared_cache(db) -> None:
+    global _db
+    _db = db
+
+async def ensure_cache_indexes(db) -> None:
+    await db[SHARED_CACHE_COLL].create_index("expiresAt", expireAfterSeconds=0)
+
+class SharedCache:
+    def __init__(self, namespace: str, ttl_s: float, local_max: int = 10000):
+        self.namespace = namespace
+        self.ttl_s = ttl_s
+        self.local_max = local_max
+        self.enabled = True
+        self._local: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def _key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    def _local_get(self, key: str):
+        hit = self._local.get(key)
+        if hit is None:
+            return None
+        value, expires = hit
+        if expires < time.monotonic():
+            del self._local[key]
+            return None
+        self._local.move_to_end(key)
+        return value
+
+    def _local_set(self, key: str, value: Any, ttl_s: float) -> None:
+        self._local[key] = (value, time.monotonic() + ttl_s)
+        self._local.move_to_end(key)
+        while len(self._local) > self.local_max:
+            self._local.popitem(last=False)
+
+    async def get(self, key: str) -> Optional[Any]:
+        if not self.enabled or not key:
+            return None
+
+        value = self._local_get(key)
+        if value is not None:
+            CACHE.inc(cache=self.namespace, result="hit_local")
+            return value
+
+        if _db is not None:
+            try:
+                doc = await _db[SHARED_CACHE_COLL].find_one(
+                    {"_id": self._key(key), "expiresAt": {"$gt": _now()}},
+                    {"v": 1, "expiresAt": 1},
+                )
+            except Exception as e:
+                print("Shared cache read ERROR:", e)
+                doc = None
+            if doc is not None:
+                CACHE.inc(cache=self.namespace, result="hit_shared")
+                # Motor returns naive UTC datetimes
+                remaining = (doc["expiresAt"].replace(tzinfo=timezone.utc) - _now()).total_seconds()
+                self._local_set(key, doc["v"], max(1.0, remaining))
+                return doc["v"]
+
+        CACHE.inc(cache=self.namespace, result="miss")
+        return None
+
+    async def set(self, key: str, value: Any, ttl_s: Optional[float] = None) -> None:
+        if not self.enabled or not key or value is None:
+            return
+        ttl_s = ttl_s or self.ttl_s
+        self._local_set(key, value, ttl_s)
+
+        if _db is not None:
+            try:
+                await _db[SHARED_CACHE_COLL].update_one(
+                    {"_id": self._key(key)},
+                    {"$set": {"v": value, "expiresAt": _now() + timedelta(seconds=ttl_s)}},
+                    upsert=True,
+                )
+            except Exception as e:
+                print("Shared cache write ERROR:", e)
+
+    async def preload(self, limit: int) -> int:
+        """Fill L1 with up to `limit` unexpired entries (worker warm-up)."""
+        if _db is None or not self.enabled or limit <= 0:
+            return 0
+        prefix = f"{self.namespace}:"
+        cursor = _db[SHARED_CACHE_COLL].find(
+            {"_id": {"$regex": "^" + re.escape(prefix)}, "expiresAt": {"$gt": _now()}},
+        ).limit(min(limit, self.local_max))
+        n = 0
+        async for doc in cursor:
+            remaining = (doc["expiresAt"].replace(tzinfo=timezone.utc) - _now()).total_seconds()
+            self._local_set(doc["_id"][len(prefix):], doc["v"], max(1.0, remaining))
+            n += 1
+        return n
+
+# Per-collection data versions
+#
+# Writers bump a collection's version; readers derive ETags / response
+# cache keys from it. Each process trusts its last read for VERSION_TTL_S,
+# so a poll inside that window costs no Mongo round trip, and another
+# worker's write shows up within VERSION_TTL_S.
+
+COLLECTION_VERSIONS_COLL = os.getenv("COLLECTION_VERSIONS_COLL", "collection_versions")
+VERSION_TTL_S = float(os.getenv("VERSION_TTL_S", "2"))
+
+# coll -> (version, trusted until monotonic)
+_versions: dict = {}
+
+async def collection_version(coll: str) -> int:
+    hit = _versions.get(coll)
+    if hit is not None and hit[1] > time.monotonic():
+        return hit[0]
+
+    v = hit[0] if hit else 0
+    if _db is not None:
+        try:
+            doc = await _db[COLLECTION_VERSIONS_COLL].find_one({"_id": coll}, {"v": 1})
+            v = doc["v"] if doc else 0
+        except Exception as e:
+            print("Collection version read ERROR:", e)
+    _versions[coll] = (v, time.monotonic() + VERSION_TTL_S)
+    return v
+
+async def bump_collection_version(coll: str) -> None:
+    """Call after writing to `coll`; readers in this process see it at once."""
+    v = (_versions.get(coll) or (0, 0))[0] + 1
+    if _db is not None:
+        try:
+            await _db[COLLECTION_VERSIONS_COLL].update_one(
+                {"_id": coll}, {"$inc": {"v": 1}}, upsert=True,
+            )
+            # Re-read on next use: other workers may have bumped too
+            _versions.pop(coll, None)
+            return
+        except Exception as e:
+            print("Collection version write ERROR:", e)
+    _versions[coll] = (v, time.monotonic() + VERSION_TTL_S)
@@ -0,0 +1,78 @@
+import os, json, gzip, hashlib
+from typing import Optional
+
+# SerpAPI record/replay corpus
+#
+# With SERP_RECORD_DIR set, every successful SerpAPI response and every
+# downloaded thumbnail is saved (gzip) under that directory:
+#
+#   <dir>/serp/<key>.json.gz     {"params": {...}, "response": {...}}
+#   <dir>/images/<key>.bin.gz    raw image bytes
+#
+# benchmarks/serp_replay.py serves the same corpus back so the API can be
+# load-tested offline.
+
+SERP_RECORD_DIR = os.getenv("SERP_RECORD_DIR")
+
+# Params that never change the result and must not end up on disk
+_IGNORED_PARAMS = {"api_key", "no_cache"}
+
+def serp_key(params: dict) -> str:
+    """Stable key for a SerpAPI query (ignores api_key/no_cache)."""
+    clean = {k: str(v) for k, v in params.items() if k not in _IGNORED_PARAMS}
+    raw = json.dumps(clean, sort_keys=True).encode()
+    return hashlib.sha1(raw).hexdigest()
+
+def image_key(url: str) -> str:
+    return hashlib.sha1(url.encode()).hexdigest()
+
+def _write_gz(path: str, data: bytes) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with gzip.open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+def record_serp(params: dict, response: dict, root: Optional[str] = None) -> None:
+    root = root or SERP_RECORD_DIR
+    if not root:
+        return
+    clean = {k: v for k, v in params.items() if k not in _IGNORED_PARAMS}
+    body = json.dumps({"params": clean, "response": response}).encode()
+    try:
+        _write_gz(os.path.join(root, "serp", serp_key(params) + ".json.gz"), body)
+    except OSError as e:
+        print("Cassette write ERROR:", e)
+
+def record_image(url: str, data: bytes, root: Optional[str] = None) -> None:
+    root = root or SERP_RECORD_DIR
+    if not root or not url or not data:
+        return
+    try:
+        _write_gz(os.path.join(root, "images", image_key(url) + ".bin.gz"), data)
+    except OSError as e:
+        print("Cassette write ERROR:", e)
+
+def load_serp(root: str, key: str) -> Optional[dict]:
+    path = os.path.join(root, "serp", key + ".json.gz")
+    if not os.path.exists(path):
+        return None
+    with gzip.open(path, "rb") as f:
+        return json.loads(f.read())
+
+def load_image(root: str, key: str) -> Optional[bytes]:
+    path = os.path.join(root, "images", key + ".bin.gz")
+    if not os.path.exists(path):
+        return None
+    with gzip.open(path, "rb") as f:
+        return f.read()
+
+def iter_serp(root: str):
+    """Yield every recorded {"params", "response"} entry."""
+    d = os.path.join(root, "serp")
+    if not os.path.isdir(d):
+        return
+    for name in sorted(os.listdir(d)):
+        if name.endswith(".json.gz"):
+            with gzip.open(os.path.join(d, name), "rb") as f:
+                yield json.loads(f.read())
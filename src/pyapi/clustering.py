@@ -0,0 +1,81 @@
+import os
+from typing import Dict, List, Optional
+from rapidfuzz import fuzz, process
+
+# Near-duplicate clustering of Amazon items before indexing
+#
+# Category scrapes return color variants and relistings with almost the
+# same title. The indexer sends one Google Shopping query per cluster (the
+# leader's) and scores that shared offer list against every member.
+#
+# An item joins a cluster when, compared with the cluster's leader:
+#   - brand matches (case-insensitive; missing brand only matches missing)
+#   - title_norm token_set_ratio >= CLUSTER_TITLE_SIM
+#   - unit_mode and units are equal (12 oz vs 24 oz stay separate queries)
+#   - thumbnail pHashes are within CLUSTER_PHASH_DIST bits; without both
+#     pHashes the title must reach CLUSTER_TITLE_SIM_NO_IMAGE instead
+
+INDEX_CLUSTERING = os.getenv("INDEX_CLUSTERING", "1") == "1"
+CLUSTER_TITLE_SIM = float(os.getenv("CLUSTER_TITLE_SIM", "90"))
+CLUSTER_TITLE_SIM_NO_IMAGE = float(os.getenv("CLUSTER_TITLE_SIM_NO_IMAGE", "96"))
+CLUSTER_PHASH_DIST = int(os.getenv("CLUSTER_PHASH_DIST", "8"))
+
+def phash_int(features: Optional[dict]) -> Optional[int]:
+    """Stored 64-bit pHash hex (utils.build_features) as an int."""
+    value = (features or {}).get("phash")
+    if not value:
+        return None
+    try:
+        return int(value, 16)
+    except ValueError:
+        return None
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+def _same_units(a: dict, b: dict) -> bool:
+    return a.get("unit_mode") == b.get("unit_mode") and a.get("units") == b.get("units")
+
+def cluster_items(items: List[dict]) -> List[List[dict]]:
+    """
+    Greedy leader clustering of Amazon docs (with `features`). Keeps input
+    order: clusters are ordered by their leader, leader first.
+    """
+    clusters: List[List[dict]] = []
+    # brand -> (leader title_norms, cluster indexes), parallel lists
+    leaders: Dict[str, tuple] = {}
+
+    for item in items:
+        f = item.get("features") or {}
+        title = f.get("title_norm") or ""
+        brand = (item.get("brand") or "").strip().lower()
+        titles, idxs = leaders.setdefault(brand, ([], []))
+
+        target = None
+        if title and titles:
+            ph = phash_int(f)
+            for _, score, j in process.extract(
+                title, titles, scorer=fuzz.token_set_ratio,
+                score_cutoff=CLUSTER_TITLE_SIM, limit=5,
+            ):
+                lf = clusters[idxs[j]][0].get("features") or {}
+                if not _same_units(f, lf):
+                    continue
+                lph = phash_int(lf)
+                if ph is not None and lph is not None:
+                    if hamming(ph, lph) > CLUSTER_PHASH_DIST:
+                        continue
+                elif score < CLUSTER_TITLE_SIM_NO_IMAGE:
+                    continue
+                target = idxs[j]
+                break
+
+        if target is None:
+            if title:
+                titles.append(title)
+                idxs.append(len(clusters))
+            clusters.append([item])
+        else:
+            clusters[target].append(item)
+
+    return clusters
@@ -0,0 +1,134 @@
+import os
+from typing import Optional
+from utils import now_utc
+
+# Materialized deals view
+#
+# One row per eligible MATCH doc across all categories:
+#   {_id: "<match_coll>:<asin>", match_coll, asin, savings, savings_pct,
+#    amazon, offers, updatedAt}
+#
+# The indexer calls sync_deal() after every MATCH write, so reads are an
+# indexed range scan on (match_coll, savings desc, asin asc) instead of
+# re-checking eligibility on raw MATCH docs. rebuild_deals() recomputes a
+# category from MATCH and reports any drift.
+#
+# Categories indexed before the view existed have no rows: rebuild_deals()
+# records {_id: match_coll, builtAt} in DEALS_STATE_COLL, and readers build
+# the view once for categories without that marker (deals_built()).
+
+DEALS_COLL = os.getenv("DEALS_COLL", "deals")
+DEALS_STATE_COLL = os.getenv("DEALS_STATE_COLL", "deals_state")
+
+# Same eligibility the dashboard always applied
+MIN_SAVINGS_ABS = 2.0
+MIN_SAVINGS_PCT = 0.05
+
+DEAL_SORT = [("savings", -1), ("asin", 1)]
+
+async def ensure_deals_indexes(db) -> None:
+    coll = db[DEALS_COLL]
+    # /deals/google and each /deals/feed source
+    await coll.create_index([("match_coll", 1), ("savings", -1), ("asin", 1)])
+
+def deal_from_match(m: dict) -> Optional[dict]:
+    """
+    Shape a MATCH doc into a dashboard deal, or None if it fails the
+    final savings filters (>= $2 and >= 5% vs the top offer).
+    """
+    amz = m.get("amazon")
+    offers = m.get("offers") or m.get("best_deals") or []
+
+    if not m.get("match_found") or not amz or not offers:
+        return None
+
+    amz_price = float(amz["price"])
+    other_price = float(offers[0]["price"])
+
+    # Require meaningful savings
+    savings_abs = amz_price - other_price
+    if savings_abs < MIN_SAVINGS_ABS:
+        return None
+
+    pct = savings_abs / amz_price
+    if pct < MIN_SAVINGS_PCT:
+        return None
+
+    return {
+        "amazon": amz,
+        "offers": offers,
+        "savings": savings_abs,
+        "savings_pct": pct,
+    }
+
+def _row_id(match_coll: str, asin: str) -> str:
+    return f"{match_coll}:{asin}"
+
+def _asin(match_doc: dict) -> Optional[str]:
+    return (match_doc.get("amazon") or {}).get("asin") or match_doc.get("key_val")
+
+async def _write_deal(db, match_coll: str, asin: str, deal: Optional[dict]) -> None:
+    if deal is None:
+        await db[DEALS_COLL].delete_one({"_id": _row_id(match_coll, asin)})
+        return
+    await db[DEALS_COLL].update_one(
+        {"_id": _row_id(match_coll, asin)},
+        {"$set": {**deal, "match_coll": match_coll, "asin": asin, "updatedAt": now_utc()}},
+        upsert=True,
+    )
+
+async def sync_deal(db, match_coll: str, match_doc: dict) -> bool:
+    """Upsert or remove the deal row for one MATCH doc; True if it's a deal."""
+    asin = _asin(match_doc)
+    if not asin:
+        return False
+    deal = deal_from_match(match_doc)
+    await _write_deal(db, match_coll, asin, deal)
+    return deal is not None
+
+async def clear_deals(db, match_coll: str) -> int:
+    res = await db[DEALS_COLL].delete_many({"match_coll": match_coll})
+    return res.deleted_count
+
+async def deals_built(db, match_coll: str) -> bool:
+    """True once rebuild_deals() has run for the category."""
+    return await db[DEALS_STATE_COLL].find_one({"_id": match_coll}, {"_id": 1}) is not None
+
+async def rebuild_deals(db, match_coll: str) -> dict:
+    """
+    Recompute every deal row of one category from its MATCH collection.
+
+    - `drifted`: rows that existed with different savings / offers
+    - `missing`: deals that had no row
+    - `stale`: rows whose MATCH doc is gone or no longer a deal
+    All three are 0 when the view was consistent.
+    """
+    existing = {
+        r["asin"]: r
+        async for r in db[DEALS_COLL].find(
+            {"match_coll": match_coll}, {"asin": 1, "savings": 1, "offers": 1},
+        )
+    }
+
+    deals = drifted = missing = 0
+    projection = {"_id": 0, "key_val": 1, "match_found": 1, "amazon": 1, "offers": 1, "best_deals": 1}
+    async for m in db[match_coll].find({"match_found": True}, projection):
+        asin = _asin(m)
+        deal = deal_from_match(m)
+        if not asin or deal is None:
+            continue
+        deals += 1
+        old = existing.pop(asin, None)
+        if old is None:
+            missing += 1
+        elif old.get("savings") != deal["savings"] or old.get("offers") != deal["offers"]:
+            drifted += 1
+        await _write_deal(db, match_coll, asin, deal)
+
+    for asin in existing:
+        await db[DEALS_COLL].delete_one({"_id": _row_id(match_coll, asin)})
+
+    await db[DEALS_STATE_COLL].update_one(
+        {"_id": match_coll}, {"$set": {"builtAt": now_utc()}}, upsert=True,
+    )
+    return {"deals": deals, "drifted": drifted, "missing": missing, "stale": len(existing)}
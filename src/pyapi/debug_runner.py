@@ -1,5 +1,5 @@
 """
-Fully working Debug Runner for the Walmart/Amazon API
+Fully working Debug Runner for the Amazon Deals API
 
 - No MongoDB required
 - No SerpAPI key required
@@ -15,10 +15,9 @@ from fastapi.testclient import TestClient
 
 
 # ---------------------------------------------------------------------
-# 1. Inject fake environment variables BEFORE importing main.py
+# 1. Fake SerpAPI key (Mongo is only connected in main's lifespan, which
+#    this runner never starts, so no MONGO_URL is needed)
 # ---------------------------------------------------------------------
-os.environ["MONGO_URL"] = "mongodb://debug-mock"
-os.environ["MONGO_DB"] = "MongoDB"
 os.environ["SERPAPI_KEY"] = "DEBUG_FAKE_KEY"
 
 
@@ -32,75 +31,112 @@ class MockMotorCursor:
         self._limit = None
 
     def sort(self, fields):
-        # fields example: [("updatedAt", -1)]
-        field, direction = fields[0]
-        reverse = direction == -1
-        self.docs.sort(key=lambda d: d.get(field), reverse=reverse)
+        # fields example: [("savings", -1), ("asin", 1)]; stable sorts,
+        # least significant key first
+        for field, direction in reversed(fields):
+            self.docs.sort(key=lambda d: d.get(field), reverse=direction == -1)
         return self
 
     def limit(self, n):
         self._limit = n
         return self
 
+    def batch_size(self, n):
+        return self
+
     async def to_list(self, length):
         if self._limit is not None:
             return self.docs[: self._limit]
         return self.docs[: length]
 
+    def __aiter__(self):
+        return self._iter()
+
+    async def _iter(self):
+        docs = self.docs if self._limit is None else self.docs[: self._limit]
+        for d in docs:
+            yield d
+
+
+_RANGE_OPS = {
+    "$lt": lambda a, b: a is not None and a < b,
+    "$lte": lambda a, b: a is not None and a <= b,
+    "$gt": lambda a, b: a is not None and a > b,
+    "$gte": lambda a, b: a is not None and a >= b,
+    "$in": lambda a, b: a in b,
+}
+
+def _matches(doc, query):
+    """Subset of Mongo query semantics: equality, $or, ranges, $in, $exists, $regex."""
+    import re
+    for k, v in query.items():
+        if k == "$or":
+            if not any(_matches(doc, q) for q in v):
+                return False
+        elif isinstance(v, dict):
+            for op, arg in v.items():
+                if op == "$exists":
+                    if (k in doc) != bool(arg):
+                        return False
+                elif op == "$regex":
+                    if not re.search(arg, doc.get(k) or "", re.I):
+                        return False
+                elif op in _RANGE_OPS and not _RANGE_OPS[op](doc.get(k), arg):
+                    return False
+        elif doc.get(k) != v:
+            return False
+    return True
+
 
 class MockCollection:
-    def __init__(self):
+    def __init__(self, name=""):
+        self.name = name
         self.docs = {}
 
+    async def create_index(self, keys, **kwargs):
+        return str(keys)
+
     async def update_one(self, filter, update, upsert=False):
-        key = filter.get("product_id") or filter.get("key_val")
+        key = (filter.get("product_id") or filter.get("key_val") or filter.get("asin")
+               or filter.get("match_coll") or filter.get("_id"))
         if key is None:
             return
 
         base = self.docs.get(key, {})
+        if "_id" in filter:
+            base.setdefault("_id", filter["_id"])
 
         if "$set" in update:
             base.update(update["$set"])
 
+        for k, n in update.get("$inc", {}).items():
+            base[k] = base.get(k, 0) + n
+
         if "$setOnInsert" in update and key not in self.docs:
             base.update(update["$setOnInsert"])
 
         self.docs[key] = base
 
+    async def insert_many(self, docs, ordered=True):
+        for d in docs:
+            self.docs[id(d)] = d
+
     async def find_one(self, query, projection=None):
-        key = query.get("product_id") or query.get("key_val")
+        key = (query.get("product_id") or query.get("key_val") or query.get("asin")
+               or query.get("_id"))
         return self.docs.get(key)
 
-    def find(self, match=None, projection=None):
-        results = []
-
-        for doc in self.docs.values():
-            ok = True
-
-            if match:
-                for k, v in match.items():
-
-                    if isinstance(v, dict) and "$exists" in v:
-                        if v["$exists"] and k not in doc:
-                            ok = False
-
-                    elif isinstance(v, dict) and "$regex" in v:
-                        import re
-                        if not re.search(v["$regex"], doc.get(k, ""), re.I):
-                            ok = False
+    def find(self, match=None, projection=None, **kwargs):
+        return MockMotorCursor(d for d in self.docs.values() if _matches(d, match or {}))
 
-                    elif isinstance(v, dict):
-                        # other dict operators unsupported in mock
-                        pass
+    def aggregate(self, pipeline, **kwargs):
+        # Pipelines are not evaluated by the mock
+        return MockMotorCursor([])
 
-                    else:
-                        if doc.get(k) != v:
-                            ok = False
-
-            if ok:
-                results.append(doc)
-
-        return MockMotorCursor(results)
+    async def delete_one(self, match):
+        key = match.get("_id") or match.get("key_val") or match.get("asin")
+        existed = self.docs.pop(key, None) is not None
+        return MagicMock(deleted_count=int(existed))
 
     async def delete_many(self, match):
         count = len(self.docs)
@@ -114,9 +150,21 @@ class MockDB:
 
     def __getitem__(self, name):
         if name not in self._collections:
-            self._collections[name] = MockCollection()
+            self._collections[name] = MockCollection(name)
         return self._collections[name]
 
+    async def list_collections(self, filter=None, **kwargs):
+        name = (filter or {}).get("name")
+        infos = [
+            {"name": n, "type": getattr(c, "type", "collection")}
+            for n, c in self._collections.items() if name in (None, n)
+        ]
+        return MockMotorCursor(infos)
+
+    async def create_collection(self, name, timeseries=None, **kwargs):
+        self[name].type = "timeseries" if timeseries else "collection"
+        return self[name]
+
 
 # ---------------------------------------------------------------------
 # 3. Create mock DB BEFORE importing main.py
@@ -131,6 +179,11 @@ mock_db = MockDB()
 import importlib
 main = importlib.import_module("main")
 main.db = mock_db
+main.bulk_db = mock_db
+main.DEALS_READ = mock_db[main.DEALS_COLL]
+main.CATEGORIES = mock_db["categories"]
+main.scheduler = main.RefreshScheduler(mock_db, main.CATEGORIES, main._refresh_items)
+importlib.import_module("cache").init_shared_cache(mock_db)
 app = main.app
 
 
@@ -223,10 +276,15 @@ def dump(title, data):
 # ---------------------------------------------------------------------
 client = TestClient(app)
 
+async def no_image(url):
+    return None
+
+
 async def run_tests():
-    with patch("main.serp_get", side_effect=serp_mock):
+    with patch("services.serp_get", side_effect=serp_mock), \
+         patch("utils.fetch_image_bytes", side_effect=no_image):
 
-        # ---- Test 1: extension/find-walmart-deal ----
+        # ---- Test 1: extension/find-deals ----
         payload = {
             "asin": "B00XYZ",
             "title": "Logitech M510 Wireless Mouse",
@@ -234,45 +292,81 @@ async def run_tests():
             "brand": "Logitech",
             "thumbnail": "https://mock_thumb",
         }
-        resp = client.post("/extension/find-walmart-deal", json=payload)
-        dump("extension/find-walmart-deal", resp.json())
-
-        # ---- Test 2: extension/find-deals-by-image ----
-        payload2 = {
-            "title": "Logitech Wireless Mouse",
-            "price": 29.99,
-            "brand": "Logitech",
-            "image_url": "https://fake.com/image.png",
-            "thumbnail": "https://mock_thumb",
-        }
-        resp = client.post("/extension/find-deals-by-image", json=payload2)
-        dump("extension/find-deals-by-image", resp.json())
+        resp = client.post("/extension/find-deals", json=payload)
+        dump("extension/find-deals", resp.json())
 
-        # ---- Test 3: walmart/scrape ----
+        # ---- Test 2: amazon/scrape-category ----
         scrape_body = {"query": "logitech mouse", "pages": 1, "max_products": 10}
-        resp = client.post("/walmart/scrape?wm_coll=wm_test", json=scrape_body)
-        dump("walmart/scrape", resp.json())
-
-        # ---- Test 4: amazon/index-by-title ----
-        index_req = {
-            "limit_items": 10,
-            "recache_hours": 48,
-            "max_serp_calls": 10,
-            "min_similarity": 80,
-            "require_brand": True,
-        }
+        resp = client.post("/amazon/scrape-category?amz_coll=amz_test", json=scrape_body)
+        dump("amazon/scrape-category", resp.json())
+
+        # ---- Test 3: google-shopping/index-by-title ----
         resp = client.post(
-            "/amazon/index-by-title?wm_coll=wm_test&amz_coll=amz_test",
-            json=index_req,
+            "/google-shopping/index-by-title"
+            "?amz_coll=amz_test&match_coll=match_test&per_call_delay_ms=0"
         )
-        dump("amazon/index-by-title", resp.json())
-
-        # ---- Test 5: deals/by-title ----
-        resp = client.get("/deals/by-title?wm_coll=wm_test&amz_coll=amz_test")
-        dump("deals/by-title", resp.json())
-
-        # ---- Test 6: debug/clear-category ----
-        resp = client.delete("/debug/clear-category?wm_coll=wm_test&amz_coll=amz_test")
+        dump("google-shopping/index-by-title", resp.json())
+        resp = client.post("/google-shopping/index-by-title?amz_coll=amz_test&match_coll=match_test&top_k=0")
+        print(f"🔍 index-by-title top_k=0 -> {resp.status_code}")
+
+        # ---- Test 4: deals/google ----
+        resp = client.get("/deals/google?match_coll=match_test")
+        dump("deals/google", resp.json())
+
+        # Unchanged collection: conditional poll gets a 304
+        etag = resp.headers.get("etag")
+        resp = client.get("/deals/google?match_coll=match_test", headers={"If-None-Match": etag})
+        print(f"\n🔍 deals/google If-None-Match -> {resp.status_code}")
+
+        # ---- Test 4: refresh scheduler round ----
+        client.put("/categories?match_coll=match_test&amz_coll=amz_test&query=mouse")
+        resp = client.post("/scheduler/run-once")
+        dump("scheduler/run-once", resp.json())
+        resp = client.get("/scheduler/status")
+        dump("scheduler/status", resp.json())
+
+        # ---- Test 4a: rescore from stored raw offers (no SerpAPI) ----
+        resp = client.post("/matches/rescore?match_coll=match_test&amz_coll=amz_test")
+        dump("matches/rescore", resp.json())
+
+        # ---- Test 4b: deals view consistency check ----
+        resp = client.post("/deals/rebuild?match_coll=match_test")
+        dump("deals/rebuild", resp.json())
+
+        # ---- Test 4c: deals feed keyset paging vs. brute force ----
+        rows = [
+            {"match_coll": c, "asin": f"{c}-{i}", "savings": float(i % 4),
+             "amazon": {"asin": f"{c}-{i}"}, "offers": []}
+            for c in ("feed_a", "feed_b", "feed_c") for i in range(9)
+        ]
+        deals_coll = mock_db[main.DEALS_COLL]
+        for r in rows:
+            deals_coll.docs[f"{r['match_coll']}:{r['asin']}"] = dict(r)
+        main._deals_views_built.update({"feed_a", "feed_b", "feed_c"})
+
+        expected = [
+            (r["match_coll"], r["asin"])
+            for r in sorted(rows, key=lambda r: (-r["savings"], r["match_coll"], r["asin"]))
+        ]
+        paged, cursor = [], None
+        while True:
+            url = "/deals/feed?match_coll=feed_a&match_coll=feed_b&match_coll=feed_c&limit=5"
+            page = client.get(url + (f"&cursor={cursor}" if cursor else "")).json()
+            paged += [(d["match_coll"], d["amazon"]["asin"]) for d in page["deals"]]
+            cursor = page["next"]
+            if not cursor:
+                break
+        print(f"\n🔍 deals/feed paging matches brute force: {paged == expected} ({len(paged)} rows)")
+
+        import base64
+        bad = [base64.urlsafe_b64encode(t).decode() for t in (b"[1, 2]", b'{"s": 1}', b'{"s": "x", "c": "a", "a": "b"}')]
+        codes = [client.get(f"/deals/feed?match_coll=feed_a&cursor={t}").status_code for t in bad + ["%%%"]]
+        print(f"🔍 deals/feed malformed cursors -> {codes}")
+        for r in rows:
+            deals_coll.docs.pop(f"{r['match_coll']}:{r['asin']}", None)
+
+        # ---- Test 5: debug/clear-category ----
+        resp = client.delete("/debug/clear-category?amz_coll=amz_test&match_coll=match_test")
         dump("debug/clear-category", resp.json())
 
 
@@ -0,0 +1,112 @@
+import os, time, uuid, socket, asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+
+# Lease-based job ownership across workers/containers
+#
+# A lease is a doc in JOB_LEASES_COLL: {_id: job_id, owner, token, expiresAt}.
+# Whoever holds an unexpired lease owns the job; the holder renews it every
+# ttl/3 while running. A crashed worker's lease simply expires.
+#
+# Renew and release match on `token`, random per acquisition, not on the
+# worker: a job that re-acquires after losing its lease (while the old task
+# is still unwinding) must not be renewed or released by the old Lease.
+#
+# A failed renewal is retried every few seconds; once a full ttl has passed
+# without one, or the lease doc isn't ours any more, `lease.lost` is set.
+# Long jobs check it between items and stop.
+
+JOB_LEASES_COLL = os.getenv("JOB_LEASES_COLL", "job_leases")
+JOB_LEASE_TTL_S = float(os.getenv("JOB_LEASE_TTL_S", "60"))
+JOB_LEASE_RETRY_S = 2.0
+
+# Unique per process (uvicorn --workers N forks N of these)
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+async def ensure_job_indexes(db) -> None:
+    # Expired leases are also handled in acquire(); TTL just keeps it tidy
+    await db[JOB_LEASES_COLL].create_index("expiresAt", expireAfterSeconds=3600)
+
+class Lease:
+    def __init__(self, db, job_id: str, ttl_s: float = JOB_LEASE_TTL_S):
+        self.coll = db[JOB_LEASES_COLL]
+        self.job_id = job_id
+        self.ttl_s = ttl_s
+        self.held = False
+        self.lost = False
+        self.token = None
+        self._renewer = None
+
+    async def acquire(self) -> bool:
+        """Take the lease if free or expired. False if someone else holds it."""
+        from pymongo.errors import DuplicateKeyError
+
+        now = _now()
+        self.token = uuid.uuid4().hex
+        try:
+            await self.coll.update_one(
+                {"_id": self.job_id, "expiresAt": {"$lte": now}},
+                {"$set": {
+                    "owner": WORKER_ID,
+                    "token": self.token,
+                    "expiresAt": now + timedelta(seconds=self.ttl_s),
+                    "acquiredAt": now,
+                }},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            # Unexpired lease exists (the upsert collided with it)
+            return False
+
+        self.held = True
+        self._renewer = asyncio.create_task(self._renew_loop())
+        return True
+
+    async def _renew_loop(self):
+        renewed = time.monotonic()
+        delay = self.ttl_s / 3
+        while True:
+            await asyncio.sleep(delay)
+            try:
+                res = await self.coll.update_one(
+                    {"_id": self.job_id, "token": self.token},
+                    {"$set": {"expiresAt": _now() + timedelta(seconds=self.ttl_s)}},
+                )
+            except Exception as e:
+                print(f"Lease renew ERROR for job {self.job_id}:", e)
+                if time.monotonic() - renewed >= self.ttl_s:
+                    # Expired meanwhile: another worker may own the job now
+                    self.lost = True
+                    print(f"Lease LOST for job {self.job_id}")
+                    return
+                delay = min(JOB_LEASE_RETRY_S, self.ttl_s / 3)
+                continue
+            if res.matched_count == 0:
+                self.lost = True
+                print(f"Lease LOST for job {self.job_id}")
+                return
+            renewed = time.monotonic()
+            delay = self.ttl_s / 3
+
+    async def release(self) -> None:
+        if self._renewer:
+            self._renewer.cancel()
+        if self.held:
+            await self.coll.delete_one({"_id": self.job_id, "token": self.token})
+            self.held = False
+
+@asynccontextmanager
+async def job_lease(db, job_id: str, ttl_s: float = JOB_LEASE_TTL_S):
+    """
+    async with job_lease(db, "index:match_x") as lease:
+        if not lease.held: ...someone else is running it...
+    """
+    lease = Lease(db, job_id, ttl_s)
+    await lease.acquire()
+    try:
+        yield lease
+    finally:
+        await lease.release()
@@ -1,16 +1,202 @@
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import FastAPI, HTTPException, Query, Request, Header
 from fastapi.middleware.cors import CORSMiddleware
-from typing import Optional
-from motor.motor_asyncio import AsyncIOMotorClient
-import asyncio, os, re, random
+from fastapi.responses import PlainTextResponse
+from typing import Optional, List
+from contextlib import asynccontextmanager, AsyncExitStack
+import asyncio, os, random, json, base64, time
+from datetime import timedelta
 # Internal imports
 from models import AmazonScrapeReq, ExtensionFullProduct
-from services import amazon_search_page, provider_google_shopping, provider_google_search
-from utils import now_utc, parse_price, _score_offers_for_extension
+from metrics import (
+    timed, timed_async, start_request_timings, server_timing_header,
+    render_prometheus, REQUEST_SECONDS, SERVER_TIMING, DEALS_READ_FALLBACK,
+)
+from profiling import (
+    token_ok, profile_sampling, profile_cprofile, pstats_text,
+    cprofile_session, ProfilerBusy, LoopLagMonitor, LOOP_MONITOR,
+)
+from cache import (
+    init_shared_cache, ensure_cache_indexes, collection_version, bump_collection_version,
+    COLLECTION_VERSIONS_COLL,
+)
+from deals_view import (
+    DEALS_COLL, DEAL_SORT, ensure_deals_indexes, sync_deal, clear_deals, rebuild_deals,
+    deals_built,
+)
+from price_history import (
+    AMAZON_SRC, BUCKET_UNITS, PRICE_HISTORY_COLL, PriceRecorder, ensure_price_history,
+    history_pipeline, drops_pipeline,
+)
+from quota import (
+    SerpBudgetExceeded, init_quota, ensure_quota_indexes, set_serp_endpoint, set_serp_job,
+    record_saved, usage_report,
+)
+from phash_index import MAX_DISTANCE, ensure_phash_index, index_phash, near_phashes
+from clustering import INDEX_CLUSTERING, cluster_items
+from scheduler import SCHEDULER, RefreshScheduler, ensure_scheduler_indexes, note_lookup
+from raw_offers import RAW_OFFERS_VERSION, compress_offers, decompress_offers
+from responses import FastJSONResponse, CompressionMiddleware, conditional_json
+from offload import run_blocking
+from jobs import job_lease, ensure_job_indexes
+from scoring_backend import get_scoring_backend
+from services import (
+    amazon_search_page, provider_google_shopping,
+    PRERESOLVE_TOP_N, resolve_merchant_url_cached, preresolve_merchant_url,
+)
+from utils import (
+    now_utc, parse_price, _score_offers_for_extension,
+    build_features, features_current, analyze_title, merge_sorted_desc,
+    image_stack, PHASH_CACHE,
+)
 
 # App + Environment Setup
 SERPAPI_KEY = os.getenv("SERPAPI_KEY")
-app = FastAPI(title="Amazon Deals")
+
+# MongoDB Setup (clients are created in lifespan(), not at import time)
+# Two client profiles (mongo.py): `db` for requests, leases and caches,
+# `bulk_db` for scrape / index / backfill / rescore writes
+MONGO_URL = os.getenv("MONGO_URL")
+MONGO_DB = os.getenv("MONGO_DB", "MongoDB")
+client = None
+db = None
+bulk_client = None
+bulk_db = None
+
+# Deals view handle for /deals/google and /deals/feed. With secondary reads
+# configured (DEALS_READ_PREFERENCE), DEALS_VERSIONS_READ reads the version
+# markers with the same preference (see _deals_source)
+DEALS_READ = None
+DEALS_VERSIONS_READ = None
+
+# Category registry: one doc per category {match_coll, amz_coll, query}
+CATEGORIES = None
+
+# Boot-time Mongo work is spread over this window so N workers starting
+# together don't all hit Mongo at once
+STARTUP_JITTER_S = float(os.getenv("STARTUP_JITTER_S", "3"))
+
+# Optional warm-up before /ready reports ready: preconnect, regex/LRU
+# warm-up, image stack import, scoring pool spin-up, cache preload
+WARMUP = os.getenv("WARMUP", "1") == "1"
+WARMUP_PRELOAD = int(os.getenv("WARMUP_PRELOAD", "5000"))
+
+# Readiness state (see /ready)
+READY = {"ready": False, "warmup": None}
+
+# Event-loop lag monitor (warns with the blocking stack on stalls)
+loop_monitor = LoopLagMonitor()
+
+# Priority refresh scheduler (created in lifespan(); runs when SCHEDULER=1)
+scheduler = None
+SCHEDULER_CALL_DELAY_MS = int(os.getenv("SCHEDULER_CALL_DELAY_MS", "250"))
+
+async def _ensure_indexes():
+    await asyncio.sleep(random.uniform(0, STARTUP_JITTER_S))
+    try:
+        await ensure_cache_indexes(db)
+        await ensure_job_indexes(db)
+        await ensure_deals_indexes(db)
+        await ensure_price_history(db)
+        await ensure_scheduler_indexes(db)
+        await ensure_quota_indexes(db)
+        await ensure_phash_index(db)
+    except Exception as e:
+        print("Startup index ERROR:", e)
+
+async def _build_deals_views():
+    """Build the deals view of registered categories indexed before it existed."""
+    await asyncio.sleep(random.uniform(0, STARTUP_JITTER_S))
+    try:
+        async for c in CATEGORIES.find({}, {"_id": 0, "match_coll": 1}):
+            if c.get("match_coll"):
+                await _ensure_deals_view(c["match_coll"])
+    except Exception as e:
+        print("Deals view backfill ERROR:", e)
+
+async def _warmup():
+    """Pay first-request costs up front; /ready flips when done."""
+    await asyncio.sleep(random.uniform(0, STARTUP_JITTER_S))
+    steps = {}
+
+    async def step(name, coro_fn):
+        t0 = time.perf_counter()
+        try:
+            await coro_fn()
+        except Exception as e:
+            print(f"Warm-up step {name} ERROR:", e)
+        steps[name] = round((time.perf_counter() - t0) * 1000.0, 1)
+
+    async def warm_titles():
+        for t in ("Logitech M510 Wireless Mouse", "Coffee 12 oz Pack of 2", "Vitamin D3 100 ct 2 x 8"):
+            analyze_title(t)
+
+    await step("mongo_ping", lambda: client.admin.command("ping"))
+    await step("titles", warm_titles)
+    await step("image_stack", lambda: run_blocking(image_stack))
+    await step("scoring_backend", lambda: get_scoring_backend().warm())
+    await step("phash_preload", lambda: PHASH_CACHE.preload(WARMUP_PRELOAD))
+
+    READY["warmup"] = steps
+    READY["ready"] = True
+    print("Warm-up done (ms):", steps)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Startup: Mongo client, shared cache, loop monitor, scoring backend,
+    background index creation and (optionally) warm-up.
+    Shutdown: stop all of it.
+    """
+    global client, db, bulk_client, bulk_db, DEALS_READ, DEALS_VERSIONS_READ, CATEGORIES, scheduler
+
+    if not MONGO_URL:
+        raise RuntimeError("MONGO_URL env var is required")
+
+    # Imported here: pymongo/motor are a noticeable slice of import time
+    from mongo import create_client, deals_read_preference
+
+    client = create_client(MONGO_URL, "user")
+    db = client[MONGO_DB]
+    bulk_client = create_client(MONGO_URL, "bulk")
+    bulk_db = bulk_client[MONGO_DB]
+    CATEGORIES = db["categories"]
+
+    read_pref = deals_read_preference()
+    if read_pref is None:
+        DEALS_READ = db[DEALS_COLL]
+    else:
+        DEALS_READ = db.get_collection(DEALS_COLL, read_preference=read_pref)
+        DEALS_VERSIONS_READ = db.get_collection(COLLECTION_VERSIONS_COLL, read_preference=read_pref)
+
+    # Caches shared by all uvicorn workers go through Mongo (see cache.py)
+    init_shared_cache(db)
+    init_quota(db)
+
+    if LOOP_MONITOR:
+        loop_monitor.start()
+
+    scheduler = RefreshScheduler(db, CATEGORIES, _refresh_items)
+    if SCHEDULER:
+        scheduler.start()
+
+    # Background so the worker starts serving immediately
+    background = [asyncio.create_task(_ensure_indexes()), asyncio.create_task(_build_deals_views())]
+    if WARMUP:
+        background.append(asyncio.create_task(_warmup()))
+    else:
+        READY["ready"] = True
+
+    yield
+
+    for task in background:
+        task.cancel()
+    loop_monitor.stop()
+    scheduler.stop()
+    get_scoring_backend().shutdown()
+    bulk_client.close()
+    client.close()
+
+app = FastAPI(title="Amazon Deals", lifespan=lifespan, default_response_class=FastJSONResponse)
 # Allow frontend to communicate freely (Chrome extension + dashboard)
 app.add_middleware(
     CORSMiddleware,
@@ -20,27 +206,66 @@ app.add_middleware(
     allow_headers=["*"],
     expose_headers=["*"],
 )
+# gzip / br for large JSON bodies (deal lists are hundreds of KB)
+app.add_middleware(CompressionMiddleware)
+
+# Request timing: latency histogram per route + optional Server-Timing header
+@app.middleware("http")
+async def request_metrics(request: Request, call_next):
+    timings = start_request_timings()
+    set_serp_endpoint(request.url.path)
+    t0 = time.perf_counter()
+
+    # Single-request profiling: "X-Profile: 1" + valid "X-Debug-Token"
+    # returns pstats text instead of the normal body. Note cProfile covers
+    # the whole loop thread, so concurrent requests show up too, and only
+    # one cProfile session runs at a time (409 otherwise).
+    if request.headers.get("x-profile") and token_ok(request.headers.get("x-debug-token")):
+        try:
+            with cprofile_session() as prof:
+                response = await call_next(request)
+        except ProfilerBusy as e:
+            return PlainTextResponse(str(e), status_code=409)
+        return PlainTextResponse(
+            pstats_text(prof),
+            headers={"X-Profiled-Status": str(response.status_code)},
+        )
 
-# MongoDB Setup
-MONGO_URL = os.getenv("MONGO_URL")
-MONGO_DB = os.getenv("MONGO_DB", "MongoDB")
-if not MONGO_URL:
-    raise RuntimeError("MONGO_URL env var is required")
-client = AsyncIOMotorClient(MONGO_URL)
-db = client[MONGO_DB]
+    response = await call_next(request)
+    elapsed = time.perf_counter() - t0
+
+    route = request.scope.get("route")
+    path = getattr(route, "path", "unmatched")
+    REQUEST_SECONDS.observe(elapsed, method=request.method, path=path, status=response.status_code)
+
+    if SERVER_TIMING:
+        timings["total"] = elapsed * 1000.0
+        response.headers["Server-Timing"] = server_timing_header(timings)
+    return response
+
+# Readiness (for container autoscaling / load balancer checks)
+@app.get("/ready")
+async def ready():
+    """200 once clients exist and warm-up finished, 503 before that."""
+    if not READY["ready"]:
+        raise HTTPException(503, "warming up")
+    return READY
 
 # Chrome Extension: Find Deals (core deal-finding logic)
 @app.post("/extension/find-deals")
-async def extension_find_deals(payload: ExtensionFullProduct):
+async def extension_find_deals(
+    payload: ExtensionFullProduct,
+    top_k: int = Query(5, ge=1, le=50),
+):
     """
-    Chrome extension calls this to fetch the top 5 deals
-    for a given Amazon product.
+    Chrome extension calls this to fetch the top `top_k` (default 5)
+    deals for a given Amazon product.
 
     Flow:
     1. Build a Google Shopping query ("brand title")
     2. Fetch Google Shopping results
     3. Run our full scoring engine (text similarity, image similarity, units)
-    4. Return best 5 deals
+    4. Return best `top_k` deals
     """
 
     if not SERPAPI_KEY:
@@ -49,6 +274,9 @@ async def extension_find_deals(payload: ExtensionFullProduct):
     if not payload.title or not payload.price:
         raise HTTPException(400, "Missing title or price")
 
+    # Popularity signal for the refresh scheduler
+    note_lookup(db, payload.asin)
+
     query = f"{payload.brand} {payload.title}" if payload.brand else payload.title
 
     # Fetch Google Shopping offers
@@ -58,7 +286,13 @@ async def extension_find_deals(payload: ExtensionFullProduct):
         print("Google Shopping ERROR:", e)
         gshop_offers = []
 
-    return await _score_offers_for_extension(payload, gshop_offers)
+    scored = await _score_offers_for_extension(payload, gshop_offers, top_k=top_k)
+
+    # Warm the merchant URL cache so SAVE on these deals is instant
+    for d in scored.best_deals[:PRERESOLVE_TOP_N]:
+        preresolve_merchant_url(d.offer.source_domain, d.offer.title, d.offer.price)
+
+    return FastJSONResponse(scored.to_dict())
 
 # Chrome Extension: Resolve merchant URL (used when saving a product)
 @app.post("/extension/resolve-merchant-url")
@@ -75,7 +309,9 @@ async def resolve_merchant_url(data: dict):
     }
 
     Strategy:
-    - Make a Google Search query: "<domain> <title>"
+    - Answer from the resolve cache (domain, title, price band) if we can;
+      find-deals pre-resolves the deals it returns
+    - Otherwise make a Google Search query: "<domain> <title>"
     - Look through shopping_results first (price-aware)
     - If no strong match, look in organic_results
     """
@@ -87,18 +323,13 @@ async def resolve_merchant_url(data: dict):
         raise HTTPException(400, "source_domain and title required")
 
     expected_price = data.get("expected_price")
-    query = f"{source_domain} {title}"
-
-    url = await provider_google_search(
-        query,
-        expected_title=title,
-        expected_price=expected_price,
-    )
+    url = await resolve_merchant_url_cached(source_domain, title, expected_price)
 
     return {"resolved_url": url}
 
 # Amazon Scraping (SERP to get Amazon organic results)
 @app.post("/amazon/scrape-category")
+@timed_async("scrape")
 async def amazon_scrape_category(req: AmazonScrapeReq, amz_coll: Optional[str] = Query(None)):
     """
     Scrape up to `max_products` Amazon organic results for a given query.
@@ -112,10 +343,14 @@ async def amazon_scrape_category(req: AmazonScrapeReq, amz_coll: Optional[str] =
     if not SERPAPI_KEY:
         raise HTTPException(500, "SERPAPI_KEY not set")
 
-    AMZ = db[amz_coll]
+    set_serp_job(f"scrape:{amz_coll}")
+
+    AMZ = bulk_db[amz_coll]
+    prices = PriceRecorder(bulk_db)
     total = 0
     pages_fetched = 0
     page_errors = 0
+    budget_exhausted = False
 
     for pg in range(1, req.pages + 1):
         if total >= req.max_products:
@@ -125,6 +360,10 @@ async def amazon_scrape_category(req: AmazonScrapeReq, amz_coll: Optional[str] =
             data = await amazon_search_page(req.query, page=pg)
             items = data.get("organic_results") or []
             pages_fetched += 1
+        except SerpBudgetExceeded as e:
+            print("SerpAPI budget:", e.detail)
+            budget_exhausted = True
+            break
         except Exception as e:
             print("SERPAPI ERROR during amazon_search_page:", e)
             page_errors += 1
@@ -146,18 +385,7 @@ async def amazon_scrape_category(req: AmazonScrapeReq, amz_coll: Optional[str] =
                 continue
 
             # Skip multipacks/bulk, quality control
-            t = title.lower()
-
-            if "pack of" in t:
-                continue
-
-            if re.search(r"\b\d+\s*(pack|packet|bundle|variety|ct|count)\b", t):
-                continue
-
-            if re.search(r"\b\d+\s*pk\b", t):
-                continue
-
-            if re.search(r"\b\d+\s*x\s*\d+", t):
+            if analyze_title(title).multipack:
                 continue
 
             doc = {
@@ -168,25 +396,33 @@ async def amazon_scrape_category(req: AmazonScrapeReq, amz_coll: Optional[str] =
                 "thumbnail": thumbnail,
                 "image_url": thumbnail,
                 "link": link,
+                "features": await build_features(title, thumbnail),
                 "updatedAt": now_utc(),
             }
 
             # Upsert Amazon product
-            await AMZ.update_one(
-                {"asin": asin},
-                {"$set": doc, "$setOnInsert": {"createdAt": now_utc()}},
-                upsert=True,
-            )
+            with timed("mongo"):
+                await AMZ.update_one(
+                    {"asin": asin},
+                    {"$set": doc, "$setOnInsert": {"createdAt": now_utc()}},
+                    upsert=True,
+                )
+            prices.add(asin, AMAZON_SRC, price)
+            await index_phash(bulk_db, "amazon", asin, doc["features"].get("phash"), {"amz_coll": amz_coll})
 
             total += 1
 
+        await prices.maybe_flush()
         await asyncio.sleep(0.4 + random.random() * 0.3)
 
+    await prices.flush()
+
     return {
         "query": req.query,
         "pages_requested": req.pages,
         "pages_fetched": pages_fetched,
         "page_errors": page_errors,
+        "budget_exhausted": budget_exhausted,
         "total": total,
     }
 
@@ -196,7 +432,8 @@ async def google_index_by_title(
     amz_coll: str = Query(...),
     match_coll: str = Query(...),
     limit_items: int = 300,
-    per_call_delay_ms: int = 400
+    per_call_delay_ms: int = 400,
+    top_k: int = Query(5, ge=1, le=50),
 ):
     """
     This builds the MATCH collection.
@@ -204,17 +441,44 @@ async def google_index_by_title(
     - Iterate through Amazon products
     - Query Google Shopping using "<merchant> <title>"
     - Score all offers using the SAME pipeline as the Chrome extension
-    - Store top 5 offers + best_match in match_coll
+    - Store top `top_k` offers + best_match in match_coll
+
+    Only one worker indexes a given match_coll at a time (job lease);
+    a concurrent call gets 409.
     """
     if not SERPAPI_KEY:
         raise HTTPException(500, "SERPAPI_KEY not set")
 
-    AMZ = db[amz_coll]
-    MATCH = db[match_coll]
+    async with job_lease(db, f"index:{match_coll}") as lease:
+        if not lease.held:
+            raise HTTPException(409, f"Indexing {match_coll} is already running")
+        return await _index_by_title(amz_coll, match_coll, limit_items, per_call_delay_ms, top_k, lease=lease)
+
+@timed_async("index")
+async def _index_by_title(
+    amz_coll: str,
+    match_coll: str,
+    limit_items: int,
+    per_call_delay_ms: int,
+    top_k: int,
+    asins: Optional[List[str]] = None,
+    refresh: bool = False,
+    lease=None,
+):
+    """
+    Index up to `limit_items` Amazon items (only `asins` if given).
+    Items with a MATCH doc are skipped unless `refresh` (scheduler).
+    Near-duplicate listings share one Google Shopping query (clustering.py).
+    Stops early if the SerpAPI budget runs out or `lease` is lost.
+    """
+    set_serp_job(f"index:{match_coll}")
+
+    AMZ = bulk_db[amz_coll]
+    MATCH = bulk_db[match_coll]
 
     # Fetch Amazon items
     amz_items = await AMZ.find(
-        {},
+        {"asin": {"$in": asins}} if asins else {},
         {
             "_id": 0,
             "asin": 1,
@@ -223,155 +487,636 @@ async def google_index_by_title(
             "price": 1,
             "thumbnail": 1,
             "image_url": 1,
+            "features": 1,
         }
     ).limit(limit_items).to_list(length=limit_items)
 
     processed = 0
     misses = 0
-
+    queries = 0
+    budget_exhausted = False
+    lease_lost = False
+    # ASINs not reached when stopping early (scheduler requeues them)
+    remaining: List[str] = []
+
+    backend = get_scoring_backend()
+    slots = asyncio.Semaphore(max(2, backend.concurrency * 2))
+    pending = []
+    prices = PriceRecorder(bulk_db)
+
+    # Items that need indexing, with current features (clustering uses them)
+    todo = []
     for item in amz_items:
         asin = item.get("asin")
         if not asin:
             continue
 
         # Skip items already indexed once
-        cached = await MATCH.find_one({"key_val": asin})
-        if cached:
-            continue
+        if not refresh:
+            with timed("mongo"):
+                cached = await MATCH.find_one({"key_val": asin}, {"_id": 1})
+            if cached:
+                continue
 
-        brand = item.get("brand") or ""
-        title = item.get("title") or ""
+        # Reuse stored features; compute + persist for docs scraped before them
+        features = item.get("features")
+        thumb = item.get("thumbnail") or item.get("image_url")
+        if not features_current(features) or features.get("phash_src") != thumb:
+            item["features"] = await build_features(item.get("title") or "", thumb)
+            await AMZ.update_one({"asin": asin}, {"$set": {"features": item["features"]}})
+            await index_phash(bulk_db, "amazon", asin, item["features"].get("phash"), {"amz_coll": amz_coll})
+        todo.append(item)
+
+    # One SerpAPI query per cluster of near-duplicate listings
+    clusters = cluster_items(todo) if INDEX_CLUSTERING else [[item] for item in todo]
+
+    for ci, members in enumerate(clusters):
+        if lease is not None and lease.lost:
+            # Another worker may be indexing this category now
+            lease_lost = True
+            remaining = [item["asin"] for rest in clusters[ci:] for item in rest]
+            break
+
+        leader = members[0]
+        brand = leader.get("brand") or ""
+        title = leader.get("title") or ""
         query = f"{brand} {title}".strip()
 
         # Pull Google Shopping offers
         try:
             offers = await provider_google_shopping(query)
+            queries += 1
+        except SerpBudgetExceeded as e:
+            # Stop the run; the rest waits for budget (scheduler resumes it)
+            print("SerpAPI budget:", e.detail)
+            budget_exhausted = True
+            remaining = [item["asin"] for rest in clusters[ci:] for item in rest]
+            break
         except Exception as e:
             print("Google Shopping ERROR:", e)
 
-            await MATCH.update_one(
-                {"key_val": asin},
-                {
-                    "$set": {
-                        "key_type": "asin",
-                        "key_val": asin,
-                        "checked_at": now_utc(),
-                        "miss": True,
-                    }
-                },
-                upsert=True
-            )
-
-            misses += 1
+            for item in members:
+                await MATCH.update_one(
+                    {"key_val": item["asin"]},
+                    {
+                        "$set": {
+                            "key_type": "asin",
+                            "key_val": item["asin"],
+                            "checked_at": now_utc(),
+                            "miss": True,
+                        }
+                    },
+                    upsert=True
+                )
+
+            misses += len(members)
             continue
 
-        # Score offers using the extension's logic
-        payload = ExtensionFullProduct(
-            asin=asin,
-            title=title,
-            price=float(item["price"]),
-            brand=item.get("brand"),
-            thumbnail=item.get("thumbnail"),
-            image_url=item.get("image_url"),
-        )
+        if len(members) > 1:
+            await record_saved("google_shopping", "query_cluster", len(members) - 1)
 
-        scored = await _score_offers_for_extension(payload, offers)
-        best_deals = scored.get("best_deals") or []
-        top_match = best_deals[0] if best_deals else None
-
-        # Save match info
-        doc = {
-            "key_type": "asin",
-            "key_val": asin,
-            "checked_at": now_utc(),
-            "match_found": len(best_deals) > 0,
-            "amazon": {
-                "asin": asin,
-                "title": item.get("title"),
-                "price": item.get("price"),
-                "brand": item.get("brand"),
-                "thumbnail": item.get("thumbnail"),
-                "image_url": item.get("image_url"),
-            },
-            "best_match": top_match,
-            "best_deals": best_deals,
-            "offers": best_deals,    # Used by frontend dashboard
-        }
+        for item in members:
+            asin = item["asin"]
 
-        await MATCH.update_one(
-            {"key_val": asin},
-            {"$set": doc},
-            upsert=True
-        )
+            # Score offers using the extension's logic
+            payload = ExtensionFullProduct(
+                asin=asin,
+                title=item.get("title") or "",
+                price=float(item["price"]),
+                brand=item.get("brand"),
+                thumbnail=item.get("thumbnail"),
+                image_url=item.get("image_url"),
+            )
+
+            # Score (on another core with SCORING_BACKEND=process) while the
+            # next cluster's SerpAPI call runs; bounded number in flight
+            await slots.acquire()
+            task = asyncio.create_task(_score_and_store(backend, MATCH, item, payload, offers, top_k, prices))
+            task.add_done_callback(lambda _: slots.release())
+            pending.append(task)
 
-        processed += 1
+        await prices.maybe_flush()
         await asyncio.sleep(per_call_delay_ms / 1000.0)
 
+    filtered: dict = {}
+    for res in await asyncio.gather(*pending, return_exceptions=True):
+        if isinstance(res, Exception):
+            print("Index scoring ERROR:", res)
+        else:
+            processed += 1
+            for rule, count in res.items():
+                filtered[rule] = filtered.get(rule, 0) + count
+    await prices.flush()
+
     return {
         "processed": processed,
         "misses": misses,
+        "queries": queries,
+        "budget_exhausted": budget_exhausted,
+        "lease_lost": lease_lost,
+        "remaining": remaining,
+        "offers_filtered": filtered,
         "total_in_amazon_collection": len(amz_items),
     }
 
-# Deals Endpoint (dashboard uses this)
-@app.get("/deals/google")
-async def deals_google(
-    match_coll: Optional[str] = Query(None),
-    limit: int = 100
+def _match_doc(item: dict, asin: str, scored) -> dict:
+    """MATCH doc fields derived from one scoring run."""
+    best_deals = scored.deals_as_dicts()
+    top_match = best_deals[0] if best_deals else None
+
+    return {
+        "key_type": "asin",
+        "key_val": asin,
+        "match_found": len(best_deals) > 0,
+        "amazon": {
+            "asin": asin,
+            "title": item.get("title"),
+            "price": item.get("price"),
+            "brand": item.get("brand"),
+            "thumbnail": item.get("thumbnail"),
+            "image_url": item.get("image_url"),
+        },
+        "best_match": top_match,
+        "best_deals": best_deals,
+        "offers": best_deals,    # Used by frontend dashboard
+    }
+
+async def _score_and_store(backend, MATCH, item: dict, payload: ExtensionFullProduct, offers, top_k: int,
+                           prices: Optional[PriceRecorder] = None) -> dict:
+    """Score one Amazon item's offers and upsert its MATCH doc; returns the pre-filter counts."""
+    asin = payload.asin
+
+    scored = await backend.score(payload, offers, top_k=top_k, amz_features=item.get("features"))
+
+    # Price history: lowest matched price per merchant domain. Only offers
+    # that passed scoring count: raw Shopping results include accessories,
+    # other variants and unrelated listings
+    if prices is not None:
+        lowest = {}
+        for d in scored.best_deals:
+            src = d.offer.source_domain or d.offer.merchant
+            if src not in lowest or d.offer.price < lowest[src]:
+                lowest[src] = d.offer.price
+        for src, price in lowest.items():
+            prices.add(asin, src, price)
+
+    # Save match info, plus every raw offer so it can be rescored later
+    doc = _match_doc(item, asin, scored)
+    doc["checked_at"] = now_utc()
+    doc["raw_offers"] = compress_offers(offers)
+    doc["raw_offers_v"] = RAW_OFFERS_VERSION
+
+    with timed("mongo"):
+        await MATCH.update_one(
+            {"key_val": asin},
+            {"$set": doc},
+            upsert=True
+        )
+    await sync_deal(bulk_db, MATCH.name, doc)
+    await bump_collection_version(MATCH.name)
+
+    # Offer catalog for image near-duplicate search (pHashes come back
+    # from scoring, also from the process backend: no second download)
+    for d in scored.best_deals:
+        o = d.offer
+        if o.url and d.img_hash:
+            await index_phash(bulk_db, "offer", o.url, d.img_hash, {
+                "match_coll": MATCH.name, "asin": asin, "title": o.title,
+                "price": o.price, "source_domain": o.source_domain,
+            })
+
+    return scored.filtered
+
+async def _refresh_items(amz_coll: str, match_coll: str, asins: List[str]) -> Optional[dict]:
+    """Scheduler's index_fn: re-index `asins`, or None if the category is busy."""
+    async with job_lease(db, f"index:{match_coll}") as lease:
+        if not lease.held:
+            return None
+        return await _index_by_title(
+            amz_coll, match_coll, len(asins), SCHEDULER_CALL_DELAY_MS, 5,
+            asins=asins, refresh=True, lease=lease,
+        )
+
+# Feature Backfill (precompute title features on existing Amazon docs)
+@app.post("/amazon/backfill-features")
+async def amazon_backfill_features(
+    amz_coll: str = Query(...),
+    limit: int = 1000,
+    force: bool = False,
 ):
     """
-    Frontend dashboard calls this to load deals.
+    Compute + store `features` (normalized title, tokens, size/count,
+    unit mode, thumbnail pHash) for Amazon docs that lack them.
 
-    It:
-    - Reads the MATCH collection
-    - Applies final savings filters
-    - Sorts by strongest absolute savings
+    - Skips docs whose features are already on FEATURES_VERSION
+      (unless `force=true`)
+    - Safe to re-run; each call processes up to `limit` docs
+    - One backfill per collection at a time (job lease, 409 otherwise)
     """
+    async with job_lease(db, f"backfill:{amz_coll}") as lease:
+        if not lease.held:
+            raise HTTPException(409, f"Backfill of {amz_coll} is already running")
+        return await _backfill_features(amz_coll, limit, force, lease=lease)
 
-    MATCH = db[match_coll]
+async def _backfill_features(amz_coll: str, limit: int, force: bool, lease=None):
+    AMZ = bulk_db[amz_coll]
 
-    matches = await MATCH.find(
-        {"match_found": True},
-        {"_id": 0},
-    ).to_list(limit * 5)
+    cursor = AMZ.find(
+        {},
+        {"_id": 0, "asin": 1, "title": 1, "thumbnail": 1, "image_url": 1, "features": 1},
+    )
 
-    deals = []
+    scanned = 0
+    updated = 0
+    skipped = 0
+    indexed = 0
+    lease_lost = False
 
-    for m in matches:
-        amz = m.get("amazon")
-        offers = m.get("offers") or m.get("best_deals") or []
+    async for item in cursor:
+        if updated >= limit:
+            break
+        if lease is not None and lease.lost:
+            lease_lost = True
+            break
+        scanned += 1
 
-        if not amz or not offers:
+        asin = item.get("asin")
+        title = item.get("title")
+        if not asin or not title:
+            skipped += 1
             continue
 
-        top = offers[0]
-        amz_price = float(amz["price"])
-        other_price = float(top["price"])
+        thumb = item.get("thumbnail") or item.get("image_url")
+        features = item.get("features")
+        if not force and features_current(features) and features.get("phash_src") == thumb:
+            skipped += 1
+        else:
+            features = await build_features(title, thumb)
+            await AMZ.update_one({"asin": asin}, {"$set": {"features": features}})
+            updated += 1
 
-        # Require meaningful savings
-        savings_abs = amz_price - other_price
-        if savings_abs < 2:
-            continue
+        # Also (re)populates the pHash index for docs scraped before it
+        indexed += await index_phash(bulk_db, "amazon", asin, features.get("phash"), {"amz_coll": amz_coll})
+
+    return {
+        "updated": updated, "skipped": skipped, "indexed": indexed, "scanned": scanned,
+        "lease_lost": lease_lost,
+    }
 
-        pct = savings_abs / amz_price
-        if pct < 0.05:
+# Rescore stored offers (tune scoring without SerpAPI calls)
+@app.post("/matches/rescore")
+async def matches_rescore(
+    match_coll: str = Query(...),
+    amz_coll: Optional[str] = Query(None),
+    top_k: int = Query(5, ge=1, le=20),
+    batch_size: int = Query(200, ge=1, le=5000),
+):
+    """
+    Replay every MATCH doc's stored raw offers through the current scoring
+    engine and rewrite its deals (and deals view row).
+
+    - No SerpAPI calls; docs indexed before raw offers were stored are skipped
+    - `amz_coll` (default: from the category registry) supplies stored
+      title features / pHashes so nothing is recomputed needlessly
+    - Batches go through the scoring backend, so SCORING_BACKEND=process
+      spreads them over every core
+    """
+    if not amz_coll and CATEGORIES is not None:
+        cat = await CATEGORIES.find_one({"match_coll": match_coll}, {"amz_coll": 1})
+        amz_coll = (cat or {}).get("amz_coll")
+
+    async with job_lease(db, f"index:{match_coll}") as lease:
+        if not lease.held:
+            raise HTTPException(409, f"Indexing {match_coll} is already running")
+        return await _rescore_matches(match_coll, amz_coll, top_k, batch_size, lease=lease)
+
+@timed_async("rescore")
+async def _rescore_matches(match_coll: str, amz_coll: Optional[str], top_k: int, batch_size: int,
+                           lease=None) -> dict:
+    MATCH = bulk_db[match_coll]
+    backend = get_scoring_backend()
+    rescored = skipped = deals = 0
+
+    async def flush(batch: list) -> int:
+        # Stored features for the batch's ASINs in one query
+        features = {}
+        if amz_coll:
+            asins = [m["amazon"]["asin"] for m, _ in batch]
+            async for a in bulk_db[amz_coll].find({"asin": {"$in": asins}}, {"asin": 1, "features": 1}):
+                features[a.get("asin")] = a.get("features")
+
+        items = [
+            (
+                ExtensionFullProduct(
+                    asin=m["amazon"]["asin"],
+                    title=m["amazon"].get("title"),
+                    price=float(m["amazon"]["price"]),
+                    brand=m["amazon"].get("brand"),
+                    thumbnail=m["amazon"].get("thumbnail"),
+                    image_url=m["amazon"].get("image_url"),
+                ),
+                offers,
+                features.get(m["amazon"]["asin"]),
+            )
+            for m, offers in batch
+        ]
+        results = await backend.score_many(items, top_k=top_k)
+
+        found = 0
+        for (m, _), scored in zip(batch, results):
+            doc = _match_doc(m["amazon"], m["amazon"]["asin"], scored)
+            doc["rescored_at"] = now_utc()
+            with timed("mongo"):
+                await MATCH.update_one({"key_val": doc["key_val"]}, {"$set": doc})
+            found += await sync_deal(bulk_db, match_coll, doc)
+        return found
+
+    batch = []
+    cursor = MATCH.find(
+        {"raw_offers": {"$exists": True}},
+        {"_id": 0, "amazon": 1, "raw_offers": 1, "raw_offers_v": 1},
+    )
+    lease_lost = False
+    async for m in cursor:
+        if lease is not None and lease.lost:
+            lease_lost = True
+            batch = []
+            break
+        offers = decompress_offers(m.get("raw_offers"), m.get("raw_offers_v"))
+        amz = m.get("amazon") or {}
+        if not offers or not amz.get("asin") or not amz.get("price"):
+            skipped += 1
             continue
+        batch.append((m, offers))
+        if len(batch) >= batch_size:
+            deals += await flush(batch)
+            rescored += len(batch)
+            batch = []
 
-        deals.append({
-            "amazon": amz,
-            "offers": offers,
-        })
+    if batch:
+        deals += await flush(batch)
+        rescored += len(batch)
 
-        if len(deals) >= limit:
-            break
+    await bump_collection_version(match_coll)
+    return {"rescored": rescored, "skipped": skipped, "deals": deals, "lease_lost": lease_lost}
+
+# Deals Endpoint (dashboard uses this)
+@app.get("/deals/google")
+async def deals_google(
+    request: Request,
+    match_coll: Optional[str] = Query(None),
+    limit: int = Query(100, ge=1, le=500),
+):
+    """
+    Frontend dashboard calls this to load deals.
 
-    # Sort by absolute savings DESC
-    deals.sort(
-        key=lambda d: float(d["amazon"]["price"]) - float(d["offers"][0]["price"]),
-        reverse=True
+    It:
+    - Reads the category's rows from the materialized deals view (savings
+      filters already applied) with one indexed range scan
+    - Returns the `limit` strongest absolute savings
+    - Supports If-None-Match: unchanged polls get a 304 (no Mongo query)
+    - May read from a secondary (DEALS_READ_PREFERENCE, opt-in), but never
+      one that is behind `version` (_deals_source)
+    """
+    if match_coll:
+        await _ensure_deals_view(match_coll)
+    version = await collection_version(match_coll)
+    key = f"deals/google:{match_coll}:{version}:{limit}"
+    return await conditional_json(request, key, lambda: _deals_google(match_coll, version, limit))
+
+async def _deals_source(stack: AsyncExitStack, match_coll: str, version: int):
+    """
+    (collection, session) for reading `match_coll`'s deals-view rows into
+    a response cached under `version`.
+
+    Secondary reads go through a causally consistent session that first
+    reads the category's version marker there. A secondary that hasn't
+    replicated the bump to `version` is also missing the deal writes
+    before it, so the primary is read instead: a cached body is never
+    older than its ETag.
+    """
+    if DEALS_VERSIONS_READ is None:
+        return DEALS_READ, None
+    session = await stack.enter_async_context(await client.start_session(causal_consistency=True))
+    doc = await DEALS_VERSIONS_READ.find_one({"_id": match_coll}, {"v": 1}, session=session)
+    if (doc or {}).get("v", 0) >= version:
+        return DEALS_READ, session
+    DEALS_READ_FALLBACK.inc()
+    return db[DEALS_COLL], None
+
+async def _deals_google(match_coll: str, version: int, limit: int) -> dict:
+    # Eligibility is precomputed in the deals view; projection is the
+    # response shape, so docs are serialized as-is
+    async with AsyncExitStack() as stack:
+        coll, session = await _deals_source(stack, match_coll, version)
+        deals = await coll.find(
+            {"match_coll": match_coll},
+            {"_id": 0, "amazon": 1, "offers": 1},
+            session=session,
+        ).sort(DEAL_SORT).limit(limit).to_list(length=limit)
+    return {"count": len(deals), "deals": deals}
+
+# Categories whose deals view is known to be built (this process)
+_deals_views_built: set = set()
+
+async def _ensure_deals_view(match_coll: str) -> None:
+    """Build the deals view once for a category indexed before it existed."""
+    if match_coll in _deals_views_built:
+        return
+    if not await deals_built(db, match_coll):
+        async with job_lease(db, f"rebuild:{match_coll}") as lease:
+            if not lease.held:
+                # Another worker is building it; serve the rows so far
+                return
+            if not await deals_built(db, match_coll):
+                result = await rebuild_deals(bulk_db, match_coll)
+                print(f"Deals view built for {match_coll}:", result)
+        await bump_collection_version(match_coll)
+    _deals_views_built.add(match_coll)
+
+# Cross-category Deals Feed (k-way merge across match collections)
+def _feed_token(savings: float, coll: str, asin: str) -> str:
+    raw = json.dumps({"s": savings, "c": coll, "a": asin}).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+def _parse_feed_token(token: str) -> dict:
+    try:
+        after = json.loads(base64.urlsafe_b64decode(token.encode()))
+    except Exception:
+        raise HTTPException(400, "Invalid cursor")
+    # Shape _feed_query relies on: {"s": number, "c": str, "a": str}
+    if (
+        not isinstance(after, dict)
+        or not isinstance(after.get("s"), (int, float)) or isinstance(after.get("s"), bool)
+        or not isinstance(after.get("c"), str)
+        or not isinstance(after.get("a"), str)
+    ):
+        raise HTTPException(400, "Invalid cursor")
+    return after
+
+def _feed_query(coll: str, after: Optional[dict]) -> dict:
+    """
+    Deals-view filter for one category, resuming strictly after the
+    `after` cursor position in (savings desc, match_coll asc, asin asc).
+    """
+    query = {"match_coll": coll}
+    if after:
+        s, c, a = after["s"], after["c"], after["a"]
+        if coll > c:
+            query["savings"] = {"$lte": s}
+        elif coll == c:
+            query["$or"] = [
+                {"savings": {"$lt": s}},
+                {"savings": s, "asin": {"$gt": a}},
+            ]
+        else:
+            query["savings"] = {"$lt": s}
+    return query
+
+@app.get("/deals/feed")
+async def deals_feed(
+    request: Request,
+    match_coll: Optional[List[str]] = Query(None),
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = Query(None),
+):
+    """
+    "All categories" deals view in one call.
+
+    - `match_coll` may be repeated; defaults to every registered category
+    - Each category is an indexed range scan on the deals view
+    - Sorted cursors are k-way merged; only one pending doc per collection
+      is held in memory
+    - Pass the returned `next` as `cursor` for the following page
+    - Supports If-None-Match keyed on every source collection's version
+    - Same read preference as /deals/google
+    """
+    colls = match_coll
+    if not colls:
+        colls = [c["match_coll"] async for c in CATEGORIES.find({}, {"_id": 0, "match_coll": 1})]
+    # Source order is the tie-break for equal savings, so keep it stable
+    colls = sorted(set(colls))
+    await asyncio.gather(*(_ensure_deals_view(c) for c in colls))
+
+    versions = await asyncio.gather(*(collection_version(c) for c in colls))
+    key = "deals/feed:" + ",".join(f"{c}@{v}" for c, v in zip(colls, versions)) + f":{limit}:{cursor}"
+    return await conditional_json(request, key, lambda: _deals_feed(colls, versions, limit, cursor))
+
+async def _deals_feed(colls: List[str], versions: List[int], limit: int, cursor: Optional[str]) -> dict:
+    after = _parse_feed_token(cursor) if cursor else None
+
+    async with AsyncExitStack() as stack:
+        # One session per source: a session can't serve concurrent cursors
+        handles = await asyncio.gather(*(
+            _deals_source(stack, c, v) for c, v in zip(colls, versions)
+        ))
+        sources = [
+            coll.find(
+                _feed_query(c, after),
+                {"_id": 0, "amazon": 1, "offers": 1, "savings": 1, "match_coll": 1},
+                session=session,
+            ).sort(DEAL_SORT).limit(limit).batch_size(limit)
+            for c, (coll, session) in zip(colls, handles)
+        ]
+
+        deals = [
+            d async for d in merge_sorted_desc(sources, key=lambda d: d["savings"], k=limit)
+        ]
+
+    next_token = None
+    if len(deals) == limit:
+        last = deals[-1]
+        next_token = _feed_token(last["savings"], last["match_coll"], last["amazon"].get("asin"))
+
+    return {"count": len(deals), "deals": deals, "next": next_token}
+
+# Price History
+@app.get("/prices/history")
+async def prices_history(
+    asin: str = Query(...),
+    src: Optional[str] = Query(None, description='"amazon" or a merchant domain; default all'),
+    days: int = Query(90, ge=1, le=3650),
+    bucket: str = Query("day"),
+):
+    """Downsampled price history for one ASIN, one series per source."""
+    if bucket not in BUCKET_UNITS:
+        raise HTTPException(400, f"bucket must be one of {', '.join(BUCKET_UNITS)}")
+    since = now_utc() - timedelta(days=days)
+    with timed("mongo"):
+        series = await db[PRICE_HISTORY_COLL].aggregate(
+            history_pipeline(asin, since, src, bucket)
+        ).to_list(length=None)
+    return FastJSONResponse({"asin": asin, "since": since, "bucket": bucket, "series": series})
+
+@app.get("/prices/drops")
+async def prices_drops(
+    days: int = Query(7, ge=1, le=365),
+    src: str = Query(AMAZON_SRC),
+    min_drop_pct: float = Query(5.0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+):
+    """Items whose price dropped by >= `min_drop_pct` % over the last `days`."""
+    since = now_utc() - timedelta(days=days)
+    with timed("mongo"):
+        drops = await db[PRICE_HISTORY_COLL].aggregate(
+            drops_pipeline(since, src, min_drop_pct, limit)
+        ).to_list(length=limit)
+    return FastJSONResponse({"since": since, "src": src, "count": len(drops), "drops": drops})
+
+# Refresh Scheduler
+@app.get("/scheduler/status")
+async def scheduler_status():
+    """Queue depth and position per category, hourly budget usage, last tick."""
+    return await scheduler.status()
+
+@app.post("/scheduler/run-once")
+async def scheduler_run_once():
+    """Run one scheduling round now (same budget and checkpoints as the loop)."""
+    async with job_lease(db, "scheduler") as lease:
+        if not lease.held:
+            raise HTTPException(409, "Scheduler tick already running")
+        return await scheduler.tick()
+
+# Deals view consistency check / repair
+@app.post("/deals/rebuild")
+async def deals_rebuild(match_coll: str = Query(...)):
+    """
+    Recompute the deals view rows of one category from its MATCH
+    collection. Returns drift counts (all 0 = the view was consistent).
+    """
+    async with job_lease(db, f"rebuild:{match_coll}") as lease:
+        if not lease.held:
+            raise HTTPException(409, f"Rebuild of {match_coll} is already running")
+        result = await rebuild_deals(bulk_db, match_coll)
+    await bump_collection_version(match_coll)
+    return result
+
+# Category Registry
+@app.put("/categories")
+async def register_category(
+    match_coll: str = Query(...),
+    amz_coll: Optional[str] = Query(None),
+    query: Optional[str] = Query(None),
+):
+    """Register (or update) a category so feeds/jobs can find it."""
+    doc = {"match_coll": match_coll, "updatedAt": now_utc()}
+    if amz_coll:
+        doc["amz_coll"] = amz_coll
+    if query:
+        doc["query"] = query
+
+    await CATEGORIES.update_one(
+        {"match_coll": match_coll},
+        {"$set": doc, "$setOnInsert": {"createdAt": now_utc()}},
+        upsert=True,
     )
+    return {"registered": match_coll}
 
-    return {"count": len(deals), "deals": deals[:limit]}
+@app.get("/categories")
+async def list_categories():
+    """All registered categories."""
+    cats = await CATEGORIES.find({}, {"_id": 0}).to_list(length=None)
+    return {"count": len(cats), "categories": cats}
 
 # Full Ingest (Amazon scrape, then Google index)
 @app.post("/amazon/full-ingest")
@@ -394,11 +1139,81 @@ async def amazon_full_ingest(
 
     await google_index_by_title(
         amz_coll=amz_coll,
-        match_coll=match_coll
+        match_coll=match_coll,
+        top_k=5,
     )
 
+    await register_category(match_coll=match_coll, amz_coll=amz_coll, query=query)
+
     return {"status": "complete"}
 
+# Image near-duplicate search (pHash index)
+@app.get("/images/near")
+async def images_near(
+    phash: Optional[str] = Query(None, description="64-bit pHash hex"),
+    asin: Optional[str] = Query(None, description="use this Amazon item's stored pHash"),
+    amz_coll: Optional[str] = Query(None),
+    distance: int = Query(6, ge=0, le=MAX_DISTANCE),
+    kind: Optional[str] = Query(None, description='"amazon" or "offer"'),
+    limit: int = Query(50, ge=1, le=500),
+):
+    """Catalog items / offers whose image is within `distance` bits of a pHash."""
+    if not phash and asin and amz_coll:
+        item = await db[amz_coll].find_one({"asin": asin}, {"features.phash": 1})
+        phash = ((item or {}).get("features") or {}).get("phash")
+    if not phash:
+        raise HTTPException(400, "Pass phash, or asin + amz_coll of an item with a stored pHash")
+
+    matches = await near_phashes(db, phash, distance, kind, limit)
+    return {"phash": phash, "distance": distance, "count": len(matches), "matches": matches}
+
+# SerpAPI usage and budgets
+@app.get("/serpapi/usage")
+async def serpapi_usage():
+    """
+    Billed SerpAPI searches today and this month: totals, remaining budget,
+    and breakdowns by engine, endpoint, job and priority, plus retries and
+    searches saved by caches.
+    """
+    return await usage_report()
+
+# Metrics (Prometheus text format)
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """
+    Stage latency histograms (serpapi, image_download, phash, fuzzy,
+    score, scrape, index, mongo), request latency, SerpAPI attempts /
+    retries / 429s and cache hit counters.
+    """
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
+# On-demand profiling (guarded by DEBUG_TOKEN)
+@app.post("/debug/profile", response_class=PlainTextResponse)
+async def debug_profile(
+    seconds: float = Query(10.0, gt=0, le=120),
+    mode: str = Query("sampling", pattern="^(sampling|cprofile)$"),
+    interval_ms: float = Query(5.0, ge=1, le=1000),
+    sort: str = Query("cumulative"),
+    x_debug_token: Optional[str] = Header(None),
+):
+    """
+    Profile this worker against live traffic for `seconds`.
+
+    - mode=sampling: stack samples of the event-loop thread, returned as
+      collapsed stacks ("a;b;c count", feed to flamegraph.pl/speedscope)
+    - mode=cprofile: deterministic cProfile of the loop thread, returned
+      as pstats text sorted by `sort`
+    """
+    if not token_ok(x_debug_token):
+        raise HTTPException(403, "Profiling disabled or bad X-Debug-Token")
+
+    if mode == "cprofile":
+        try:
+            return await profile_cprofile(seconds, sort=sort)
+        except ProfilerBusy as e:
+            raise HTTPException(409, str(e))
+    return await profile_sampling(seconds, interval=interval_ms / 1000.0)
+
 # Debugging utility, Clears category collections
 @app.delete("/debug/clear-category")
 async def clear_category(
@@ -417,5 +1232,7 @@ async def clear_category(
     if match_coll:
         res = await db[match_coll].delete_many({})
         result["match_deleted"] = res.deleted_count
+        result["deals_deleted"] = await clear_deals(db, match_coll)
+        await bump_collection_version(match_coll)
 
     return result
@@ -0,0 +1,211 @@
+import os, time, bisect, threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Dict, Optional, Tuple
+
+# Per-stage latency histograms + counters, rendered in Prometheus text format.
+# Most metrics are only touched on the event-loop thread, so no locking; an
+# observation is one bisect plus a few increments. Metrics also fed from
+# other threads (offload pool stages, loop watchdog, Mongo pool listeners)
+# use the Locked* variants.
+
+# Emit a Server-Timing header with per-stage totals on every response
+SERVER_TIMING = os.getenv("SERVER_TIMING", "0") == "1"
+
+# Latency buckets in seconds (5ms .. 60s)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+def _label_key(labels: Dict[str, object]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def _fmt_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    inner = ",".join(f'{k}="{v}"' for k, v in pairs)
+    return "{" + inner + "}"
+
+class Counter:
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self.values: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = _label_key(labels)
+        self.values[key] = self.values.get(key, 0.0) + amount
+
+    def get(self, **labels) -> float:
+        return self.values.get(_label_key(labels), 0.0)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, v in self.values.items():
+            lines.append(f"{self.name}{_fmt_labels(key)} {v}")
+        return lines
+
+class Gauge(Counter):
+    def set(self, value: float, **labels) -> None:
+        self.values[_label_key(labels)] = float(value)
+
+    def render(self) -> list:
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        # label key -> [bucket counts..., sum, count]
+        self.values: Dict[LabelKey, list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = _label_key(labels)
+        row = self.values.get(key)
+        if row is None:
+            row = self.values[key] = [0] * len(self.buckets) + [0.0, 0]
+        idx = bisect.bisect_left(self.buckets, value)
+        if idx < len(self.buckets):
+            row[idx] += 1
+        row[-2] += value
+        row[-1] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, row in self.values.items():
+            cum = 0
+            for le, n in zip(self.buckets, row):
+                cum += n
+                lines.append(f"{self.name}_bucket{_fmt_labels(key, ('le', repr(le)))} {cum}")
+            lines.append(f"{self.name}_bucket{_fmt_labels(key, ('le', '+Inf'))} {row[-1]}")
+            lines.append(f"{self.name}_sum{_fmt_labels(key)} {row[-2]}")
+            lines.append(f"{self.name}_count{_fmt_labels(key)} {row[-1]}")
+        return lines
+
+class LockedCounter(Counter):
+    """Counter for observations from other threads (driver listeners)."""
+
+    def __init__(self, name: str, help: str):
+        super().__init__(name, help)
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        with self._lock:
+            super().inc(amount, **labels)
+
+    def render(self) -> list:
+        with self._lock:
+            return super().render()
+
+class LockedHistogram(Histogram):
+    """Histogram for observations from other threads (driver listeners)."""
+
+    def __init__(self, name: str, help: str, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, buckets)
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        with self._lock:
+            super().observe(value, **labels)
+
+    def render(self) -> list:
+        with self._lock:
+            return super().render()
+
+# Registry
+# Stages also run on the offload thread pool (phash decode, fuzzy batches)
+STAGE_SECONDS = LockedHistogram("pyapi_stage_seconds", "Time spent per pipeline stage")
+REQUEST_SECONDS = Histogram("pyapi_request_seconds", "HTTP request latency")
+SERPAPI_CALLS = Counter("pyapi_serpapi_calls_total", "SerpAPI HTTP attempts by engine and status")
+SERPAPI_RETRIES = Counter("pyapi_serpapi_retries_total", "SerpAPI retries by reason")
+SERPAPI_BILLED = Counter("pyapi_serpapi_billed_total", "Billed SerpAPI searches by engine, endpoint and priority")
+SERPAPI_SAVED = Counter("pyapi_serpapi_saved_total", "SerpAPI searches avoided by our caches, by engine and reason")
+SERPAPI_REFUSED = Counter("pyapi_serpapi_refused_total", "SerpAPI calls refused by budget, by priority")
+OFFERS_FILTERED = Counter("pyapi_offers_filtered_total", "Offers dropped before or during scoring, by rule")
+CACHE = Counter("pyapi_cache_total", "Cache lookups by cache and result (hit/miss)")
+DEALS_READ_FALLBACK = Counter(
+    "pyapi_deals_read_fallback_total", "Deals reads sent to the primary because the secondary lagged the version",
+)
+GAUGES = Gauge("pyapi_gauge", "Point-in-time values sampled at scrape")
+LOOP_LAG_SECONDS = Histogram(
+    "pyapi_loop_lag_seconds", "Event-loop heartbeat lateness",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0),
+)
+# Incremented by the watchdog thread
+LOOP_STALLS = LockedCounter("pyapi_loop_stalls_total", "Event-loop stalls over LOOP_LAG_WARN_MS")
+MONGO_POOL_WAIT_SECONDS = LockedHistogram(
+    "pyapi_mongo_pool_wait_seconds", "Time waiting for a Mongo pool connection, by client profile",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0),
+)
+MONGO_POOL_CHECKOUT_FAILED = LockedCounter(
+    "pyapi_mongo_pool_checkout_failed_total", "Failed Mongo pool checkouts by client profile and reason",
+)
+
+REGISTRY = [
+    STAGE_SECONDS, REQUEST_SECONDS, SERPAPI_CALLS, SERPAPI_RETRIES, SERPAPI_BILLED,
+    SERPAPI_SAVED, SERPAPI_REFUSED, OFFERS_FILTERED, CACHE, DEALS_READ_FALLBACK, GAUGES, LOOP_LAG_SECONDS, LOOP_STALLS,
+    MONGO_POOL_WAIT_SECONDS, MONGO_POOL_CHECKOUT_FAILED,
+]
+
+# Gauge callbacks run at /metrics render time: name -> fn() -> float
+_COLLECTORS = {}
+
+def register_collector(name: str, fn) -> None:
+    _COLLECTORS[name] = fn
+
+# Per-request stage totals for Server-Timing (ms by stage)
+_request_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_timings", default=None)
+
+def start_request_timings() -> Dict[str, float]:
+    timings: Dict[str, float] = {}
+    _request_timings.set(timings)
+    return timings
+
+# A request's timings dict is shared with the offload threads it starts
+_timings_lock = threading.Lock()
+
+def record_stage(stage: str, seconds: float) -> None:
+    """Record an already-measured stage duration (any thread)."""
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    timings = _request_timings.get()
+    if timings is not None:
+        with _timings_lock:
+            timings[stage] = timings.get(stage, 0.0) + seconds * 1000.0
+
+@contextmanager
+def timed(stage: str):
+    """Time a block (sync or inside a coroutine) as `stage`."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - t0)
+
+def timed_async(stage: str):
+    """Decorator form of `timed` for coroutines."""
+    def deco(fn):
+        @wraps(fn)
+        async def wrapper(*args, **kwargs):
+            with timed(stage):
+                return await fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+def server_timing_header(timings: Dict[str, float]) -> str:
+    return ", ".join(f"{stage};dur={ms:.1f}" for stage, ms in timings.items())
+
+def render_prometheus() -> str:
+    for name, fn in _COLLECTORS.items():
+        try:
+            GAUGES.set(fn(), name=name)
+        except Exception:
+            pass
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
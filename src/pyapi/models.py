@@ -1,5 +1,6 @@
+from dataclasses import dataclass, field
 from pydantic import BaseModel, Field
-from typing import Optional, TypedDict
+from typing import Optional, TypedDict, List, Dict
 
 # AmazonScrapeReq
 # Used by: /amazon/scrape-category
@@ -8,7 +9,7 @@ class AmazonScrapeReq(BaseModel):
     pages: int = Field(1, ge=1, le=10)
     max_products: int = 100
 
-# Offer structure returned from Google Shopping / Google Search providers
+# JSON/dict shape of an offer (what ParsedOffer.to_dict() produces)
 # TypedDict is correct because this is NOT persisted and allows extra keys.
 class Offer(TypedDict, total=False):
     merchant: str                       # e.g. "google_shopping"
@@ -31,3 +32,83 @@ class ExtensionFullProduct(BaseModel):
 
     # Can come from extension OR Amazon scraper
     image_url: Optional[str] = None
+
+
+# Scoring-engine hot path types
+# Slotted dataclasses: no per-instance __dict__, and a ScoredDeal references
+# its ParsedOffer instead of copying it. Dicts are only built by to_dict()
+# at the response / Mongo-write boundary.
+
+# One Google Shopping result, as parsed by provider_google_shopping
+@dataclass(slots=True)
+class ParsedOffer:
+    merchant: str
+    title: str
+    price: float
+    url: Optional[str] = None
+    source_domain: Optional[str] = None
+    thumbnail: Optional[str] = None
+    brand: Optional[str] = None
+
+    def to_dict(self) -> Offer:
+        return Offer(
+            merchant=self.merchant,
+            source_domain=self.source_domain,
+            title=self.title,
+            price=self.price,
+            url=self.url,
+            thumbnail=self.thumbnail,
+            brand=self.brand,
+        )
+
+# An offer that survived scoring, plus its scores
+@dataclass(slots=True)
+class ScoredDeal:
+    offer: ParsedOffer
+    sim: float                          # text similarity (RapidFuzz)
+    img_sim: float                      # pHash similarity
+    combined_sim: float
+    savings_abs: float
+    savings_pct: float
+    img_hash: Optional[str] = None      # offer thumbnail pHash hex, if computed
+
+    def to_dict(self) -> dict:
+        o = self.offer
+        return {
+            "merchant": o.merchant,
+            "source_domain": o.source_domain,
+            "title": o.title,
+            "price": o.price,
+            "url": o.url,
+            "thumbnail": o.thumbnail,
+            "brand": o.brand,
+            "sim": self.sim,
+            "img_sim": self.img_sim,
+            "combined_sim": self.combined_sim,
+            "savings_abs": self.savings_abs,
+            "savings_pct": self.savings_pct,
+        }
+
+# Output of utils._score_offers_for_extension
+@dataclass(slots=True)
+class ScoreResult:
+    amazon: dict
+    best_deals: List[ScoredDeal] = field(default_factory=list)
+    # Offers dropped before / during scoring, per rule
+    filtered: Dict[str, int] = field(default_factory=dict)
+    # Image URL -> pHash hex for every hash this run computed or looked up
+    phashes: Dict[str, str] = field(default_factory=dict)
+
+    @property
+    def match_found(self) -> bool:
+        return len(self.best_deals) > 0
+
+    def deals_as_dicts(self) -> List[dict]:
+        return [d.to_dict() for d in self.best_deals]
+
+    def to_dict(self) -> dict:
+        return {
+            "match_found": self.match_found,
+            "amazon": self.amazon,
+            "best_deals": self.deals_as_dicts(),
+        }
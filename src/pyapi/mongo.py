@@ -0,0 +1,152 @@
+import os, threading
+from importlib.util import find_spec
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.monitoring import ConnectionPoolListener
+from pymongo.read_preferences import read_pref_mode_from_name, make_read_preference
+from metrics import MONGO_POOL_WAIT_SECONDS, MONGO_POOL_CHECKOUT_FAILED, register_collector
+
+# MongoDB client profiles
+#
+# Two clients, so bulk ingest can't take every connection from
+# latency-sensitive requests (each client has its own pool per server):
+#
+#   user: extension + dashboard requests, leases, caches, quota. Warm
+#         minimum pool; write concern is the server default unless
+#         MONGO_USER_W / MONGO_USER_J are set
+#   bulk: scrape / index / backfill / rescore writes (Amazon + MATCH docs,
+#         deals view, price history, pHash index). Small pool and
+#         w=1, j=false by default: a lost write is redone by the next run
+#
+# Both use wire compression (MONGO_COMPRESSORS, first one the server also
+# supports wins). zstd / snappy need the zstandard / python-snappy modules
+# and are left out when those aren't installed.
+#
+# /deals/google and /deals/feed may read from secondaries
+# (DEALS_READ_PREFERENCE, opt-in; default primary). DEALS_MAX_STALENESS_S
+# keeps far-behind secondaries out of selection, and a read whose
+# secondary hasn't caught up with the cached collection version falls back
+# to the primary (main._deals_source), so ETags stay keyed on version only.
+#
+# Imported from lifespan(), not at startup: pymongo/motor are a noticeable
+# slice of import time.
+
+MONGO_COMPRESSORS = os.getenv("MONGO_COMPRESSORS", "zstd,snappy,zlib")
+
+DEALS_READ_PREFERENCE = os.getenv("DEALS_READ_PREFERENCE", "primary")
+# Mongo's minimum staleness is 90s
+DEALS_MAX_STALENESS_S = max(90, int(os.getenv("DEALS_MAX_STALENESS_S", "120")))
+
+def _profile_env(profile: str, name: str, default: str) -> str:
+    return os.getenv(f"MONGO_{profile.upper()}_{name}", default)
+
+# Defaults per profile: (max pool, min pool, w, j)
+PROFILES = {
+    "user": ("50", "5", "", ""),
+    "bulk": ("10", "0", "1", "0"),
+}
+
+_COMPRESSOR_MODULES = {"zstd": "zstandard", "snappy": "snappy"}
+
+def compressors() -> str:
+    """MONGO_COMPRESSORS minus those whose module isn't installed."""
+    out = []
+    for name in (c.strip() for c in MONGO_COMPRESSORS.split(",")):
+        module = _COMPRESSOR_MODULES.get(name)
+        if name and (module is None or find_spec(module) is not None):
+            out.append(name)
+    return ",".join(out)
+
+def client_options(profile: str) -> dict:
+    """AsyncIOMotorClient kwargs for `profile` ("user" or "bulk")."""
+    max_pool, min_pool, w, j = PROFILES[profile]
+    opts = {
+        "appname": f"pyapi-{profile}",
+        "maxPoolSize": int(_profile_env(profile, "POOL_MAX", max_pool)),
+        "minPoolSize": int(_profile_env(profile, "POOL_MIN", min_pool)),
+        "maxIdleTimeMS": int(_profile_env(profile, "MAX_IDLE_MS", "300000")),
+    }
+    wait_ms = _profile_env(profile, "WAIT_QUEUE_MS", "")
+    if wait_ms:
+        opts["waitQueueTimeoutMS"] = int(wait_ms)
+    comp = compressors()
+    if comp:
+        opts["compressors"] = comp
+    w = _profile_env(profile, "W", w)
+    if w:
+        opts["w"] = int(w) if w.isdigit() else w
+    j = _profile_env(profile, "J", j)
+    if j:
+        opts["journal"] = j == "1"
+    return opts
+
+def deals_read_preference():
+    """Read preference for the deals view, or None for primary."""
+    if DEALS_READ_PREFERENCE == "primary":
+        return None
+    mode = read_pref_mode_from_name(DEALS_READ_PREFERENCE)
+    return make_read_preference(mode, None, max_staleness=DEALS_MAX_STALENESS_S)
+
+class PoolMetrics(ConnectionPoolListener):
+    """
+    Pool listener for one profile. Events arrive on driver threads: counts
+    are kept under a lock and read by /metrics collectors; wait times go to
+    a locked histogram.
+    """
+
+    def __init__(self, profile: str):
+        self.profile = profile
+        self._lock = threading.Lock()
+        self.open = 0
+        self.in_use = 0
+        self.waiting = 0
+        register_collector(f"mongo_pool_open:{profile}", lambda: self.open)
+        register_collector(f"mongo_pool_in_use:{profile}", lambda: self.in_use)
+        register_collector(f"mongo_pool_waiting:{profile}", lambda: self.waiting)
+
+    def _add(self, field: str, n: int) -> None:
+        with self._lock:
+            setattr(self, field, getattr(self, field) + n)
+
+    # Checkout: started -> checked_out | check_out_failed
+    def connection_check_out_started(self, event) -> None:
+        self._add("waiting", 1)
+
+    def connection_checked_out(self, event) -> None:
+        self._add("waiting", -1)
+        self._add("in_use", 1)
+        if event.duration is not None:
+            MONGO_POOL_WAIT_SECONDS.observe(event.duration, profile=self.profile)
+
+    def connection_check_out_failed(self, event) -> None:
+        self._add("waiting", -1)
+        MONGO_POOL_CHECKOUT_FAILED.inc(profile=self.profile, reason=event.reason)
+        if event.duration is not None:
+            MONGO_POOL_WAIT_SECONDS.observe(event.duration, profile=self.profile)
+
+    def connection_checked_in(self, event) -> None:
+        self._add("in_use", -1)
+
+    def connection_created(self, event) -> None:
+        self._add("open", 1)
+
+    def connection_closed(self, event) -> None:
+        self._add("open", -1)
+
+    def connection_ready(self, event) -> None:
+        pass
+
+    def pool_created(self, event) -> None:
+        pass
+
+    def pool_ready(self, event) -> None:
+        pass
+
+    def pool_cleared(self, event) -> None:
+        pass
+
+    def pool_closed(self, event) -> None:
+        pass
+
+def create_client(url: str, profile: str) -> AsyncIOMotorClient:
+    """Motor client for `profile`, with pool metrics attached."""
+    return AsyncIOMotorClient(url, event_listeners=[PoolMetrics(profile)], **client_options(profile))
@@ -0,0 +1,35 @@
+import os, asyncio, contextvars
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Callable, Sequence, TypeVar
+
+# Keep CPU-heavy work off the event loop.
+# Small batches run inline (a thread hop costs more than they do); batches
+# over CPU_OFFLOAD_THRESHOLD items go to a shared thread pool so one huge
+# index batch can't freeze the extension endpoints.
+
+CPU_OFFLOAD_THRESHOLD = int(os.getenv("CPU_OFFLOAD_THRESHOLD", "200"))
+CPU_WORKERS = int(os.getenv("CPU_WORKERS", str(min(8, (os.cpu_count() or 1) + 2))))
+
+_executor = ThreadPoolExecutor(max_workers=CPU_WORKERS, thread_name_prefix="cpu")
+
+T = TypeVar("T")
+
+async def run_blocking(fn: Callable[..., T], *args) -> T:
+    """
+    Run a synchronous call in the CPU pool.
+    Context (e.g. per-request Server-Timing totals) is carried over.
+    """
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(_executor, partial(ctx.run, fn, *args))
+
+async def run_cpu_batch(fn: Callable[..., T], items: Sequence, *args, threshold: int = None) -> T:
+    """
+    fn(items, *args): inline when len(items) <= threshold, otherwise in
+    the CPU pool.
+    """
+    limit = CPU_OFFLOAD_THRESHOLD if threshold is None else threshold
+    if len(items) <= limit:
+        return fn(items, *args)
+    return await run_blocking(fn, items, *args)
@@ -0,0 +1,90 @@
+import os
+from itertools import combinations
+from typing import List, Optional
+from clustering import hamming
+from utils import now_utc
+
+# Persistent near-neighbor index over 64-bit pHashes (multi-index hashing)
+#
+# Each hash is split into SEGMENTS 16-bit segments stored as indexed fields
+# s0..s3. If two hashes are within Hamming distance d, then by pigeonhole
+# at least one segment pair is within floor(d / SEGMENTS) bits. A lookup
+# therefore enumerates, for every segment, the values within that radius
+# (1 / 17 / 137 / 697 values for r = 0..3), fetches the union of matches
+# through the segment indexes and keeps those within d exactly. No scan
+# of the whole collection.
+#
+# Docs: {_id: "<kind>:<ref>", kind: "amazon" | "offer", ref, h: hex,
+#        s0..s3, meta, updatedAt}; upserted as hashes arrive.
+
+PHASH_INDEX_COLL = os.getenv("PHASH_INDEX_COLL", "phash_index")
+SEGMENTS = 4
+SEGMENT_BITS = 64 // SEGMENTS
+MAX_DISTANCE = 12
+
+async def ensure_phash_index(db) -> None:
+    coll = db[PHASH_INDEX_COLL]
+    for i in range(SEGMENTS):
+        await coll.create_index(f"s{i}")
+
+def segments(h: int) -> List[int]:
+    mask = (1 << SEGMENT_BITS) - 1
+    return [(h >> (SEGMENT_BITS * i)) & mask for i in range(SEGMENTS)]
+
+def within_radius(value: int, r: int) -> List[int]:
+    """All SEGMENT_BITS-bit values within Hamming distance r of `value`."""
+    out = [value]
+    for k in range(1, r + 1):
+        for bits in combinations(range(SEGMENT_BITS), k):
+            v = value
+            for b in bits:
+                v ^= 1 << b
+            out.append(v)
+    return out
+
+def _parse(hex_value: Optional[str]) -> Optional[int]:
+    if not hex_value:
+        return None
+    try:
+        return int(hex_value, 16)
+    except ValueError:
+        return None
+
+async def index_phash(db, kind: str, ref: Optional[str], hex_value: Optional[str], meta: Optional[dict] = None) -> bool:
+    """Add or update one hash; False if there's nothing to index."""
+    h = _parse(hex_value)
+    if h is None or not ref:
+        return False
+    doc = {"kind": kind, "ref": ref, "h": hex_value, "meta": meta or {}, "updatedAt": now_utc()}
+    doc.update({f"s{i}": seg for i, seg in enumerate(segments(h))})
+    try:
+        await db[PHASH_INDEX_COLL].update_one({"_id": f"{kind}:{ref}"}, {"$set": doc}, upsert=True)
+    except Exception as e:
+        print("pHash index write ERROR:", e)
+        return False
+    return True
+
+async def near_phashes(db, hex_value: str, distance: int = 6, kind: Optional[str] = None,
+                       limit: int = 50) -> List[dict]:
+    """Indexed entries within `distance` bits of `hex_value`, closest first."""
+    h = _parse(hex_value)
+    if h is None:
+        return []
+    distance = max(0, min(distance, MAX_DISTANCE))
+    r = distance // SEGMENTS
+
+    query = {"$or": [
+        {f"s{i}": {"$in": within_radius(seg, r)}}
+        for i, seg in enumerate(segments(h))
+    ]}
+    if kind:
+        query = {"$and": [{"kind": kind}, query]}
+
+    out = []
+    async for doc in db[PHASH_INDEX_COLL].find(query, {"_id": 0, "kind": 1, "ref": 1, "h": 1, "meta": 1}):
+        d = hamming(h, int(doc["h"], 16))
+        if d <= distance:
+            doc["distance"] = d
+            out.append(doc)
+    out.sort(key=lambda doc: (doc["distance"], doc["kind"], doc["ref"]))
+    return out[:limit]
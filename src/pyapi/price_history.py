@@ -0,0 +1,152 @@
+import os
+from datetime import datetime
+from typing import List, Optional
+from utils import now_utc
+
+# Price history (MongoDB time-series collection)
+#
+# One point per observed price, bucketed by Mongo on the meta field:
+#   {t: <observed at>, m: {a: <asin>, s: <source>}, p: <price>}
+# where source is "amazon" for Amazon prices and the offer's source_domain
+# for Google Shopping offers that scoring matched to the ASIN (lowest per
+# domain). Short field names keep per-point overhead minimal.
+#
+# Writers buffer points in a PriceRecorder and insert in batches. The first
+# flush in each process makes sure the time-series collection exists: an
+# insert into a missing collection would create a plain one instead.
+
+PRICE_HISTORY_COLL = os.getenv("PRICE_HISTORY_COLL", "price_history")
+PRICE_BATCH = int(os.getenv("PRICE_BATCH", "500"))
+AMAZON_SRC = "amazon"
+
+# $dateTrunc units accepted by /prices/history
+BUCKET_UNITS = ("hour", "day", "week", "month")
+
+# Set once ensure_price_history() has succeeded in this process
+_ready = False
+
+async def ensure_price_history(db) -> None:
+    """Create the time-series collection (Mongo 5.0+) once."""
+    global _ready
+    cursor = await db.list_collections(filter={"name": PRICE_HISTORY_COLL})
+    infos = await cursor.to_list(length=1)
+    if infos:
+        if infos[0].get("type") != "timeseries":
+            print(
+                f"WARNING: {PRICE_HISTORY_COLL} exists but is not a time-series collection; "
+                "drop or migrate it to get time-series storage"
+            )
+    else:
+        try:
+            await db.create_collection(
+                PRICE_HISTORY_COLL,
+                timeseries={"timeField": "t", "metaField": "m", "granularity": "hours"},
+            )
+        except Exception as e:
+            # Another worker created it first
+            if "already exists" not in str(e):
+                raise
+    await db[PRICE_HISTORY_COLL].create_index([("m.a", 1), ("m.s", 1), ("t", 1)])
+    _ready = True
+
+class PriceRecorder:
+    """
+    Batched price point writer for one job:
+
+        async with PriceRecorder(db) as prices:
+            prices.add(asin, "amazon", 19.99)
+            await prices.maybe_flush()
+    """
+
+    def __init__(self, db, batch_size: int = PRICE_BATCH):
+        self.db = db
+        self.batch_size = batch_size
+        self.points: list = []
+        self.written = 0
+
+    def add(self, asin: Optional[str], src: Optional[str], price, t: Optional[datetime] = None) -> None:
+        if not asin or not src or price is None:
+            return
+        self.points.append({"t": t or now_utc(), "m": {"a": asin, "s": src}, "p": float(price)})
+
+    async def maybe_flush(self) -> None:
+        if len(self.points) >= self.batch_size:
+            await self.flush()
+
+    async def flush(self) -> None:
+        if not self.points:
+            return
+        points, self.points = self.points, []
+        try:
+            if not _ready:
+                await ensure_price_history(self.db)
+            await self.db[PRICE_HISTORY_COLL].insert_many(points, ordered=False)
+            self.written += len(points)
+        except Exception as e:
+            print("Price history write ERROR:", e)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.flush()
+
+def history_pipeline(asin: str, since: datetime, src: Optional[str], unit: str) -> list:
+    """Downsampled series per source: min / max / avg / last price per bucket."""
+    match = {"m.a": asin, "t": {"$gte": since}}
+    if src:
+        match["m.s"] = src
+    return [
+        {"$match": match},
+        {"$sort": {"t": 1}},
+        {"$group": {
+            "_id": {"s": "$m.s", "b": {"$dateTrunc": {"date": "$t", "unit": unit}}},
+            "min": {"$min": "$p"},
+            "max": {"$max": "$p"},
+            "avg": {"$avg": "$p"},
+            "last": {"$last": "$p"},
+            "n": {"$sum": 1},
+        }},
+        {"$sort": {"_id.s": 1, "_id.b": 1}},
+        {"$group": {
+            "_id": "$_id.s",
+            "points": {"$push": {
+                "t": "$_id.b", "min": "$min", "max": "$max",
+                "avg": {"$round": ["$avg", 2]}, "last": "$last", "n": "$n",
+            }},
+        }},
+        {"$project": {"_id": 0, "src": "$_id", "points": 1}},
+        {"$sort": {"src": 1}},
+    ]
+
+def drops_pipeline(since: datetime, src: str, min_drop_pct: float, limit: int,
+                   asins: Optional[List[str]] = None) -> list:
+    """
+    Items whose latest price is at least `min_drop_pct` % below their
+    first price observed since `since`, biggest drop first.
+    """
+    match = {"t": {"$gte": since}, "m.s": src}
+    if asins:
+        match["m.a"] = {"$in": asins}
+    return [
+        {"$match": match},
+        {"$sort": {"t": 1}},
+        {"$group": {
+            "_id": "$m.a",
+            "first": {"$first": "$p"},
+            "last": {"$last": "$p"},
+            "min": {"$min": "$p"},
+            "last_seen": {"$last": "$t"},
+        }},
+        {"$match": {"first": {"$gt": 0}}},
+        {"$addFields": {"drop_pct": {"$multiply": [
+            {"$divide": [{"$subtract": ["$first", "$last"]}, "$first"]}, 100,
+        ]}}},
+        {"$match": {"drop_pct": {"$gte": min_drop_pct}}},
+        {"$sort": {"drop_pct": -1}},
+        {"$limit": limit},
+        {"$project": {
+            "_id": 0, "asin": "$_id", "first": 1, "last": 1, "min": 1, "last_seen": 1,
+            "drop_pct": {"$round": ["$drop_pct", 2]},
+        }},
+    ]
@@ -0,0 +1,182 @@
+import os, sys, io, time, hmac, asyncio, threading, traceback, inspect, cProfile, pstats
+from contextlib import contextmanager
+from collections import Counter as _Counter
+from typing import Optional
+from metrics import LOOP_LAG_SECONDS, LOOP_STALLS
+
+# On-demand profiling + event-loop lag monitoring for live workers.
+# Everything here is opt-in via the guarded /debug/profile endpoints or
+# LOOP_MONITOR; nothing runs per-request unless asked to.
+
+# Shared secret for /debug/profile and the X-Profile header.
+# Unset = profiling endpoints disabled.
+DEBUG_TOKEN = os.getenv("DEBUG_TOKEN")
+
+LOOP_MONITOR = os.getenv("LOOP_MONITOR", "1") == "1"
+LOOP_LAG_WARN_MS = float(os.getenv("LOOP_LAG_WARN_MS", "100"))
+
+# Debug mode: also turn on asyncio's own slow-callback logging, which names
+# the Task/coroutine of every callback over LOOP_LAG_WARN_MS
+LOOP_DEBUG = os.getenv("LOOP_DEBUG", "0") == "1"
+
+# Our source dir, to tell app coroutines from library ones
+_APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def token_ok(token: Optional[str]) -> bool:
+    # Constant-time compare: the token guards a live-worker endpoint
+    return bool(DEBUG_TOKEN) and token is not None and hmac.compare_digest(
+        token.encode(), DEBUG_TOKEN.encode()
+    )
+
+def _frame_stack(frame) -> list:
+    """Outermost-first list of 'file:function' for a frame chain."""
+    out = []
+    while frame is not None:
+        code = frame.f_code
+        out.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    out.reverse()
+    return out
+
+def blocking_coroutines(frame) -> list:
+    """
+    App coroutines on a (blocked) loop thread's stack, outermost first,
+    e.g. ["main.deals_google", "utils._score_offers_for_extension"].
+    The first entry is the request handler / job that owns the stall.
+    """
+    out = []
+    while frame is not None:
+        code = frame.f_code
+        if code.co_flags & inspect.CO_COROUTINE and code.co_filename.startswith(_APP_DIR):
+            module = os.path.splitext(os.path.basename(code.co_filename))[0]
+            out.append(f"{module}.{code.co_name}")
+        frame = frame.f_back
+    out.reverse()
+    return out
+
+# Sampling profiler (collapsed stacks, flamegraph.pl / speedscope format)
+class SamplingProfiler(threading.Thread):
+    """
+    Samples one thread's stack every `interval` seconds from a side thread.
+    The target thread (the event loop) keeps serving traffic meanwhile.
+    """
+
+    def __init__(self, thread_id: int, interval: float = 0.005):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = _Counter()
+        self._stop_evt = threading.Event()
+
+    def run(self):
+        while not self._stop_evt.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.samples[";".join(_frame_stack(frame))] += 1
+
+    def stop(self) -> str:
+        self._stop_evt.set()
+        self.join()
+        return "\n".join(f"{stack} {n}" for stack, n in self.samples.most_common())
+
+async def profile_sampling(seconds: float, interval: float = 0.005) -> str:
+    prof = SamplingProfiler(threading.get_ident(), interval)
+    prof.start()
+    await asyncio.sleep(seconds)
+    return prof.stop()
+
+# cProfile (deterministic; profiles everything on the loop thread)
+def pstats_text(prof: cProfile.Profile, sort: str = "cumulative", limit: int = 60) -> str:
+    buf = io.StringIO()
+    pstats.Stats(prof, stream=buf).sort_stats(sort).print_stats(limit)
+    return buf.getvalue()
+
+class ProfilerBusy(RuntimeError):
+    pass
+
+# cProfile hooks the whole thread: a second session (X-Profile request vs.
+# /debug/profile?mode=cprofile) would clobber the first one's hook
+_cprofile_lock = threading.Lock()
+
+@contextmanager
+def cprofile_session():
+    """Enabled cProfile.Profile for the block; raises ProfilerBusy if one is already running."""
+    if not _cprofile_lock.acquire(blocking=False):
+        raise ProfilerBusy("A cProfile session is already running")
+    try:
+        prof = cProfile.Profile()
+        prof.enable()
+        try:
+            yield prof
+        finally:
+            prof.disable()
+    finally:
+        _cprofile_lock.release()
+
+async def profile_cprofile(seconds: float, sort: str = "cumulative", limit: int = 60) -> str:
+    with cprofile_session() as prof:
+        await asyncio.sleep(seconds)
+    return pstats_text(prof, sort, limit)
+
+# Event-loop lag monitor
+class LoopLagMonitor:
+    """
+    - A heartbeat coroutine wakes every `interval` and records how late it
+      was (pyapi_loop_lag_seconds)
+    - A watchdog thread notices when the heartbeat is overdue by more than
+      `threshold` and prints the loop thread's current stack, i.e. whatever
+      callback is blocking it (e.g. a synchronous imagehash.phash)
+    - Stalls are attributed to the outermost app coroutine on that stack
+      (pyapi_loop_stalls_total{coro=...})
+    """
+
+    def __init__(self, threshold_ms: float = LOOP_LAG_WARN_MS, interval_ms: float = 50.0):
+        self.threshold = threshold_ms / 1000.0
+        self.interval = interval_ms / 1000.0
+        self._beat = time.monotonic()
+        self._loop_thread: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stop_evt = threading.Event()
+        self._watchdog: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        if LOOP_DEBUG:
+            loop.set_debug(True)
+            loop.slow_callback_duration = self.threshold
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._task = loop.create_task(self._heartbeat())
+        self._watchdog = threading.Thread(target=self._watch, daemon=True)
+        self._watchdog.start()
+
+    def stop(self) -> None:
+        self._stop_evt.set()
+        if self._task:
+            self._task.cancel()
+
+    async def _heartbeat(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - expected)
+            LOOP_LAG_SECONDS.observe(lag)
+            self._beat = now
+
+    def _watch(self):
+        reported_beat = None
+        while not self._stop_evt.wait(self.interval):
+            overdue = time.monotonic() - self._beat - self.interval
+            if overdue < self.threshold or reported_beat == self._beat:
+                continue
+            # Report each stall once, with the blocking stack
+            reported_beat = self._beat
+            frame = sys._current_frames().get(self._loop_thread)
+            coros = blocking_coroutines(frame) if frame else []
+            owner = coros[0] if coros else "unknown"
+            LOOP_STALLS.inc(coro=owner)
+
+            stack = "".join(traceback.format_stack(frame)) if frame else "<no frame>"
+            chain = " -> ".join(coros) or "<no app coroutine>"
+            print(f"EVENT LOOP BLOCKED > {overdue * 1000:.0f}ms in {chain}, loop thread stack:\n{stack}")
@@ -0,0 +1,186 @@
+import os, time, asyncio
+from contextvars import ContextVar
+from datetime import datetime, timedelta, timezone
+from fastapi import HTTPException
+from metrics import SERPAPI_BILLED, SERPAPI_SAVED, SERPAPI_REFUSED
+
+# SerpAPI call accounting + budgets
+#
+# Every billed SerpAPI search is counted per engine, endpoint and job in
+# SERP_USAGE_COLL (one doc per UTC day and per month, shared by all
+# workers), together with retries and calls saved by our own caches.
+#
+# Budgets (0 = unlimited) are enforced before each call:
+#   - interactive traffic (extension endpoints) may use the whole budget
+#   - batch work (scrape / index / scheduler) only SERPAPI_BATCH_SHARE of
+#     it, so it is refused before users are affected; past
+#     SERPAPI_BATCH_THROTTLE of its allowance it is paced so the rest lasts
+#     until the day rolls over
+
+SERP_USAGE_COLL = os.getenv("SERP_USAGE_COLL", "serp_usage")
+SERPAPI_DAILY_BUDGET = int(os.getenv("SERPAPI_DAILY_BUDGET", "0"))
+SERPAPI_MONTHLY_BUDGET = int(os.getenv("SERPAPI_MONTHLY_BUDGET", "0"))
+SERPAPI_BATCH_SHARE = float(os.getenv("SERPAPI_BATCH_SHARE", "0.8"))
+SERPAPI_BATCH_THROTTLE = float(os.getenv("SERPAPI_BATCH_THROTTLE", "0.5"))
+# Longest pause a throttled batch call takes before proceeding
+SERPAPI_MAX_PACE_S = float(os.getenv("SERPAPI_MAX_PACE_S", "30"))
+# How long a worker trusts its last read of the shared usage docs
+USAGE_REFRESH_S = 5.0
+
+_db = None
+
+def init_quota(db) -> None:
+    global _db
+    _db = db
+
+async def ensure_quota_indexes(db) -> None:
+    await db[SERP_USAGE_COLL].create_index("expiresAt", expireAfterSeconds=0)
+
+class SerpBudgetExceeded(HTTPException):
+    def __init__(self, detail: str):
+        super().__init__(429, detail)
+
+# Who is calling: set per request by the middleware, per job by batch work
+_caller: ContextVar[dict] = ContextVar("serp_caller", default={"endpoint": "background", "job": None, "batch": True})
+
+def set_serp_endpoint(endpoint: str) -> None:
+    _caller.set({"endpoint": endpoint, "job": None, "batch": False})
+
+def set_serp_job(job: str, batch: bool = True) -> None:
+    """Attribute this task's SerpAPI calls to `job` (batch priority by default)."""
+    _caller.set({**_caller.get(), "job": job, "batch": batch})
+
+def _key(part: str) -> str:
+    # Mongo field names can't contain "." or start with "$"
+    return part.replace(".", "_").replace("$", "_")
+
+def _periods(now: datetime):
+    return [
+        (f"day:{now:%Y-%m-%d}", SERPAPI_DAILY_BUDGET, now + timedelta(days=40)),
+        (f"month:{now:%Y-%m}", SERPAPI_MONTHLY_BUDGET, now + timedelta(days=400)),
+    ]
+
+# period id -> (usage doc, fetched at monotonic)
+_usage: dict = {}
+_last_batch_call = 0.0
+
+async def _read_usage(period: str) -> dict:
+    hit = _usage.get(period)
+    if hit and time.monotonic() - hit[1] < USAGE_REFRESH_S:
+        return hit[0]
+    # Without Mongo (scripts, debug runner) the local counts are all we have
+    doc = hit[0] if hit else {}
+    if _db is not None:
+        try:
+            doc = await _db[SERP_USAGE_COLL].find_one({"_id": period}) or {}
+        except Exception as e:
+            print("SerpAPI usage read ERROR:", e)
+            doc = hit[0] if hit else {}
+    _usage[period] = (doc, time.monotonic())
+    return doc
+
+def _seconds_left(period: str, now: datetime) -> float:
+    if period.startswith("day:"):
+        end = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    else:
+        nxt = (now.replace(day=28) + timedelta(days=4)).replace(day=1)
+        end = nxt.replace(hour=0, minute=0, second=0, microsecond=0)
+    return max(1.0, (end - now).total_seconds())
+
+async def check_budget(engine: str) -> None:
+    """Raise SerpBudgetExceeded, or pace batch calls, before spending a search."""
+    global _last_batch_call
+    caller = _caller.get()
+    batch = caller["batch"]
+    now = datetime.now(timezone.utc)
+    pace = 0.0
+
+    for period, budget, _ in _periods(now):
+        if budget <= 0:
+            continue
+        used = (await _read_usage(period)).get("billed", 0)
+        allowance = budget * SERPAPI_BATCH_SHARE if batch else budget
+        if used >= allowance:
+            priority = "batch" if batch else "interactive"
+            SERPAPI_REFUSED.inc(priority=priority)
+            raise SerpBudgetExceeded(
+                f"SerpAPI {period.split(':')[0]} budget exhausted for {priority} calls "
+                f"({used}/{int(allowance)})"
+            )
+        if batch and used >= allowance * SERPAPI_BATCH_THROTTLE:
+            # Spread what's left of the batch allowance over the period
+            pace = max(pace, _seconds_left(period, now) / max(1.0, allowance - used))
+
+    if pace > 0:
+        wait = min(SERPAPI_MAX_PACE_S, _last_batch_call + pace - time.monotonic())
+        if wait > 0:
+            await asyncio.sleep(wait)
+    if batch:
+        _last_batch_call = time.monotonic()
+
+async def _inc(fields: dict) -> None:
+    now = datetime.now(timezone.utc)
+    for period, _, expires in _periods(now):
+        hit = _usage.get(period)
+        if hit is None:
+            # Stale on purpose: next read refetches when Mongo is there
+            hit = _usage[period] = ({}, 0.0)
+        for k, n in fields.items():
+            hit[0][k] = hit[0].get(k, 0) + n
+    if _db is None:
+        return
+    try:
+        await asyncio.gather(*(
+            _db[SERP_USAGE_COLL].update_one(
+                {"_id": period},
+                {"$inc": fields, "$setOnInsert": {"expiresAt": expires}},
+                upsert=True,
+            )
+            for period, _, expires in _periods(now)
+        ))
+    except Exception as e:
+        print("SerpAPI usage write ERROR:", e)
+
+async def record_billed(engine: str) -> None:
+    caller = _caller.get()
+    priority = "batch" if caller["batch"] else "interactive"
+    SERPAPI_BILLED.inc(engine=engine, endpoint=caller["endpoint"], priority=priority)
+    fields = {
+        "billed": 1,
+        priority: 1,
+        f"engine.{_key(engine)}": 1,
+        f"endpoint.{_key(caller['endpoint'])}": 1,
+    }
+    if caller["job"]:
+        fields[f"job.{_key(caller['job'])}"] = 1
+    await _inc(fields)
+
+async def record_retry(engine: str) -> None:
+    await _inc({"retries": 1, f"retries_by_engine.{_key(engine)}": 1})
+
+async def record_saved(engine: str, reason: str, n: int = 1) -> None:
+    """A cache answered instead of SerpAPI (reason = which cache)."""
+    SERPAPI_SAVED.inc(n, engine=engine, reason=reason)
+    await _inc({"saved": n, f"saved_by.{_key(reason)}": n})
+
+async def usage_report() -> dict:
+    now = datetime.now(timezone.utc)
+    out = {
+        "batch_share": SERPAPI_BATCH_SHARE,
+        "batch_throttle": SERPAPI_BATCH_THROTTLE,
+    }
+    for period, budget, _ in _periods(now):
+        if _db is not None:
+            _usage.pop(period, None)
+        doc = dict(await _read_usage(period))
+        doc.pop("_id", None)
+        doc.pop("expiresAt", None)
+        used = doc.get("billed", 0)
+        out[period.split(":")[0]] = {
+            "period": period.split(":")[1],
+            "budget": budget or None,
+            "remaining": (budget - used) if budget else None,
+            "batch_remaining": max(0, int(budget * SERPAPI_BATCH_SHARE) - used) if budget else None,
+            **doc,
+        }
+    return out
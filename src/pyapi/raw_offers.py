@@ -0,0 +1,33 @@
+import zlib
+from typing import List, Optional
+import orjson
+from models import ParsedOffer
+
+# Raw Google Shopping offers persisted on MATCH docs
+#
+# The indexer stores every parsed offer (not just the top-k deals) so
+# scoring changes can be replayed from Mongo without new SerpAPI calls
+# (see /matches/rescore). Stored as zlib-compressed JSON rows:
+#   [merchant, title, price, url, source_domain, thumbnail, brand]
+# Title features are not stored; scoring recomputes them (LRU-cached).
+
+RAW_OFFERS_VERSION = 1
+ZLIB_LEVEL = 6
+
+def compress_offers(offers: List[ParsedOffer]) -> bytes:
+    rows = [
+        (o.merchant, o.title, o.price, o.url, o.source_domain, o.thumbnail, o.brand)
+        for o in offers
+    ]
+    return zlib.compress(orjson.dumps(rows), ZLIB_LEVEL)
+
+def decompress_offers(blob: Optional[bytes], version: Optional[int] = RAW_OFFERS_VERSION) -> List[ParsedOffer]:
+    if not blob or version != RAW_OFFERS_VERSION:
+        return []
+    return [
+        ParsedOffer(
+            merchant=m, title=t, price=p, url=u, source_domain=sd,
+            thumbnail=th, brand=b,
+        )
+        for m, t, p, u, sd, th, b in orjson.loads(zlib.decompress(bytes(blob)))
+    ]
@@ -0,0 +1,197 @@
+import os, gzip, hashlib
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Optional
+import orjson
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response
+from metrics import CACHE, timed
+
+# Response encoding for large payloads (deal lists, extension results)
+#
+#   FastJSONResponse: orjson straight from the dicts Motor returns
+#     (datetime, nested lists) without FastAPI's jsonable_encoder pass.
+#     Endpoints return it directly so FastAPI skips re-encoding entirely.
+#   conditional_json: ETag / If-None-Match for versioned listings, with the
+#     serialized body cached per (endpoint, collection versions, params)
+#   CompressionMiddleware: br or gzip for bodies over COMPRESS_MIN_BYTES,
+#     negotiated on Accept-Encoding q-values.
+
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "5"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+_COMPRESSIBLE = (b"application/json", b"text/")
+
+def _orjson_default(obj: Any):
+    # bson ObjectId / Decimal128 etc. if a projection ever lets one through
+    return str(obj)
+
+class FastJSONResponse(JSONResponse):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        with timed("serialize"):
+            return orjson.dumps(
+                content,
+                default=_orjson_default,
+                option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY,
+            )
+
+# Conditional GET
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "256"))
+
+class ResponseCache:
+    """Per-process LRU of serialized bodies; keys embed data versions, so no expiry."""
+
+    def __init__(self, max_size: int = RESPONSE_CACHE_SIZE):
+        self.max_size = max_size
+        self._bodies: "OrderedDict[str, bytes]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[bytes]:
+        body = self._bodies.get(key)
+        if body is None:
+            CACHE.inc(cache="response", result="miss")
+            return None
+        CACHE.inc(cache="response", result="hit_local")
+        self._bodies.move_to_end(key)
+        return body
+
+    def set(self, key: str, body: bytes) -> None:
+        self._bodies[key] = body
+        self._bodies.move_to_end(key)
+        while len(self._bodies) > self.max_size:
+            self._bodies.popitem(last=False)
+
+RESPONSE_CACHE = ResponseCache()
+
+def etag_for(key: str) -> str:
+    # Weak: the same entity may be sent gzip/br/identity encoded
+    return 'W/"' + hashlib.sha1(key.encode()).hexdigest()[:20] + '"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    tags = {t.strip().removeprefix("W/") for t in if_none_match.split(",")}
+    return etag.removeprefix("W/") in tags
+
+async def conditional_json(request: Request, key: str, build: Callable[[], Awaitable[Any]]) -> Response:
+    """
+    `key` must change whenever the payload can (collection versions +
+    query params). A matching If-None-Match returns 304 before `build`
+    runs; otherwise the cached body is reused or built once and cached.
+    """
+    etag = etag_for(key)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    body = RESPONSE_CACHE.get(key)
+    if body is None:
+        body = FastJSONResponse(await build()).body
+        RESPONSE_CACHE.set(key, body)
+    return Response(body, media_type="application/json", headers=headers)
+
+def _accept_qvalues(accept: str) -> dict:
+    """{coding: q} from an Accept-Encoding header; a malformed q counts as 0."""
+    prefs = {}
+    for part in accept.split(","):
+        coding, *params = [p.strip() for p in part.split(";")]
+        if not coding:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = min(1.0, max(0.0, float(value)))
+                except ValueError:
+                    q = 0.0
+        prefs[coding.lower()] = q
+    return prefs
+
+def _pick_encoding(accept: str) -> str:
+    """
+    Highest-q coding we support ("br" wins ties), or "" for identity.
+    q=0 refuses a coding; "*" stands for every coding not listed.
+    """
+    prefs = _accept_qvalues(accept)
+    supported = ("br", "gzip") if brotli is not None else ("gzip",)
+    best, best_q = "", 0.0
+    for coding in supported:
+        q = prefs.get(coding, prefs.get("*", 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+def _compress(body: bytes, encoding: str) -> bytes:
+    with timed("compress"):
+        if encoding == "br":
+            return brotli.compress(body, quality=BROTLI_QUALITY)
+        return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+class CompressionMiddleware:
+    """
+    ASGI middleware: compresses single-message responses (all our JSON and
+    text endpoints). Streaming responses and small or already-encoded
+    bodies pass through untouched.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESS_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        accept = ""
+        for k, v in scope.get("headers") or []:
+            if k == b"accept-encoding":
+                accept = v.decode("latin-1")
+                break
+        encoding = _pick_encoding(accept)
+        if not encoding:
+            return await self.app(scope, receive, send)
+
+        start = None
+        passthrough = False
+
+        async def wrapped_send(message):
+            nonlocal start, passthrough
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                return await send(message)
+
+            body = message.get("body", b"")
+            headers = dict(start.get("headers") or [])
+            content_type = headers.get(b"content-type", b"")
+            if (
+                message.get("more_body")
+                or len(body) < self.minimum_size
+                or b"content-encoding" in headers
+                or not content_type.startswith(_COMPRESSIBLE)
+            ):
+                passthrough = True
+                await send(start)
+                return await send(message)
+
+            body = _compress(body, encoding)
+            out = [(k, v) for k, v in start.get("headers") or [] if k != b"content-length"]
+            out += [
+                (b"content-encoding", encoding.encode()),
+                (b"content-length", str(len(body)).encode()),
+                (b"vary", b"Accept-Encoding"),
+            ]
+            await send({**start, "headers": out})
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, wrapped_send)
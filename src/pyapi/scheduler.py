@@ -0,0 +1,302 @@
+import os, math, random, asyncio
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, List, Optional
+from jobs import job_lease
+from metrics import register_collector
+from deals_view import DEALS_COLL
+from price_history import PRICE_HISTORY_COLL, AMAZON_SRC
+from utils import now_utc
+
+# Priority refresh scheduler
+#
+# Keeps every registered category's MATCH docs fresh within a SerpAPI
+# budget. One worker at a time runs it (job lease "scheduler"); each tick:
+#
+#   1. For each category, (re)build a priority queue of ASINs when the old
+#      one is used up or older than SCHEDULER_REQUEUE_H
+#   2. Split the remaining hourly budget across categories and send the
+#      next slice of each queue through the indexing pipeline (index_fn)
+#   3. Checkpoint the queue position in SCHEDULER_COLL, so a restart or a
+#      lease handover resumes where the last tick stopped
+#
+# Priority per item combines staleness, last savings, Amazon price
+# volatility and extension lookups (see priority()).
+
+SCHEDULER = os.getenv("SCHEDULER", "0") == "1"
+SCHEDULER_INTERVAL_S = float(os.getenv("SCHEDULER_INTERVAL_S", "300"))
+# SerpAPI calls per hour the scheduler may spend (one per query; clustered
+# near-duplicate items share one)
+SCHEDULER_BUDGET_PER_HOUR = int(os.getenv("SCHEDULER_BUDGET_PER_HOUR", "100"))
+# Items younger than this are not refreshed; STALE_H counts as fully stale
+SCHEDULER_MIN_AGE_H = float(os.getenv("SCHEDULER_MIN_AGE_H", "6"))
+SCHEDULER_STALE_H = float(os.getenv("SCHEDULER_STALE_H", "48"))
+SCHEDULER_REQUEUE_H = float(os.getenv("SCHEDULER_REQUEUE_H", "6"))
+SCHEDULER_QUEUE_MAX = int(os.getenv("SCHEDULER_QUEUE_MAX", "1000"))
+SCHEDULER_SCAN_MAX = int(os.getenv("SCHEDULER_SCAN_MAX", "20000"))
+
+SCHEDULER_COLL = os.getenv("SCHEDULER_COLL", "scheduler_state")
+POPULARITY_COLL = os.getenv("POPULARITY_COLL", "asin_popularity")
+
+VOLATILITY_DAYS = 30
+
+# Weights of the priority components (each component is in [0, 1])
+W_STALE, W_SAVINGS, W_VOLATILITY, W_POPULARITY = 0.4, 0.25, 0.2, 0.15
+
+# index_fn(amz_coll, match_coll, asins) -> result dict, or None if the
+# category is busy (manual index/rescore holding its lease). The result's
+# "remaining" lists ASINs it didn't get to (SerpAPI budget ran out).
+IndexFn = Callable[[str, str, List[str]], Awaitable[Optional[dict]]]
+
+async def ensure_scheduler_indexes(db) -> None:
+    # Hourly budget docs carry expiresAt; queue docs don't and are kept
+    await db[SCHEDULER_COLL].create_index("expiresAt", expireAfterSeconds=0)
+
+async def record_lookup(db, asin: Optional[str]) -> None:
+    """Count an extension lookup (popularity signal)."""
+    if not asin:
+        return
+    try:
+        await db[POPULARITY_COLL].update_one(
+            {"_id": asin},
+            {"$inc": {"n": 1}, "$set": {"last": now_utc()}},
+            upsert=True,
+        )
+    except Exception as e:
+        print("Popularity write ERROR:", e)
+
+# Strong refs: the loop only keeps weak references to tasks
+_lookup_tasks: set = set()
+
+def note_lookup(db, asin: Optional[str]) -> None:
+    """Fire-and-forget record_lookup, so the write stays off the request path."""
+    if not asin:
+        return
+    task = asyncio.ensure_future(record_lookup(db, asin))
+    _lookup_tasks.add(task)
+    task.add_done_callback(_lookup_tasks.discard)
+
+def priority(age_h: Optional[float], savings: float, volatility: float, lookups: int) -> float:
+    """
+    0 for items refreshed within SCHEDULER_MIN_AGE_H, else a weighted sum:
+    - staleness: age / SCHEDULER_STALE_H, capped at 1 (never indexed = 1)
+    - savings: last savings_abs / $20, capped at 1
+    - volatility: coefficient of variation of the Amazon price * 10, capped
+    - popularity: log-scaled extension lookups (100 lookups = 1)
+    """
+    if age_h is not None and age_h < SCHEDULER_MIN_AGE_H:
+        return 0.0
+    stale = 1.0 if age_h is None else min(1.0, age_h / SCHEDULER_STALE_H)
+    return (
+        W_STALE * stale
+        + W_SAVINGS * min(1.0, max(0.0, savings) / 20.0)
+        + W_VOLATILITY * min(1.0, volatility * 10.0)
+        + W_POPULARITY * min(1.0, math.log1p(lookups) / math.log1p(100))
+    )
+
+def _age_h(checked_at, now: datetime) -> Optional[float]:
+    if not checked_at:
+        return None
+    # Motor returns naive UTC datetimes
+    if checked_at.tzinfo is None:
+        checked_at = checked_at.replace(tzinfo=timezone.utc)
+    return (now - checked_at).total_seconds() / 3600.0
+
+async def build_queue(db, amz_coll: str, match_coll: str) -> List[str]:
+    """ASINs of one category ordered by priority (highest first)."""
+    asins = [
+        a["asin"] async for a in db[amz_coll].find({}, {"_id": 0, "asin": 1}).limit(SCHEDULER_SCAN_MAX)
+        if a.get("asin")
+    ]
+    if not asins:
+        return []
+
+    checked = {
+        m.get("key_val"): m.get("checked_at")
+        async for m in db[match_coll].find(
+            {"key_val": {"$in": asins}}, {"_id": 0, "key_val": 1, "checked_at": 1},
+        )
+    }
+    savings = {
+        d.get("asin"): d.get("savings") or 0.0
+        async for d in db[DEALS_COLL].find(
+            {"match_coll": match_coll}, {"_id": 0, "asin": 1, "savings": 1},
+        )
+    }
+    volatility = {
+        v["_id"]: v.get("cv") or 0.0
+        async for v in db[PRICE_HISTORY_COLL].aggregate([
+            {"$match": {
+                "m.s": AMAZON_SRC, "m.a": {"$in": asins},
+                "t": {"$gte": now_utc() - timedelta(days=VOLATILITY_DAYS)},
+            }},
+            {"$group": {"_id": "$m.a", "sd": {"$stdDevPop": "$p"}, "avg": {"$avg": "$p"}}},
+            {"$project": {"cv": {"$cond": [{"$gt": ["$avg", 0]}, {"$divide": ["$sd", "$avg"]}, 0]}}},
+        ])
+    }
+    lookups = {
+        p["_id"]: p.get("n") or 0
+        async for p in db[POPULARITY_COLL].find({"_id": {"$in": asins}}, {"n": 1})
+    }
+
+    now = now_utc()
+    scored = []
+    for asin in asins:
+        p = priority(
+            _age_h(checked.get(asin), now),
+            savings.get(asin, 0.0),
+            volatility.get(asin, 0.0),
+            lookups.get(asin, 0),
+        )
+        if p > 0:
+            scored.append((p, asin))
+    scored.sort(key=lambda x: -x[0])
+    return [asin for _, asin in scored[:SCHEDULER_QUEUE_MAX]]
+
+class RefreshScheduler:
+    def __init__(self, db, categories, index_fn: IndexFn,
+                 interval_s: float = SCHEDULER_INTERVAL_S,
+                 budget_per_hour: int = SCHEDULER_BUDGET_PER_HOUR):
+        self.db = db
+        self.categories = categories
+        self.index_fn = index_fn
+        self.interval_s = interval_s
+        self.budget_per_hour = budget_per_hour
+        self.last_tick: Optional[dict] = None
+        self._task: Optional[asyncio.Task] = None
+        # Refreshed by status(); read by the /metrics collectors
+        self._queue_depth = 0
+        self._budget_used = 0
+        register_collector("scheduler_queue_depth", lambda: self._queue_depth)
+        register_collector("scheduler_budget_used", lambda: self._budget_used)
+
+    def start(self) -> None:
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+
+    async def _run(self):
+        while True:
+            # Jitter so the workers' ticks don't line up on the lease
+            await asyncio.sleep(self.interval_s * random.uniform(0.9, 1.1))
+            try:
+                async with job_lease(self.db, "scheduler") as lease:
+                    if lease.held:
+                        await self.tick()
+            except Exception as e:
+                print("Scheduler tick ERROR:", e)
+
+    # Budget: SerpAPI calls spent per clock hour, shared across workers
+    def _hour_key(self) -> str:
+        return "budget:" + now_utc().strftime("%Y-%m-%dT%H")
+
+    async def budget_used(self) -> int:
+        doc = await self.db[SCHEDULER_COLL].find_one({"_id": self._hour_key()})
+        self._budget_used = (doc or {}).get("used", 0)
+        return self._budget_used
+
+    async def _spend(self, n: int) -> None:
+        await self.db[SCHEDULER_COLL].update_one(
+            {"_id": self._hour_key()},
+            {"$inc": {"used": n}, "$setOnInsert": {"expiresAt": now_utc() + timedelta(days=2)}},
+            upsert=True,
+        )
+        self._budget_used += n
+
+    async def _state(self, cat: dict) -> dict:
+        match_coll = cat["match_coll"]
+        state = await self.db[SCHEDULER_COLL].find_one({"_id": f"queue:{match_coll}"})
+        now = now_utc()
+        built = _age_h(state.get("built_at"), now) if state else None
+        if (
+            state is None
+            or state.get("pos", 0) >= len(state.get("queue") or [])
+            or built is None
+            or built >= SCHEDULER_REQUEUE_H
+        ):
+            queue = await build_queue(self.db, cat["amz_coll"], match_coll)
+            state = {
+                "_id": f"queue:{match_coll}",
+                "match_coll": match_coll,
+                "amz_coll": cat["amz_coll"],
+                "queue": queue,
+                "pos": 0,
+                "built_at": now,
+            }
+            await self.db[SCHEDULER_COLL].update_one({"_id": state["_id"]}, {"$set": state}, upsert=True)
+        return state
+
+    async def tick(self) -> dict:
+        """One scheduling round; returns what was refreshed."""
+        cats = [
+            c async for c in self.categories.find({"amz_coll": {"$exists": True}}, {"_id": 0})
+            if c.get("amz_coll")
+        ]
+        remaining = max(0, self.budget_per_hour - await self.budget_used())
+        result: Dict[str, dict] = {}
+
+        states = [await self._state(c) for c in cats]
+        active = [s for s in states if s["pos"] < len(s["queue"])]
+
+        for i, state in enumerate(active):
+            # Even split of what's left over the categories still to run
+            share = remaining // (len(active) - i) if remaining else 0
+            if share <= 0:
+                break
+            asins = state["queue"][state["pos"]:state["pos"] + share]
+
+            res = await self.index_fn(state["amz_coll"], state["match_coll"], asins)
+            if res is None:
+                result[state["match_coll"]] = {"skipped": "busy"}
+                continue
+
+            # Unreached ASINs move to the end of the slice, which stays
+            # ahead of `pos` for the next tick
+            left = set(res.get("remaining") or ())
+            done = [a for a in asins if a not in left]
+            end = state["pos"] + len(asins)
+            state["queue"][state["pos"]:end] = done + [a for a in asins if a in left]
+
+            spent = res.get("queries", len(done))
+            await self._spend(spent)
+            remaining -= spent
+            state["pos"] += len(done)
+            await self.db[SCHEDULER_COLL].update_one(
+                {"_id": state["_id"]},
+                {"$set": {
+                    "queue": state["queue"], "pos": state["pos"],
+                    "updated_at": now_utc(), "last_result": res,
+                }},
+            )
+            result[state["match_coll"]] = {"refreshed": len(done), **res}
+            if res.get("budget_exhausted"):
+                # SerpAPI budget (quota.py) is out; later categories would fail too
+                break
+
+        self._queue_depth = sum(len(s["queue"]) - s["pos"] for s in states)
+        self.last_tick = {"at": now_utc(), "budget_left": remaining, "categories": result}
+        return self.last_tick
+
+    async def status(self) -> dict:
+        queues = [
+            {
+                "match_coll": s.get("match_coll"),
+                "queue_depth": len(s.get("queue") or []) - s.get("pos", 0),
+                "pos": s.get("pos", 0),
+                "built_at": s.get("built_at"),
+                "updated_at": s.get("updated_at"),
+                "last_result": s.get("last_result"),
+            }
+            async for s in self.db[SCHEDULER_COLL].find({"_id": {"$regex": "^queue:"}})
+        ]
+        self._queue_depth = sum(q["queue_depth"] for q in queues)
+        return {
+            "enabled": self._task is not None,
+            "interval_s": self.interval_s,
+            "budget_per_hour": self.budget_per_hour,
+            "budget_used_this_hour": await self.budget_used(),
+            "queue_depth": self._queue_depth,
+            "queues": queues,
+            "last_tick": self.last_tick,
+        }
@@ -0,0 +1,202 @@
+import os, asyncio, multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+from models import ExtensionFullProduct, ParsedOffer, ScoredDeal, ScoreResult
+from metrics import timed, OFFERS_FILTERED
+import utils
+
+# Pluggable scoring backends for batch indexing
+#
+#   inprocess: utils._score_offers_for_extension on this event loop
+#   process:   the same function in a ProcessPoolExecutor, one warm event
+#              loop per worker process, so RapidFuzz / size parsing / pHash
+#              decode use every core
+#
+# Both run the identical scoring code, so results match exactly. Inputs and
+# outputs cross the process boundary as plain tuples (no field names, no
+# dataclass pickling), and deals come back as indexes into the caller's
+# offer list so the caller's ParsedOffer objects are reused.
+
+SCORING_BACKEND = os.getenv("SCORING_BACKEND", "inprocess")
+# Default: split the cores between the uvicorn workers (WEB_CONCURRENCY),
+# each of which has its own pool
+SCORING_PROCESSES = int(os.getenv(
+    "SCORING_PROCESSES",
+    str(max(1, (os.cpu_count() or 1) // max(1, int(os.getenv("WEB_CONCURRENCY", "1"))))),
+))
+
+# Compact wire forms
+PayloadT = Tuple  # (asin, title, price, brand, thumbnail, image_url)
+OfferT = Tuple    # (merchant, title, price, url, source_domain, thumbnail, brand)
+DealT = Tuple     # (offer_idx, sim, img_sim, combined_sim, savings_abs, savings_pct, img_hash)
+
+# score_many() input: (payload, offers, stored Amazon features or None)
+ScoreItem = Tuple[ExtensionFullProduct, List[ParsedOffer], Optional[dict]]
+
+def pack_payload(p: ExtensionFullProduct) -> PayloadT:
+    return (p.asin, p.title, p.price, p.brand, p.thumbnail, p.image_url)
+
+def unpack_payload(t: PayloadT) -> ExtensionFullProduct:
+    asin, title, price, brand, thumbnail, image_url = t
+    return ExtensionFullProduct(
+        asin=asin, title=title, price=price, brand=brand,
+        thumbnail=thumbnail, image_url=image_url,
+    )
+
+def pack_offers(offers: List[ParsedOffer]) -> List[OfferT]:
+    return [
+        (o.merchant, o.title, o.price, o.url, o.source_domain, o.thumbnail, o.brand)
+        for o in offers
+    ]
+
+def unpack_offers(rows: List[OfferT]) -> List[ParsedOffer]:
+    return [
+        ParsedOffer(
+            merchant=m, title=t, price=p, url=u, source_domain=sd,
+            thumbnail=th, brand=b,
+        )
+        for m, t, p, u, sd, th, b in rows
+    ]
+
+# Worker process side
+_worker_loop: Optional[asyncio.AbstractEventLoop] = None
+
+def _worker_init() -> None:
+    """Runs once per worker process: warm state lives for the pool's lifetime."""
+    global _worker_loop
+    import offload
+    # Already off the main loop: don't hop again to a thread pool
+    offload.CPU_OFFLOAD_THRESHOLD = 1 << 30
+    _worker_loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(_worker_loop)
+    # Touch the regexes / LRU so the first real batch doesn't pay for it
+    utils.analyze_title("warm up 12 oz pack of 2")
+
+def _worker_ping() -> int:
+    return os.getpid()
+
+def _score_batch(batch: List[Tuple[PayloadT, List[OfferT], Optional[dict], int]]) -> List[Tuple[dict, List[DealT], dict, dict]]:
+    out = []
+    for packed_payload, packed_offers, amz_features, top_k in batch:
+        offers = unpack_offers(packed_offers)
+        index = {id(o): i for i, o in enumerate(offers)}
+        result = _worker_loop.run_until_complete(
+            utils._score_offers_for_extension(unpack_payload(packed_payload), offers, top_k, amz_features)
+        )
+        deals = [
+            (index[id(d.offer)], d.sim, d.img_sim, d.combined_sim, d.savings_abs, d.savings_pct, d.img_hash)
+            for d in result.best_deals
+        ]
+        out.append((result.amazon, deals, result.filtered, result.phashes))
+    return out
+
+def _rebuild(amazon: dict, deals: List[DealT], filtered: dict, phashes: dict, offers: List[ParsedOffer]) -> ScoreResult:
+    # Worker processes have their own metrics registry: count here instead
+    for rule, count in filtered.items():
+        if count:
+            OFFERS_FILTERED.inc(count, rule=rule)
+    return ScoreResult(
+        amazon=amazon,
+        best_deals=[
+            ScoredDeal(
+                offer=offers[i], sim=sim, img_sim=img_sim, combined_sim=combined,
+                savings_abs=s_abs, savings_pct=s_pct, img_hash=img_hash,
+            )
+            for i, sim, img_sim, combined, s_abs, s_pct, img_hash in deals
+        ],
+        filtered=filtered,
+        phashes=phashes,
+    )
+
+async def _share_phashes(results: List[ScoreResult]) -> None:
+    """
+    Workers have no Mongo client: their pHashes only live in the worker's
+    L1. Put them in this process's PHASH_CACHE (and so the shared cache).
+    """
+    for r in results:
+        for url, h in r.phashes.items():
+            await utils.PHASH_CACHE.set(url, h)
+
+# Backends
+class InProcessBackend:
+    name = "inprocess"
+    concurrency = 1
+
+    async def score(self, payload: ExtensionFullProduct, offers: List[ParsedOffer], top_k: int = 5,
+                    amz_features: Optional[dict] = None) -> ScoreResult:
+        return await utils._score_offers_for_extension(payload, offers, top_k, amz_features)
+
+    async def score_many(self, items: List[ScoreItem], top_k: int = 5) -> List[ScoreResult]:
+        return [await self.score(p, o, top_k, f) for p, o, f in items]
+
+    async def warm(self) -> None:
+        pass
+
+    def shutdown(self) -> None:
+        pass
+
+class ProcessPoolBackend:
+    name = "process"
+
+    def __init__(self, processes: int = SCORING_PROCESSES):
+        self.concurrency = processes
+        # spawn, not fork: the parent has a running loop, threads and Mongo sockets
+        self._pool = ProcessPoolExecutor(
+            max_workers=processes,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_worker_init,
+        )
+
+    async def _run(self, batch) -> list:
+        loop = asyncio.get_running_loop()
+        with timed("score_pool"):
+            return await loop.run_in_executor(self._pool, _score_batch, batch)
+
+    async def score(self, payload: ExtensionFullProduct, offers: List[ParsedOffer], top_k: int = 5,
+                    amz_features: Optional[dict] = None) -> ScoreResult:
+        [(amazon, deals, filtered, phashes)] = await self._run([(pack_payload(payload), pack_offers(offers), amz_features, top_k)])
+        result = _rebuild(amazon, deals, filtered, phashes, offers)
+        await _share_phashes([result])
+        return result
+
+    async def score_many(self, items: List[ScoreItem], top_k: int = 5) -> List[ScoreResult]:
+        """Shard items across workers (contiguous chunks); results keep input order."""
+        if not items:
+            return []
+        n = min(self.concurrency, len(items))
+        size = -(-len(items) // n)
+        chunks = [items[i:i + size] for i in range(0, len(items), size)]
+
+        parts = await asyncio.gather(*(
+            self._run([(pack_payload(p), pack_offers(o), f, top_k) for p, o, f in chunk])
+            for chunk in chunks
+        ))
+
+        results = []
+        for chunk, part in zip(chunks, parts):
+            for (_, offers, _), (amazon, deals, filtered, phashes) in zip(chunk, part):
+                results.append(_rebuild(amazon, deals, filtered, phashes, offers))
+        await _share_phashes(results)
+        return results
+
+    async def warm(self) -> None:
+        """Spawn every worker now (imports + _worker_init) instead of on first batch."""
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(
+            loop.run_in_executor(self._pool, _worker_ping) for _ in range(self.concurrency)
+        ))
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+_backend = None
+
+def get_scoring_backend():
+    """Process-wide backend chosen by SCORING_BACKEND (created lazily)."""
+    global _backend
+    if _backend is None:
+        if SCORING_BACKEND == "process":
+            _backend = ProcessPoolBackend()
+        else:
+            _backend = InProcessBackend()
+    return _backend
@@ -1,13 +1,23 @@
-import os, httpx, asyncio, random, difflib
+import os, math, httpx, asyncio, random
 from typing import Optional, List
 from fastapi import HTTPException
-from utils import parse_price, extract_price_from_text
-from models import Offer
+from rapidfuzz import fuzz, process
+from utils import parse_price, extract_price_from_text, norm
+from cache import SharedCache
+from models import ParsedOffer
+from cassettes import record_serp
+from metrics import timed_async, SERPAPI_CALLS, SERPAPI_RETRIES
+from quota import check_budget, record_billed, record_retry, record_saved, set_serp_job
 
 # Load API key from environment
 SERPAPI_KEY = os.getenv("SERPAPI_KEY")
 
+# Point at benchmarks/serp_replay.py for offline runs
+SERPAPI_BASE_URL = os.getenv("SERPAPI_BASE_URL", "https://serpapi.com").rstrip("/")
+SERPAPI_SEARCH_URL = f"{SERPAPI_BASE_URL}/search.json"
+
 # Core SerpAPI Request Helper
+@timed_async("serpapi")
 async def serp_get(url: str, q: dict):
     """
     Wrapper around SerpAPI HTTP GET.
@@ -17,6 +27,9 @@ async def serp_get(url: str, q: dict):
       - Retries on 429 with exponential backoff
       - Retries on network errors/timeouts
       - Raises HTTPException on fatal errors
+      - Records latency (stage "serpapi"), attempts and retries in metrics
+      - Enforces SerpAPI budgets and accounts billed calls (quota.py)
+      - Saves responses to the cassette corpus when SERP_RECORD_DIR is set
     """
     if not SERPAPI_KEY:
         raise HTTPException(500, "SERPAPI_KEY not set")
@@ -24,6 +37,11 @@ async def serp_get(url: str, q: dict):
     # Inject API key + no cache
     q = {**q, "api_key": SERPAPI_KEY, "no_cache": "true"}
 
+    engine = q.get("engine") or "unknown"
+
+    # Refuses (or paces batch work) before spending a search
+    await check_budget(engine)
+
     # API calls can be slow, increase timeout
     timeout = httpx.Timeout(connect=20.0, read=45.0, write=20.0, pool=20.0)
 
@@ -34,6 +52,7 @@ async def serp_get(url: str, q: dict):
         for attempt in range(5):
             try:
                 r = await c.get(url, params=q)
+                SERPAPI_CALLS.inc(engine=engine, status=r.status_code)
 
                 # Error handling
                 if r.status_code >= 400:
@@ -45,23 +64,34 @@ async def serp_get(url: str, q: dict):
 
                     # Handle rate limit with retry
                     if r.status_code == 429 and attempt < 4:
+                        SERPAPI_RETRIES.inc(engine=engine, reason="429")
+                        await record_retry(engine)
                         await asyncio.sleep(1.5 * (2 ** attempt) + random.random())
                         continue
 
                     raise HTTPException(r.status_code, detail)
 
-                return r.json()
+                data = r.json()
+                await record_billed(engine)
+                record_serp(q, data)
+                return data
 
             except httpx.ReadTimeout as e:
                 last_err = e
+                SERPAPI_CALLS.inc(engine=engine, status="timeout")
                 if attempt < 4:
+                    SERPAPI_RETRIES.inc(engine=engine, reason="timeout")
+                    await record_retry(engine)
                     await asyncio.sleep(0.8 * (2 ** attempt) + random.random())
                     continue
                 raise HTTPException(504, "SerpAPI request timed out")
 
             except (httpx.ConnectError, httpx.RemoteProtocolError) as e:
                 last_err = e
+                SERPAPI_CALLS.inc(engine=engine, status="network_error")
                 if attempt < 4:
+                    SERPAPI_RETRIES.inc(engine=engine, reason="network")
+                    await record_retry(engine)
                     await asyncio.sleep(0.6 * (2 ** attempt) + random.random())
                     continue
                 raise HTTPException(502, "Network error calling SerpAPI")
@@ -69,10 +99,10 @@ async def serp_get(url: str, q: dict):
         raise HTTPException(502, str(last_err) or "Unknown SerpAPI error")
 
 # Google Shopping Provider
-async def provider_google_shopping(query: str) -> List[Offer]:
+async def provider_google_shopping(query: str) -> List[ParsedOffer]:
     """
     Fetch Google Shopping results for a given query.
-    Returns a list of Offer dicts with:
+    Returns a list of ParsedOffer objects with:
       - title
       - price
       - thumbnail
@@ -80,7 +110,7 @@ async def provider_google_shopping(query: str) -> List[Offer]:
       - url
     """
     data = await serp_get(
-        "https://serpapi.com/search.json",
+        SERPAPI_SEARCH_URL,
         {
             "engine": "google_shopping",
             "q": query,
@@ -91,7 +121,7 @@ async def provider_google_shopping(query: str) -> List[Offer]:
     )
 
     results = data.get("shopping_results") or []
-    offers: List[Offer] = []
+    offers: List[ParsedOffer] = []
 
     print("Google Shopping results:", len(results))
 
@@ -108,7 +138,7 @@ async def provider_google_shopping(query: str) -> List[Offer]:
             source_domain = src
 
         offers.append(
-            Offer(
+            ParsedOffer(
                 merchant="google_shopping",
                 source_domain=source_domain,
                 title=r.get("title") or "",
@@ -122,6 +152,70 @@ async def provider_google_shopping(query: str) -> List[Offer]:
     return offers
 
 # Google Search Provider (for link resolution)
+def _price_sim(found: Optional[float], expected: Optional[float]) -> float:
+    if not expected or not found:
+        return 0.0
+    diff_pct = abs(found - expected) / max(expected, 1)
+    return max(0.0, 1 - diff_pct)
+
+# Minimum combined score for pick_merchant_link. fuzz.ratio (Indel) is never
+# below the old difflib ratio (equal on most title pairs, higher on short or
+# reordered ones), so keeping 0.40 accepted more same-brand wrong products.
+# On the sample titles in tests/test_services.py, 0.42 misses no more real
+# matches than difflib did at 0.40; 0.43 starts dropping them.
+MERCHANT_LINK_MIN_SCORE = 0.42
+
+def _title_sims(titles: List[str], expected_title_norm: str) -> List[float]:
+    """Normalized Indel similarity (0..1) of every title, in one batch."""
+    if not titles:
+        return []
+    return (process.cdist([expected_title_norm], titles, scorer=fuzz.ratio)[0] / 100.0).tolist()
+
+def pick_merchant_link(data: dict, domain: str, expected_title: str = "",
+                       expected_price: float = None) -> Optional[str]:
+    """
+    Best product link on `domain` from a Google search response:
+      1. Google Shopping results (title 75% / price 25%)
+      2. Organic results fallback (title 70% / price 30%)
+    None unless the best score reaches MERCHANT_LINK_MIN_SCORE.
+    """
+    expected_title_norm = expected_title.lower().strip()
+
+    best_score = -1
+    best_link = None
+
+    # Pass 1: Google Shopping (stronger domain requirement: on the source)
+    shopping = [
+        r for r in data.get("shopping_results") or []
+        if r.get("link") and domain in (r.get("source") or "").lower()
+    ]
+    sims = _title_sims([(r.get("title") or "").lower() for r in shopping], expected_title_norm)
+    for r, title_sim in zip(shopping, sims):
+        price = parse_price(r.get("extracted_price") or r.get("price"))
+        score = (title_sim * 0.75) + (_price_sim(price, expected_price) * 0.25)
+        if score > best_score:
+            best_score = score
+            best_link = r["link"]
+
+    if best_link and best_score >= MERCHANT_LINK_MIN_SCORE:
+        return best_link
+
+    # Pass 2: Organic results fallback
+    organic = [
+        r for r in data.get("organic_results") or []
+        if r.get("link") and domain in r["link"].lower()
+    ]
+    titles = [(r.get("title") or "").lower() for r in organic]
+    sims = _title_sims(titles, expected_title_norm)
+    for r, title, title_sim in zip(organic, titles, sims):
+        found_price = extract_price_from_text(title + " " + r.get("snippet", ""))
+        score = (title_sim * 0.70) + (_price_sim(found_price, expected_price) * 0.30)
+        if score > best_score:
+            best_score = score
+            best_link = r["link"]
+
+    return best_link if best_score >= MERCHANT_LINK_MIN_SCORE else None
+
 async def provider_google_search(
     query: str,
     expected_title: str = "",
@@ -135,7 +229,7 @@ async def provider_google_search(
     """
 
     data = await serp_get(
-        "https://serpapi.com/search.json",
+        SERPAPI_SEARCH_URL,
         {
             "engine": "google",
             "q": query,
@@ -145,74 +239,85 @@ async def provider_google_search(
     )
 
     domain = query.split(" ")[0].lower()
-    expected_title_norm = expected_title.lower().strip()
-
-    shopping = data.get("shopping_results") or []
-
-    best_score = -1
-    best_link = None
-
-    # Pass 1: Google Shopping
-    for r in shopping:
-        link = r.get("link")
-        title = (r.get("title") or "").lower()
-        price = parse_price(r.get("extracted_price") or r.get("price"))
-        source = (r.get("source") or "").lower()
-
-        if not link:
-            continue
-
-        # Stronger domain requirement
-        if domain not in source:
-            continue
-
-        title_sim = difflib.SequenceMatcher(None, title, expected_title_norm).ratio()
-
-        price_sim = 0
-        if expected_price and price:
-            diff_pct = abs(price - expected_price) / max(expected_price, 1)
-            price_sim = max(0, 1 - diff_pct)
-
-        score = (title_sim * 0.75) + (price_sim * 0.25)
-
-        if score > best_score:
-            best_score = score
-            best_link = link
-
-    if best_link and best_score >= 0.40:
-        return best_link
-
-    # Pass 2: Organic results fallback
-    organic = data.get("organic_results") or []
-
-    for r in organic:
-        link = r.get("link")
-        title = (r.get("title") or "").lower()
-        snippet = r.get("snippet", "")
-
-        if not link:
-            continue
-
-        if domain not in link.lower():
-            continue
-
-        title_sim = difflib.SequenceMatcher(None, title, expected_title_norm).ratio()
-
-        found_price = extract_price_from_text(title + " " + snippet)
-        price_sim = 0
-
-        if expected_price and found_price:
-            diff_pct = abs(found_price - expected_price) / max(expected_price, 1)
-            price_sim = max(0, 1 - diff_pct)
-
-        score = (title_sim * 0.70) + (price_sim * 0.30)
-
-        if score > best_score:
-            best_score = score
-            best_link = link
-
-    return best_link if best_score >= 0.40 else None
-
+    return pick_merchant_link(data, domain, expected_title, expected_price)
+
+# Merchant URL resolution (cached)
+#
+# Keyed by (domain, normalized title, 10% price band) in a SharedCache, so
+# repeat SAVE clicks and other users' clicks on the same deal are free.
+# "Not found" is cached too, for a shorter time. preresolve_merchant_url()
+# warms the cache in the background for deals shown in the extension;
+# a SAVE arriving mid-flight awaits that lookup instead of repeating it.
+
+RESOLVE_CACHE_TTL_S = float(os.getenv("RESOLVE_CACHE_TTL_S", str(3 * 24 * 3600)))
+RESOLVE_MISS_TTL_S = float(os.getenv("RESOLVE_MISS_TTL_S", str(6 * 3600)))
+RESOLVE_CACHE = SharedCache("resolve", RESOLVE_CACHE_TTL_S)
+# How many of the deals returned by /extension/find-deals to pre-resolve.
+# Each one is a billed SerpAPI search whether or not the user clicks SAVE,
+# so this is opt-in.
+PRERESOLVE_TOP_N = int(os.getenv("PRERESOLVE_TOP_N", "0"))
+
+# key -> in-flight resolution task
+_resolving: dict = {}
+
+def resolve_key(source_domain: str, title: str, expected_price: Optional[float]) -> str:
+    band = round(math.log(expected_price) / math.log(1.1)) if expected_price and expected_price > 0 else "na"
+    return f"{source_domain.lower()}|{norm(title)}|{band}"
+
+async def _resolve_uncached(key: str, source_domain: str, title: str, expected_price: Optional[float]) -> Optional[str]:
+    url = await provider_google_search(
+        f"{source_domain} {title}",
+        expected_title=title,
+        expected_price=expected_price,
+    )
+    # "" marks a cached miss
+    await RESOLVE_CACHE.set(key, url or "", None if url else RESOLVE_MISS_TTL_S)
+    return url
+
+async def resolve_merchant_url_cached(source_domain: str, title: str,
+                                      expected_price: Optional[float] = None) -> Optional[str]:
+    key = resolve_key(source_domain, title, expected_price)
+    cached = await RESOLVE_CACHE.get(key)
+    if cached is not None:
+        await record_saved("google", "resolve_cache")
+        return cached or None
+
+    task = _resolving.get(key)
+    if task is not None:
+        url = await asyncio.shield(task)
+        # A failed pre-resolve (e.g. batch budget refused) caches nothing
+        if url or await RESOLVE_CACHE.get(key) is not None:
+            await record_saved("google", "resolve_inflight")
+            return url
+
+    task = asyncio.ensure_future(_resolve_uncached(key, source_domain, title, expected_price))
+    _resolving[key] = task
+    task.add_done_callback(lambda t: _resolving.pop(key, None) if _resolving.get(key) is t else None)
+    return await asyncio.shield(task)
+
+def preresolve_merchant_url(source_domain: Optional[str], title: Optional[str],
+                            expected_price: Optional[float] = None) -> None:
+    """Fire-and-forget cache warm-up (batch priority for SerpAPI budgets)."""
+    if not source_domain or not title:
+        return
+    key = resolve_key(source_domain, title, expected_price)
+    if key in _resolving:
+        return
+
+    async def run():
+        set_serp_job("preresolve")
+        try:
+            cached = await RESOLVE_CACHE.get(key)
+            if cached is not None:
+                return cached or None
+            return await _resolve_uncached(key, source_domain, title, expected_price)
+        except Exception as e:
+            print("Pre-resolve ERROR:", e)
+            return None
+
+    task = asyncio.ensure_future(run())
+    _resolving[key] = task
+    task.add_done_callback(lambda t: _resolving.pop(key, None) if _resolving.get(key) is t else None)
 
 # Amazon SERP Provider
 async def amazon_search_page(query: str, page: int = 1):
@@ -221,7 +326,7 @@ async def amazon_search_page(query: str, page: int = 1):
     """
 
     return await serp_get(
-        "https://serpapi.com/search.json",
+        SERPAPI_SEARCH_URL,
         {
             "engine": "amazon",
             "amazon_domain": "amazon.com",
@@ -0,0 +1,121 @@
+import os, sys
+import mongomock
+import pytest
+
+# Service modules are flat (import utils, import main), as in the image
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Async facade over mongomock, shaped like the Motor calls the service makes.
+# Sessions are accepted and ignored (a single in-memory "server").
+
+class AsyncCursor:
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self._it = None
+
+    def sort(self, key, direction=None):
+        self._cursor = self._cursor.sort(key, direction) if direction is not None else self._cursor.sort(key)
+        return self
+
+    def limit(self, n):
+        self._cursor = self._cursor.limit(n)
+        return self
+
+    def skip(self, n):
+        self._cursor = self._cursor.skip(n)
+        return self
+
+    def batch_size(self, n):
+        return self
+
+    async def to_list(self, length=None):
+        out = []
+        for doc in self._cursor:
+            out.append(doc)
+            if length is not None and len(out) >= length:
+                break
+        return out
+
+    def __aiter__(self):
+        self._it = iter(self._cursor)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._it)
+        except StopIteration:
+            raise StopAsyncIteration
+
+class AsyncCollection:
+    def __init__(self, coll):
+        self._coll = coll
+        self.name = coll.name
+
+    def find(self, *args, session=None, **kwargs):
+        return AsyncCursor(self._coll.find(*args, **kwargs))
+
+    def aggregate(self, pipeline, session=None, **kwargs):
+        return AsyncCursor(iter(self._coll.aggregate(pipeline)))
+
+    def __getattr__(self, name):
+        method = getattr(self._coll, name)
+
+        async def call(*args, session=None, **kwargs):
+            return method(*args, **kwargs)
+        return call
+
+class AsyncDB:
+    def __init__(self):
+        self._db = mongomock.MongoClient().db
+        # name -> create_collection options (mongomock rejects time-series)
+        self.options = {}
+
+    def __getitem__(self, name):
+        return AsyncCollection(self._db[name])
+
+    def get_collection(self, name, **kwargs):
+        return self[name]
+
+    async def create_collection(self, name, **options):
+        self._db.create_collection(name)
+        self.options[name] = options
+        return self[name]
+
+    async def list_collections(self, filter=None):
+        infos = []
+        for name in self._db.list_collection_names():
+            if filter and filter.get("name") not in (None, name):
+                continue
+            kind = "timeseries" if "timeseries" in self.options.get(name, {}) else "collection"
+            infos.append({"name": name, "type": kind, "options": self.options.get(name, {})})
+        return AsyncCursor(iter(infos))
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+@pytest.fixture
+def mdb():
+    return AsyncDB()
+
+@pytest.fixture
+async def api(mdb, monkeypatch):
+    """HTTP client for main.app on `mdb` (no lifespan: no Motor, no warm-up)."""
+    import httpx
+    import cache, main, responses
+    from deals_view import DEALS_COLL
+
+    for name in ("db", "bulk_db"):
+        monkeypatch.setattr(main, name, mdb)
+    monkeypatch.setattr(main, "DEALS_READ", mdb[DEALS_COLL])
+    monkeypatch.setattr(main, "DEALS_VERSIONS_READ", None)
+    monkeypatch.setattr(main, "CATEGORIES", mdb["categories"])
+    monkeypatch.setattr(main, "_deals_views_built", set())
+    monkeypatch.setattr(cache, "_versions", {})
+    monkeypatch.setattr(responses, "RESPONSE_CACHE", responses.ResponseCache())
+    cache.init_shared_cache(mdb)
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        yield client
+    cache.init_shared_cache(None)
@@ -0,0 +1,86 @@
+import random
+import pytest
+from deals_view import DEALS_COLL, rebuild_deals, sync_deal
+from utils import merge_sorted_desc
+
+pytestmark = pytest.mark.anyio
+
+COLLS = ["match_a", "match_b", "match_c"]
+
+async def _seed(mdb, n=60, seed=3):
+    """MATCH docs with many tied savings across and within categories."""
+    rnd = random.Random(seed)
+    for i in range(n):
+        coll = rnd.choice(COLLS)
+        savings = rnd.choice([5.0, 10.0, 12.5, 20.0, 1.0])  # 1.0: not a deal
+        m = {
+            "key_val": f"B{i:04d}", "match_found": True,
+            "amazon": {"asin": f"B{i:04d}", "price": 100.0},
+            "offers": [{"title": "x", "price": 100.0 - savings}],
+        }
+        await mdb[coll].insert_one(m)
+        await sync_deal(mdb, coll, m)
+    for c in COLLS:
+        await mdb["categories"].insert_one({"match_coll": c})
+
+async def _brute_force(mdb, colls):
+    rows = await mdb[DEALS_COLL].find({"match_coll": {"$in": colls}}).to_list(None)
+    rows.sort(key=lambda r: (-r["savings"], r["match_coll"], r["asin"]))
+    return [(r["match_coll"], r["asin"]) for r in rows]
+
+async def _page_all(api, limit, params=()):
+    seen, cursor = [], None
+    while True:
+        q = [*params, ("limit", limit)] + ([("cursor", cursor)] if cursor else [])
+        body = (await api.get("/deals/feed", params=q)).json()
+        assert body["count"] <= limit
+        seen += [(d["match_coll"], d["amazon"]["asin"]) for d in body["deals"]]
+        cursor = body["next"]
+        if cursor is None:
+            return seen
+
+@pytest.mark.parametrize("limit", [1, 7, 13, 500])
+async def test_feed_pages_equal_brute_force_sort(api, mdb, limit):
+    await _seed(mdb)
+    expected = await _brute_force(mdb, COLLS)
+    assert len(expected) > 30
+    assert await _page_all(api, limit) == expected
+
+async def test_feed_subset_of_categories(api, mdb):
+    await _seed(mdb)
+    params = [("match_coll", "match_c"), ("match_coll", "match_a")]
+    assert await _page_all(api, 5, params) == await _brute_force(mdb, ["match_a", "match_c"])
+
+async def test_feed_rejects_bad_cursor(api, mdb):
+    await _seed(mdb, n=5)
+    res = await api.get("/deals/feed", params={"cursor": "bm90IGpzb24"})
+    assert res.status_code == 400
+
+async def test_rebuild_reports_no_drift_after_sync(mdb):
+    await _seed(mdb)
+    for c in COLLS:
+        result = await rebuild_deals(mdb, c)
+        assert (result["drifted"], result["missing"], result["stale"]) == (0, 0, 0)
+
+class _Source:
+    def __init__(self, items):
+        self.items = items
+        self.pulled = 0
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.pulled == len(self.items):
+            raise StopAsyncIteration
+        self.pulled += 1
+        return self.items[self.pulled - 1]
+
+async def test_merge_sorted_desc_stops_at_k():
+    rnd = random.Random(5)
+    lists = [sorted((rnd.randint(0, 20) for _ in range(30)), reverse=True) for _ in range(4)]
+    sources = [_Source(l) for l in lists]
+    merged = [x async for x in merge_sorted_desc(sources, key=lambda x: x, k=25)]
+    assert merged == sorted((x for l in lists for x in l), reverse=True)[:25]
+    # At most one item per source read past what was emitted
+    assert sum(s.pulled for s in sources) <= 25 + len(sources)
@@ -0,0 +1,43 @@
+import asyncio
+from datetime import timedelta
+import pytest
+from jobs import JOB_LEASES_COLL, Lease, _now, job_lease
+
+pytestmark = pytest.mark.anyio
+
+async def _expire(mdb, job_id):
+    await mdb[JOB_LEASES_COLL].update_one({"_id": job_id}, {"$set": {"expiresAt": _now() - timedelta(seconds=1)}})
+
+async def test_held_lease_blocks_second_acquire(mdb):
+    async with job_lease(mdb, "index:x") as first:
+        async with job_lease(mdb, "index:x") as second:
+            assert first.held and not second.held
+    assert await mdb[JOB_LEASES_COLL].find_one({"_id": "index:x"}) is None
+
+async def test_stale_lease_cannot_release_new_holder(mdb):
+    old = Lease(mdb, "index:x")
+    assert await old.acquire()
+    await _expire(mdb, "index:x")
+
+    new = Lease(mdb, "index:x")
+    assert await new.acquire()
+    # Same process, same job: only the token tells the two apart
+    await old.release()
+
+    doc = await mdb[JOB_LEASES_COLL].find_one({"_id": "index:x"})
+    assert doc is not None and doc["token"] == new.token
+    await new.release()
+
+async def test_stale_lease_renewal_marks_lost(mdb):
+    old = Lease(mdb, "index:x", ttl_s=0.15)
+    assert await old.acquire()
+    await _expire(mdb, "index:x")
+    new = Lease(mdb, "index:x", ttl_s=60)
+    assert await new.acquire()
+
+    await asyncio.sleep(0.2)
+    assert old.lost and not new.lost
+    doc = await mdb[JOB_LEASES_COLL].find_one({"_id": "index:x"})
+    assert doc["token"] == new.token
+    await old.release()
+    await new.release()
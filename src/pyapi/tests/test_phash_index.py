@@ -0,0 +1,69 @@
+import random
+import pytest
+from clustering import hamming
+from phash_index import (
+    MAX_DISTANCE, SEGMENT_BITS, SEGMENTS, index_phash, near_phashes, segments, within_radius,
+)
+
+pytestmark = pytest.mark.anyio
+
+def _hex(h):
+    return f"{h:016x}"
+
+def _flip(h, rnd, per_segment):
+    """Flip `per_segment[i]` distinct bits inside segment i."""
+    for i, n in enumerate(per_segment):
+        for b in rnd.sample(range(SEGMENT_BITS), n):
+            h ^= 1 << (SEGMENT_BITS * i + b)
+    return h
+
+def test_segments_and_radius():
+    h = random.Random(1).getrandbits(64)
+    assert sum(s << (SEGMENT_BITS * i) for i, s in enumerate(segments(h))) == h
+    assert [len(within_radius(0, r)) for r in range(4)] == [1, 17, 137, 697]
+    vals = within_radius(0xBEEF, 2)
+    assert len(set(vals)) == len(vals) and all(hamming(v, 0xBEEF) <= 2 for v in vals)
+
+async def test_search_matches_brute_force(mdb):
+    rnd = random.Random(11)
+    query = rnd.getrandbits(64)
+    hashes = [rnd.getrandbits(64) for _ in range(150)]
+    # Planted neighbours, including the pigeonhole worst case: bits spread
+    # evenly so no segment is closer than floor(d / SEGMENTS)
+    for d in range(MAX_DISTANCE + 3):
+        even = [d // SEGMENTS + (1 if i < d % SEGMENTS else 0) for i in range(SEGMENTS)]
+        hashes.append(_flip(query, rnd, even))
+        lumped = [min(d, SEGMENT_BITS)] + [0] * (SEGMENTS - 1)
+        hashes.append(_flip(query, rnd, lumped))
+    for i, h in enumerate(hashes):
+        await index_phash(mdb, "offer" if i % 2 else "amazon", f"r{i}", _hex(h), {"i": i})
+
+    for distance in range(MAX_DISTANCE + 1):
+        got = await near_phashes(mdb, _hex(query), distance=distance, limit=1000)
+        expected = sorted(
+            (hamming(query, h), "offer" if i % 2 else "amazon", f"r{i}")
+            for i, h in enumerate(hashes) if hamming(query, h) <= distance
+        )
+        assert [(g["distance"], g["kind"], g["ref"]) for g in got] == expected
+
+    offers = await near_phashes(mdb, _hex(query), distance=8, kind="offer", limit=3)
+    assert len(offers) == 3 and all(o["kind"] == "offer" for o in offers)
+    assert [o["distance"] for o in offers] == sorted(o["distance"] for o in offers)
+
+async def test_distance_is_capped_and_bad_input_ignored(mdb):
+    rnd = random.Random(2)
+    q = rnd.getrandbits(64)
+    far = _flip(q, rnd, [4, 4, 4, 4])  # 16 bits away
+    assert await index_phash(mdb, "offer", "far", _hex(far))
+    assert not await index_phash(mdb, "offer", "bad", "not-hex")
+    assert not await index_phash(mdb, "offer", None, _hex(q))
+    assert await near_phashes(mdb, _hex(q), distance=64) == []
+    assert await near_phashes(mdb, "zz") == []
+
+async def test_reindex_replaces_hash(mdb):
+    rnd = random.Random(4)
+    q = rnd.getrandbits(64)
+    await index_phash(mdb, "offer", "u", _hex(q ^ 0xFFFF_FFFF))
+    await index_phash(mdb, "offer", "u", _hex(q ^ 1), {"price": 9.5})
+    got = await near_phashes(mdb, _hex(q), distance=4)
+    assert [(g["ref"], g["distance"], g["meta"]) for g in got] == [("u", 1, {"price": 9.5})]
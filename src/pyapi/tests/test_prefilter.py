@@ -0,0 +1,37 @@
+import pytest
+from models import ExtensionFullProduct, ParsedOffer
+from utils import _score_offers_for_extension, prefilter_offers
+
+def _o(title, price, url=None, domain="a.com"):
+    return ParsedOffer(merchant=domain, title=title, price=price, url=url, source_domain=domain)
+
+def test_rules_and_order():
+    offers = [
+        _o("Mouse", 15.0, "u1"),
+        _o("Mouse (copy)", 14.0, "u1"),          # same URL
+        _o(" mouse ", 15.0, None, "A.com"),      # same domain + title + price
+        _o("Mouse", 15.0, None, "b.com"),        # other domain: kept
+        _o("Mouse", 16.0, "u2"),                 # other price: kept
+        _o("Mouse feet", 1.5, "u3"),             # below 10% of 20
+        _o("Mouse 10 pack", 40.0, "u4"),         # above 20 / 0.6
+    ]
+    kept, removed = prefilter_offers(offers, 20.0)
+    assert kept == [offers[0], offers[3], offers[4]]
+    assert removed == {"duplicate_url": 1, "duplicate_listing": 1, "price_low": 1, "price_high": 1}
+
+def test_no_price_band_without_amazon_price():
+    offers = [_o("Mouse", 0.5, "u1"), _o("Mouse", 500.0, "u2")]
+    kept, removed = prefilter_offers(offers, 0.0)
+    assert kept == offers and sum(removed.values()) == 0
+
+@pytest.mark.anyio
+async def test_scoring_reports_prefilter_counts():
+    payload = ExtensionFullProduct(asin="B0M185", title="Logitech M185 Wireless Mouse Gray", price=24.99)
+    offers = [
+        _o("Logitech M185 Wireless Mouse Gray", 14.99, "https://target.com/m185", "target.com"),
+        _o("Logitech M185 Wireless Mouse Gray", 14.99, "https://target.com/m185", "target.com"),
+        _o("Logitech M185 Wireless Mouse Gray", 0.99, "https://x.com/1", "x.com"),
+    ]
+    result = await _score_offers_for_extension(payload, offers)
+    assert [d.offer.url for d in result.best_deals] == ["https://target.com/m185"]
+    assert result.filtered["duplicate_url"] == 1 and result.filtered["price_low"] == 1
@@ -0,0 +1,58 @@
+import pytest
+import price_history
+from models import ExtensionFullProduct, ParsedOffer, ScoredDeal, ScoreResult
+from price_history import PRICE_HISTORY_COLL, PriceRecorder, ensure_price_history
+
+pytestmark = pytest.mark.anyio
+
+@pytest.fixture(autouse=True)
+def not_ready(monkeypatch):
+    monkeypatch.setattr(price_history, "_ready", False)
+
+async def test_first_flush_creates_time_series(mdb):
+    async with PriceRecorder(mdb) as prices:
+        prices.add("B01", "amazon", "19.99")
+        prices.add("B01", None, 5.0)
+        prices.add(None, "amazon", 5.0)
+        prices.add("B01", "target.com", None)
+    assert prices.written == 1
+    assert mdb.options[PRICE_HISTORY_COLL]["timeseries"] == {"timeField": "t", "metaField": "m", "granularity": "hours"}
+    doc = await mdb[PRICE_HISTORY_COLL].find_one({})
+    assert doc["m"] == {"a": "B01", "s": "amazon"} and doc["p"] == 19.99
+
+async def test_plain_collection_is_left_alone(mdb, capsys):
+    await mdb[PRICE_HISTORY_COLL].insert_one({"x": 1})
+    await ensure_price_history(mdb)
+    assert "not a time-series collection" in capsys.readouterr().out
+    assert PRICE_HISTORY_COLL not in mdb.options
+
+async def test_writes_in_batches(mdb):
+    prices = PriceRecorder(mdb, batch_size=3)
+    for i in range(7):
+        prices.add(f"B{i}", "amazon", i + 1)
+        await prices.maybe_flush()
+    assert prices.written == 6 and len(prices.points) == 1
+    await prices.flush()
+    assert await mdb[PRICE_HISTORY_COLL].count_documents({}) == 7
+
+def _deal(domain, price, merchant="m"):
+    return ScoredDeal(ParsedOffer(merchant=merchant, title="t", price=price, source_domain=domain),
+                      sim=0.9, img_sim=0.0, combined_sim=0.9, savings_abs=1.0, savings_pct=0.1)
+
+class _Backend:
+    def __init__(self, deals):
+        self.deals = deals
+
+    async def score(self, payload, offers, top_k, amz_features=None):
+        return ScoreResult(amazon={}, best_deals=self.deals)
+
+async def test_matched_offers_recorded_per_source(api, mdb):
+    from main import _score_and_store
+    deals = [_deal("target.com", 12.0), _deal("target.com", 10.0), _deal(None, 11.0, merchant="Shop"),
+             _deal("walmart.com", 15.0)]
+    payload = ExtensionFullProduct(asin="B0X", title="t", price=20.0)
+    async with PriceRecorder(mdb) as prices:
+        await _score_and_store(_Backend(deals), mdb["match_x"], {"title": "t", "price": 20.0}, payload,
+                               [], top_k=5, prices=prices)
+    got = {d["m"]["s"]: d["p"] async for d in mdb[PRICE_HISTORY_COLL].find({"m.a": "B0X"})}
+    assert got == {"target.com": 10.0, "Shop": 11.0, "walmart.com": 15.0}
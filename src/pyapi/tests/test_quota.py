@@ -0,0 +1,70 @@
+import pytest
+import quota
+from quota import (
+    SERP_USAGE_COLL, SerpBudgetExceeded, check_budget, init_quota, record_billed,
+    record_retry, record_saved, set_serp_endpoint, set_serp_job, usage_report,
+)
+
+pytestmark = pytest.mark.anyio
+
+@pytest.fixture
+def usage(mdb, monkeypatch):
+    monkeypatch.setattr(quota, "SERPAPI_DAILY_BUDGET", 10)
+    monkeypatch.setattr(quota, "SERPAPI_MONTHLY_BUDGET", 0)
+    monkeypatch.setattr(quota, "SERPAPI_BATCH_SHARE", 0.8)
+    # No pacing: these tests are about refusal and counts
+    monkeypatch.setattr(quota, "SERPAPI_BATCH_THROTTLE", 1.0)
+    monkeypatch.setattr(quota, "USAGE_REFRESH_S", 0.0)
+    monkeypatch.setattr(quota, "_usage", {})
+    init_quota(mdb)
+    yield mdb[SERP_USAGE_COLL]
+    init_quota(None)
+
+async def _spend(n):
+    for _ in range(n):
+        await check_budget("google")
+        await record_billed("google")
+
+async def test_batch_refused_before_interactive(usage):
+    set_serp_job("index:x")
+    await _spend(8)
+    with pytest.raises(SerpBudgetExceeded) as e:
+        await check_budget("google")
+    assert e.value.status_code == 429 and "batch" in e.value.detail
+
+    set_serp_endpoint("/extension/find-deals")
+    await _spend(2)
+    with pytest.raises(SerpBudgetExceeded) as e:
+        await check_budget("google")
+    assert "interactive" in e.value.detail and "(10/10)" in e.value.detail
+
+async def test_usage_shared_through_mongo(usage):
+    # Another worker spent the batch allowance
+    day = quota._periods(quota.datetime.now(quota.timezone.utc))[0][0]
+    await usage.update_one({"_id": day}, {"$inc": {"billed": 8}}, upsert=True)
+    set_serp_job("scrape")
+    with pytest.raises(SerpBudgetExceeded):
+        await check_budget("google")
+
+async def test_accounting_fields(usage):
+    set_serp_endpoint("/extension/find-deals")
+    await record_billed("google_shopping")
+    set_serp_job("index:B0.1$", batch=True)
+    await record_billed("google")
+    await record_retry("google")
+    await record_saved("google", "resolve", n=3)
+
+    docs = await usage.find({}).to_list(None)
+    assert sorted(d["_id"].split(":")[0] for d in docs) == ["day", "month"]
+    for d in docs:
+        assert d["billed"] == 2 and d["interactive"] == 1 and d["batch"] == 1
+        assert d["engine"] == {"google_shopping": 1, "google": 1}
+        assert d["endpoint"] == {"/extension/find-deals": 2}
+        assert d["job"] == {"index:B0_1_": 1}
+        assert d["retries"] == 1 and d["retries_by_engine"] == {"google": 1}
+        assert d["saved"] == 3 and d["saved_by"] == {"resolve": 3}
+        assert "expiresAt" in d
+
+    report = await usage_report()
+    assert report["day"]["remaining"] == 8 and report["day"]["batch_remaining"] == 6
+    assert report["month"]["budget"] is None and report["month"]["billed"] == 2
@@ -0,0 +1,49 @@
+import pytest
+from deals_view import DEALS_COLL
+from models import ParsedOffer
+from raw_offers import RAW_OFFERS_VERSION, compress_offers, decompress_offers
+
+pytestmark = pytest.mark.anyio
+
+OFFERS = [
+    ParsedOffer("Target", "Logitech M185 Wireless Mouse Gray", 14.99, "https://target.com/m185", "target.com"),
+    ParsedOffer("Walmart", "Logitech M185 Wireless Mouse, Gray", 16.5, "https://walmart.com/m185", "walmart.com",
+                thumbnail=None, brand="Logitech"),
+    ParsedOffer("eBay", "Mouse pad for Logitech M185", 4.0, "https://ebay.com/pad", "ebay.com"),
+]
+
+def test_raw_offers_round_trip():
+    assert decompress_offers(compress_offers(OFFERS)) == OFFERS
+    assert decompress_offers(compress_offers(OFFERS), RAW_OFFERS_VERSION + 1) == []
+    assert decompress_offers(None) == []
+
+@pytest.fixture
+def no_serpapi(monkeypatch):
+    import main, services
+
+    async def refuse(*args, **kwargs):
+        raise AssertionError("SerpAPI called during rescore")
+    monkeypatch.setattr(services, "serp_get", refuse)
+    monkeypatch.setattr(main, "provider_google_shopping", refuse)
+
+async def test_rescore_from_stored_offers(api, mdb, no_serpapi):
+    amazon = {"asin": "B0M185", "title": "Logitech M185 Wireless Mouse - Gray", "price": 24.99}
+    await mdb["match_x"].insert_many([
+        # Scored by an older engine: no deals recorded
+        {"key_val": "B0M185", "match_found": False, "amazon": amazon, "best_deals": [],
+         "raw_offers": compress_offers(OFFERS), "raw_offers_v": RAW_OFFERS_VERSION},
+        # Indexed before raw offers were stored
+        {"key_val": "B0OLD", "match_found": False, "amazon": {"asin": "B0OLD", "price": 10.0}},
+    ])
+
+    res = await api.post("/matches/rescore", params={"match_coll": "match_x"})
+    assert res.status_code == 200
+    assert res.json() == {"rescored": 1, "skipped": 0, "deals": 1, "lease_lost": False}
+
+    doc = await mdb["match_x"].find_one({"key_val": "B0M185"})
+    assert doc["match_found"] and "rescored_at" in doc
+    assert [d["url"] for d in doc["best_deals"]][:1] == ["https://target.com/m185"]
+    assert "https://ebay.com/pad" not in [d["url"] for d in doc["best_deals"]]
+    row = await mdb[DEALS_COLL].find_one({"_id": "match_x:B0M185"})
+    assert row is not None and row["savings"] == pytest.approx(10.0)
+    assert "rescored_at" not in await mdb["match_x"].find_one({"key_val": "B0OLD"})
@@ -0,0 +1,58 @@
+import pytest
+from cache import bump_collection_version
+from deals_view import sync_deal
+
+pytestmark = pytest.mark.anyio
+
+async def _index(mdb, coll, asin, amz_price, offer_price):
+    """What the indexer does per item: MATCH write, deal row, version bump."""
+    m = {
+        "key_val": asin, "match_found": True,
+        "amazon": {"asin": asin, "price": amz_price},
+        "offers": [{"title": asin, "price": offer_price}],
+    }
+    await mdb[coll].replace_one({"key_val": asin}, m, upsert=True)
+    await sync_deal(mdb, coll, m)
+    await bump_collection_version(coll)
+
+async def test_unchanged_listing_is_304(api, mdb):
+    await _index(mdb, "match_x", "A1", 50.0, 30.0)
+    first = await api.get("/deals/google", params={"match_coll": "match_x"})
+    assert first.status_code == 200 and first.json()["count"] == 1
+    etag = first.headers["etag"]
+
+    again = await api.get("/deals/google", params={"match_coll": "match_x"}, headers={"If-None-Match": etag})
+    assert again.status_code == 304 and again.headers["etag"] == etag and again.content == b""
+
+    # Other params are another entity
+    other = await api.get("/deals/google", params={"match_coll": "match_x", "limit": 5}, headers={"If-None-Match": etag})
+    assert other.status_code == 200 and other.headers["etag"] != etag
+
+async def test_write_invalidates_etag(api, mdb):
+    await _index(mdb, "match_x", "A1", 50.0, 30.0)
+    first = await api.get("/deals/google", params={"match_coll": "match_x"})
+    etag = first.headers["etag"]
+
+    await _index(mdb, "match_x", "A2", 80.0, 20.0)
+    after = await api.get("/deals/google", params={"match_coll": "match_x"}, headers={"If-None-Match": etag})
+    assert after.status_code == 200 and after.headers["etag"] != etag
+    assert [d["amazon"]["asin"] for d in after.json()["deals"]] == ["A2", "A1"]
+
+    # A write to another category leaves this ETag alone
+    etag = after.headers["etag"]
+    await _index(mdb, "match_y", "B1", 50.0, 10.0)
+    same = await api.get("/deals/google", params={"match_coll": "match_x"}, headers={"If-None-Match": etag})
+    assert same.status_code == 304
+
+@pytest.mark.parametrize("accept, encoding", [
+    ("gzip, deflate", "gzip"),
+    ("gzip;q=0", None),
+    ("*;q=0.5, gzip;q=0", None),
+    ("identity", None),
+])
+async def test_large_body_compression(api, mdb, accept, encoding):
+    for i in range(40):
+        await _index(mdb, "match_x", f"A{i:03d}", 100.0 + i, 50.0)
+    res = await api.get("/deals/google", params={"match_coll": "match_x"}, headers={"Accept-Encoding": accept})
+    assert res.status_code == 200 and res.json()["count"] == 40
+    assert res.headers.get("content-encoding") == encoding
@@ -0,0 +1,107 @@
+import difflib
+import pytest
+from services import MERCHANT_LINK_MIN_SCORE, _title_sims, pick_merchant_link
+
+# (expected title, merchant titles for that product, other products on the same site)
+SAMPLES = [
+    ("MUD\\WTR :rise Organic Coffee Alternative 30 Servings",
+     ["MUD\\WTR :rise Coffee Alternative | 30 Servings", ":rise - MUD\\WTR",
+      "Organic Coffee Alternative :rise 30 Serving Tin – MUD\\WTR"],
+     ["MUD\\WTR Matcha Starter Kit", "Shop All Products – MUD\\WTR", "MUD\\WTR :rest Cacao Blend 30 Servings"]),
+    ("Logitech M185 Wireless Mouse - Gray",
+     ["Logitech M185 Wireless Mouse Gray : Target", "Logitech M185 Compact Wireless Mouse - Gray"],
+     ["Logitech MX Master 3S Wireless Mouse : Target", "Logitech K270 Wireless Keyboard : Target",
+      "Computer Mice : Target"]),
+    ("Cetaphil Moisturizing Cream for Dry Sensitive Skin 16 oz",
+     ["Cetaphil Moisturizing Cream, Dry to Very Dry Sensitive Skin, 16 oz - Walmart.com",
+      "Cetaphil Moisturizing Cream 16 oz"],
+     ["Cetaphil Gentle Skin Cleanser 16 oz - Walmart.com", "Cetaphil Daily Facial Moisturizer SPF 15 - Walmart.com",
+      "Skin Care - Walmart.com"]),
+    ("Anker 737 Power Bank 24000mAh 140W",
+     ["Anker 737 Power Bank (PowerCore 24K) 140W Black A1289 - Best Buy", "Anker 737 24000mAh Power Bank"],
+     ["Anker 622 Magnetic Battery 5000mAh - Best Buy", "Anker 313 Wireless Charger Pad - Best Buy",
+      "Portable Chargers & Power Banks - Best Buy"]),
+    ("Wahl Color Pro Cordless Rechargeable Hair Clipper Kit",
+     ["Color Pro Cordless Rechargeable Hair Clipper & Trimmer Kit | Wahl", "Wahl Color Pro Cordless Haircut Kit"],
+     ["Wahl Peanut Hair Clipper & Trimmer | Wahl", "Clippers | Wahl USA", "Wahl Lithium Ion 2.0 Beard Trimmer"]),
+    ("Purina Pro Plan Adult Sensitive Skin & Stomach Salmon Dry Dog Food 30 lb",
+     ["Purina Pro Plan Adult Sensitive Skin & Stomach Salmon & Rice Formula Dry Dog Food, 30-lb bag - Chewy.com",
+      "Pro Plan Sensitive Skin and Stomach Salmon 30 lb"],
+     ["Purina Pro Plan Adult Chicken & Rice Dry Dog Food, 35-lb bag - Chewy.com",
+      "Purina ONE Lamb & Rice Dry Dog Food - Chewy.com", "Dry Dog Food - Chewy.com"]),
+    ("OXO Good Grips Salad Spinner Large",
+     ["OXO Good Grips Large Salad Spinner | OXO", "Salad Spinner - Large | OXO"],
+     ["OXO Good Grips Little Salad & Herb Spinner | OXO", "OXO Good Grips 3-Piece Mixing Bowl Set",
+      "Kitchen Tools | OXO"]),
+    ("Nature's Bounty Vitamin D3 1000 IU Softgels 350 Count",
+     ["Vitamin D3 1000 IU Softgels 350 ct | Nature's Bounty", "Nature's Bounty Vitamin D3 1000IU 350 Softgels"],
+     ["Vitamin D3 5000 IU 240 Softgels | Nature's Bounty", "Nature's Bounty Fish Oil 1200 mg 200 Softgels",
+      "Vitamins & Supplements | Nature's Bounty"]),
+    ("DEWALT 20V MAX Cordless Drill Driver Kit DCD771C2",
+     ["DEWALT 20V MAX Cordless 1/2 in. Drill/Driver, (2) 20V 1.3Ah Batteries, Charger and Bag DCD771C2 - The Home Depot",
+      "DEWALT DCD771C2 20V MAX Drill Driver Kit"],
+     ["DEWALT 20V MAX Cordless Impact Driver Kit DCF885C1 - The Home Depot",
+      "DEWALT 20V MAX 5.0Ah Battery DCB205 - The Home Depot", "Power Drills - The Home Depot"]),
+    ("CeraVe Hydrating Facial Cleanser 16 oz",
+     ["Hydrating Facial Cleanser 16.0 oz - CeraVe | Ulta Beauty", "CeraVe Hydrating Facial Cleanser 16oz"],
+     ["Foaming Facial Cleanser 16.0 oz - CeraVe | Ulta Beauty", "CeraVe Moisturizing Cream 16 oz | Ulta Beauty",
+      "Face Cleansers | Ulta Beauty"]),
+    ("Ninja Professional Blender 1000W BL610",
+     ["Ninja Professional 72-oz. Countertop Blender BL610 - Kohl's", "Ninja BL610 Professional Blender 1000 Watts"],
+     ["Ninja Nutri-Blender Pro BN401 - Kohl's", "Ninja Foodi 10-in-1 XL Pro Air Fryer Oven - Kohl's",
+      "Blenders | Kohl's"]),
+    ("LEGO Star Wars Millennium Falcon 75257",
+     ["Millennium Falcon™ 75257 | Star Wars™ | Buy online at the Official LEGO® Shop US",
+      "LEGO Star Wars 75257 Millennium Falcon Building Kit"],
+     ["X-Wing Starfighter™ 75301 | Star Wars™ | LEGO Shop", "LEGO Star Wars Darth Vader Helmet 75304",
+      "Star Wars™ Toys and Collectibles | LEGO Shop"]),
+]
+
+def _decisions(title_weight):
+    """(same product?, accepted by difflib at 0.40, accepted now) over a price-similarity grid."""
+    out = []
+    for expected, same, other in SAMPLES:
+        e = expected.lower().strip()
+        titles = [t.lower() for t in same + other]
+        new = _title_sims(titles, e)
+        for i, t in enumerate(titles):
+            old = difflib.SequenceMatcher(None, t, e).ratio()
+            for p in range(11):
+                price_part = p / 10 * (1 - title_weight)
+                out.append((i < len(same),
+                            old * title_weight + price_part >= 0.40,
+                            new[i] * title_weight + price_part >= MERCHANT_LINK_MIN_SCORE))
+    return out
+
+@pytest.mark.parametrize("title_weight", [0.75, 0.70])
+def test_threshold_matches_old_scorer(title_weight):
+    rows = _decisions(title_weight)
+    old_missed = sum(1 for same, old, new in rows if same and not old)
+    new_missed = sum(1 for same, old, new in rows if same and not new)
+    assert new_missed <= old_missed
+    old_wrong = sum(1 for same, old, new in rows if old and not same)
+    new_wrong = sum(1 for same, old, new in rows if new and not same)
+    assert new_wrong <= old_wrong * 1.1
+
+def _shop(title, source, price, link):
+    return {"title": title, "source": source, "extracted_price": price, "link": link}
+
+def test_picks_matching_shopping_result():
+    data = {"shopping_results": [
+        _shop("Logitech M185 Wireless Mouse Gray", "Amazon.com", 14.99, "https://amazon.com/m185"),
+        _shop("Logitech MX Master 3S Wireless Mouse", "Target", 99.99, "https://target.com/mx"),
+        _shop("Logitech M185 Wireless Mouse Gray", "Target", 14.99, "https://target.com/m185"),
+    ]}
+    assert pick_merchant_link(data, "target", "Logitech M185 Wireless Mouse - Gray", 14.99) == "https://target.com/m185"
+
+def test_rejects_other_product_and_falls_back_to_organic():
+    data = {
+        "shopping_results": [_shop("Ninja Foodi 10-in-1 XL Pro Air Fryer Oven", "Kohl's", 229.99, "https://kohls.com/foodi")],
+        "organic_results": [
+            {"title": "Ninja Professional 72-oz. Countertop Blender BL610 - Kohl's",
+             "link": "https://www.kohls.com/bl610", "snippet": "Sale $89.99"},
+        ],
+    }
+    assert pick_merchant_link(data, "kohls", "Ninja Professional Blender 1000W BL610", 89.99) == "https://www.kohls.com/bl610"
+    data["organic_results"] = []
+    assert pick_merchant_link(data, "kohls", "Ninja Professional Blender 1000W BL610", 89.99) is None
@@ -0,0 +1,36 @@
+import os, subprocess, sys
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def test_heavy_imports_deferred():
+    out = subprocess.run(
+        [sys.executable, "-c",
+         "import sys, main; print(sorted(m for m in ('motor', 'pymongo', 'bson', 'PIL', 'imagehash', 'numpy')"
+         " if m in sys.modules))"],
+        capture_output=True, text=True, check=True, cwd=SERVICE_DIR,
+    )
+    assert out.stdout.strip() == "[]"
+
+class _Admin:
+    async def command(self, name):
+        raise RuntimeError("no server")
+
+class _Client:
+    admin = _Admin()
+
+async def test_ready_flips_after_warmup(api, monkeypatch):
+    import main
+    monkeypatch.setattr(main, "READY", {"ready": False, "warmup": None})
+    monkeypatch.setattr(main, "STARTUP_JITTER_S", 0.0)
+    monkeypatch.setattr(main, "WARMUP_PRELOAD", 0)
+    monkeypatch.setattr(main, "client", _Client())
+    assert (await api.get("/ready")).status_code == 503
+
+    # A failing step (Mongo ping here) is logged, not fatal
+    await main._warmup()
+    res = await api.get("/ready")
+    assert res.status_code == 200
+    assert set(res.json()["warmup"]) == {"mongo_ping", "titles", "image_stack", "scoring_backend", "phash_preload"}
@@ -0,0 +1,36 @@
+import random
+import pytest
+from utils import analyze_title, _analyze_title_regexes
+
+def _reference(title):
+    return _analyze_title_regexes(title, title.lower())
+
+@pytest.mark.parametrize("title, grams, count, multipack", [
+    ("MUD\\WTR Coffee Alternative 12 oz", 340.19, 1, False),
+    ("Cetaphil Cream 1.5 lb Pack of 3", 680.39, 3, True),
+    ("Anker Charger 6-Pack", None, 6, False),
+    ("Vitamin D3 100ct Softgels", None, 100, True),
+    ("OXO Salad Spinner 2 x 8", None, 1, True),
+    ("Superpack of 4 sponges", None, 4, True),
+    ("Mints 16oz6ct", 453.59, 6, False),
+    ("Soap x3pack", None, 1, False),
+    ("Water 2 L bottle", 2000.0, 1, False),
+    ("Grapes 12 grapes", 12.0, 1, False),
+    ("", None, 1, False),
+])
+def test_known_titles(title, grams, count, multipack):
+    a = analyze_title.__wrapped__(title)
+    assert (round(a.grams, 2) if a.grams else a.grams, a.count, a.multipack) == (grams, count, multipack)
+    assert a == _reference(title)
+
+def test_single_scan_matches_separate_regexes():
+    pieces = [
+        "pack", "of", "pack of", "ct", "oz", "ounces", "lb", "lbs", "kg", "g", "grams", "ml", "l",
+        "liter", "pk", "x", "count", "packet", "bundle", "12", "3", "1.5", ".5", "100", " ", "-",
+        "_", ".", ",", "/", "Pack", "OZ", "İ", "K", "ſ", "١", "é", "p", "t", "ozone", "superpack",
+        "6pack", "2x8", "16oz6ct", "Model",
+    ]
+    rnd = random.Random(7)
+    for _ in range(20000):
+        title = "".join(rnd.choice(pieces) for _ in range(rnd.randint(1, 10)))
+        assert analyze_title.__wrapped__(title) == _reference(title), title
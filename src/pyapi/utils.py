@@ -1,12 +1,26 @@
-import re
+import os, re, heapq, asyncio
 from datetime import datetime, timezone
-from typing import Optional, Dict
+from functools import lru_cache
+from typing import Optional, Dict, NamedTuple, Tuple, Any, Callable, List, AsyncIterator, TYPE_CHECKING
 import httpx
-from PIL import Image
-import imagehash
 from io import BytesIO
-from models import ExtensionFullProduct, Offer
+from models import ExtensionFullProduct, ParsedOffer, ScoredDeal, ScoreResult
 from rapidfuzz import fuzz
+from cassettes import record_image
+from offload import run_blocking, run_cpu_batch
+from cache import SharedCache
+from metrics import timed, timed_async, register_collector, CACHE, OFFERS_FILTERED
+
+# PIL + imagehash (numpy/scipy) are imported on first use, not at startup
+if TYPE_CHECKING:
+    import imagehash
+
+@lru_cache(maxsize=None)
+def image_stack():
+    """(PIL.Image, imagehash), imported once on first call."""
+    from PIL import Image
+    import imagehash
+    return Image, imagehash
 
 # Regex Helpers
 
@@ -58,33 +72,66 @@ def parse_price(v) -> Optional[float]:
     return float(m.group(1)) if m else None
 
 # Image Downloading + pHash (perceptual hash)
+# Images up to this size are hashed on the event loop, larger ones in the CPU pool
+PHASH_INLINE_MAX_BYTES = int(os.getenv("PHASH_INLINE_MAX_BYTES", "8192"))
+
+# Thumbnail URL -> pHash hex
+PHASH_CACHE = SharedCache("phash", ttl_s=float(os.getenv("PHASH_CACHE_TTL_S", str(7 * 86400))))
+
 async def fetch_image_bytes(url: str) -> Optional[bytes]:
     """Download image bytes with a 10s timeout. Returns None on failure."""
     if not url:
         return None
     try:
-        async with httpx.AsyncClient(timeout=10.0) as c:
-            r = await c.get(url)
-            if r.status_code == 200:
-                return r.content
+        with timed("image_download"):
+            async with httpx.AsyncClient(timeout=10.0) as c:
+                r = await c.get(url)
+                if r.status_code == 200:
+                    record_image(url, r.content)
+                    return r.content
     except Exception:
         return None
     return None
 
-async def compute_phash(url: str) -> Optional[imagehash.ImageHash]:
+async def compute_phash(url: str) -> Optional["imagehash.ImageHash"]:
     """
     Compute perceptual hash for an image.
     Used for comparing Amazon vs Google Shopping images.
+
+    Cached by URL in PHASH_CACHE (shared across workers), so recurring
+    offer thumbnails are downloaded + hashed once.
     """
+    if not url:
+        return None
+
+    cached = await PHASH_CACHE.get(url)
+    if cached:
+        return phash_from_hex(cached)
+
+    h = await _compute_phash_uncached(url)
+    if h is not None:
+        await PHASH_CACHE.set(url, str(h))
+    return h
+
+async def _compute_phash_uncached(url: str) -> Optional["imagehash.ImageHash"]:
     data = await fetch_image_bytes(url)
     if not data:
         return None
     try:
-        img = Image.open(BytesIO(data)).convert("RGB")
-        return imagehash.phash(img)
+        # Decode + DCT of a real thumbnail is ~ms of CPU: keep it off the
+        # loop. Tiny images are cheaper than the thread hop, so run inline.
+        if len(data) <= PHASH_INLINE_MAX_BYTES:
+            return _decode_phash(data)
+        return await run_blocking(_decode_phash, data)
     except Exception:
         return None
 
+def _decode_phash(data: bytes) -> "imagehash.ImageHash":
+    Image, imagehash = image_stack()
+    with timed("phash"):
+        img = Image.open(BytesIO(data)).convert("RGB")
+        return imagehash.phash(img)
+
 def phash_similarity(hash1, hash2) -> float:
     """
     Compute similarity (0–100%) from two pHash values.
@@ -97,21 +144,54 @@ def phash_similarity(hash1, hash2) -> float:
     sim = 1 - (dist / 64)
     return max(0.0, min(1.0, sim)) * 100.0
 
-# Title Normalization
-def norm(s: str) -> str:
-    """
-    Normalize product title:
-      - Lowercase
-      - Strip non-alphanumeric chars
-      - Remove STOPWORDS
-    """
-    if not s:
-        return ""
-    s = re.sub(r"[^a-z0-9 ]+", " ", s.lower())
-    toks = [t for t in s.split() if t and t not in STOPWORDS]
-    return " ".join(toks)
+# Title Analysis (single pass, memoized)
+# Hot path for both scoring and scraping: the same titles show up across
+# index runs and extension calls, so results are cached per title string.
+TITLE_CACHE_SIZE = int(os.getenv("TITLE_CACHE_SIZE", "50000"))
+
+# Tokens survive normalization iff they are runs of [a-z0-9]
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Multipack / bulk listings skipped by the Amazon scraper
+MULTIPACK_RE = re.compile(
+    r"pack of"
+    r"|\b\d+\s*(?:pack|packet|bundle|variety|ct|count)\b"
+    r"|\b\d+\s*pk\b"
+    r"|\b\d+\s*x\s*\d+"
+)
+
+# One scan for all three: each match is a token; tokens containing a digit
+# or "p" also look ahead (without consuming) for the first size and the
+# first multipack match starting inside them. Sizes spanning tokens
+# ("pack of 3", "12 oz") are seen from their first token. Results are the
+# same as TOKEN_RE + SIZE_RE + MULTIPACK_RE run separately: digit runs are
+# always matched whole, so SIZE_RE's alternatives factor on the number,
+# and "lbs" / "grams" etc. never win over "lb" / "g" anyway.
+_SCAN_SIZE = (
+    r"pack\s*of\s*(?P<pack_of>\d+)"
+    r"|(?:(?P<wb>\b))?(?P<num>\d+)(?:"
+    r"(?P<frac>\.\d+)?\s*(?P<unit>lb|pound|oz|ounce|kg|g|ml|l)"
+    r"|\s*(?P<ct>ct)"
+    r"|(?(wb)-?pack\b|(?!))"                 # "3-pack" only at a word start
+    r")"
+)
+_SCAN_MULTIPACK = r"pack of|\b\d+\s*(?:(?:pack|packet|bundle|variety|ct|count|pk)\b|x\s*\d)"
+
+TITLE_SCAN_RE = re.compile(
+    r"[a-oq-z]+(?![a-z0-9])"                  # plain word, nothing to look for
+    r"|(?=[a-z\d])"
+    rf"(?:(?=[a-z0-9]*?(?P<size>{_SCAN_SIZE})))?"
+    rf"(?:(?=[a-z0-9]*?(?P<multipack>{_SCAN_MULTIPACK})))?"
+    r"(?:[a-z0-9]+|(?P<digit>\d))"           # token, or a non-ASCII digit
+)
+
+class TitleAnalysis(NamedTuple):
+    title_norm: str
+    tokens: Tuple[str, ...]          # normalized tokens, in title order
+    grams: Optional[float]           # grams per unit (or ml)
+    count: int                       # pack count
+    multipack: bool                  # looks like a multipack/bundle listing
 
-# Size + Count Parsing (detect ounces, lbs, packs, ct, etc.)
 def _to_grams(val: float, unit: str) -> Optional[float]:
     """Convert various units to grams (or ml equivalently for liquids)."""
     u = unit.lower()
@@ -129,23 +209,11 @@ def _to_grams(val: float, unit: str) -> Optional[float]:
         return val * 1000.0
     return None
 
-def extract_size_and_count(title: str) -> Dict[str, Optional[float]]:
-    """
-    Parse sizes & pack counts from a product title.
-
-    Returns dict:
-      {
-        "grams": grams per unit (or ml),
-        "count": how many units (e.g., 2-pack)
-      }
-    """
+def _grams_and_count(sizes) -> Tuple[Optional[float], int]:
+    """Largest unit size and pack count from SIZE_RE-shaped groups."""
     grams = None
     count = 1
-    if not title:
-        return {"grams": None, "count": 1}
-
-    for m in SIZE_RE.finditer(title):
-        qty, unit, pack_of, ct_alt, pack_alt = m.groups()
+    for qty, unit, pack_of, ct_alt, pack_alt in sizes:
 
         # Quantity+unit (e.g., "12 oz")
         if qty and unit:
@@ -157,8 +225,185 @@ def extract_size_and_count(title: str) -> Dict[str, Optional[float]]:
         for v in (pack_of, ct_alt, pack_alt):
             if v and v.isdigit():
                 count = max(count, int(v))
+    return grams, count
+
+def _analyze_title_regexes(title: str, t: str) -> TitleAnalysis:
+    """TOKEN_RE + SIZE_RE + MULTIPACK_RE separately (reference for TITLE_SCAN_RE)."""
+    tokens = tuple(tok for tok in TOKEN_RE.findall(t) if tok not in STOPWORDS)
+    grams, count = _grams_and_count(m.groups() for m in SIZE_RE.finditer(title))
+    return TitleAnalysis(" ".join(tokens), tokens, grams, count, MULTIPACK_RE.search(t) is not None)
+
+@lru_cache(maxsize=TITLE_CACHE_SIZE)
+def analyze_title(title: str) -> TitleAnalysis:
+    """
+    Normalize a title and parse size/count/multipack flags in one call.
+
+    - Lowercases once and scans it once (TITLE_SCAN_RE)
+    - Drops STOPWORDS
+    - Parses sizes & pack counts (same matches as SIZE_RE)
+    - Flags multipacks/bundles (same as MULTIPACK_RE)
+
+    Cached (bounded LRU). Returns an immutable TitleAnalysis, so callers
+    must not expect to mutate it.
+    """
+    if not title:
+        return TitleAnalysis("", (), None, 1, False)
+
+    t = title.lower()
+    if len(t) != len(title):
+        # Lowercasing changed the text's shape ("İ" -> "i" + combining dot),
+        # and with it SIZE_RE's word boundaries: match on the original
+        return _analyze_title_regexes(title, t)
+
+    tokens = []
+    sizes = []
+    multipack = False
+    size_end = 0       # SIZE_RE matches never overlap
+    for m in TITLE_SCAN_RE.finditer(t):
+        if m.lastindex is None:
+            tok = m.group()
+            if tok not in STOPWORDS:
+                tokens.append(tok)
+            continue
+
+        size, pack_of, _, num, frac, unit, ct, multi, digit = m.groups()
+        if digit is None:
+            tok = m.group()
+            if tok not in STOPWORDS:
+                tokens.append(tok)
+        if multi is not None:
+            multipack = True
+        if size is None:
+            continue
+
+        start = m.start("size")
+        if start >= size_end:
+            size_end = start + len(size)
+            if unit:
+                sizes.append((num + (frac or ""), unit, None, None, None))
+            elif ct:
+                sizes.append((None, None, None, num, None))
+            else:
+                sizes.append((None, None, pack_of, None, num))
+
+        # Rare: another size starts later in the same token ("16oz6ct"), or
+        # the first one overlapped the previous size
+        end = m.end()
+        while size_end < end:
+            nxt = SIZE_RE.search(t, size_end)
+            if nxt is None or nxt.start() >= end:
+                break
+            sizes.append(nxt.groups())
+            size_end = nxt.end()
+
+    tokens = tuple(tokens)
+    grams, count = _grams_and_count(sizes)
+    return TitleAnalysis(
+        title_norm=" ".join(tokens),
+        tokens=tokens,
+        grams=grams,
+        count=count,
+        multipack=multipack,
+    )
+
+register_collector("title_cache_hits", lambda: analyze_title.cache_info().hits)
+register_collector("title_cache_misses", lambda: analyze_title.cache_info().misses)
+register_collector("title_cache_size", lambda: analyze_title.cache_info().currsize)
+
+# Title Normalization
+def norm(s: str) -> str:
+    """
+    Normalize product title:
+      - Lowercase
+      - Strip non-alphanumeric chars
+      - Remove STOPWORDS
+    """
+    return analyze_title(s).title_norm
+
+# Size + Count Parsing (detect ounces, lbs, packs, ct, etc.)
+def extract_size_and_count(title: str) -> Dict[str, Optional[float]]:
+    """
+    Parse sizes & pack counts from a product title.
+
+    Returns dict:
+      {
+        "grams": grams per unit (or ml),
+        "count": how many units (e.g., 2-pack)
+      }
+    """
+    a = analyze_title(title)
+    return {"grams": a.grams, "count": a.count}
+
+# Precomputed Title Features
+# Bump when norm() / size parsing changes so stored features get recomputed
+FEATURES_VERSION = 1
+
+def title_features(title: str) -> Dict:
+    """
+    Derive everything the scoring engine needs from a title, once.
+
+    Returns dict:
+      {
+        "version": FEATURES_VERSION,
+        "title_norm": normalized title,
+        "tokens": sorted unique tokens of title_norm,
+        "grams": grams per unit (or ml),
+        "count": pack count,
+        "unit_mode": "weight" | "count",
+        "units": total grams (weight) or total count
+      }
+    """
+    a = analyze_title(title)
+    title_norm = a.title_norm
+    grams = a.grams
+    count = a.count or 1
+
+    if grams:
+        units = grams * max(1, count)
+        unit_mode = "weight"
+    else:
+        units = max(1, count)
+        unit_mode = "count"
 
-    return {"grams": grams, "count": count}
+    return {
+        "version": FEATURES_VERSION,
+        "title_norm": title_norm,
+        "tokens": sorted(set(a.tokens)),
+        "grams": grams,
+        "count": count,
+        "unit_mode": unit_mode,
+        "units": units,
+    }
+
+def features_current(features: Optional[dict]) -> bool:
+    """True if stored features exist and match the current FEATURES_VERSION."""
+    return bool(features) and features.get("version") == FEATURES_VERSION
+
+async def compute_phash_hex(url: str) -> Optional[str]:
+    """pHash of an image as a hex string (storable in Mongo), or None."""
+    h = await compute_phash(url)
+    return str(h) if h is not None else None
+
+def phash_from_hex(value: Optional[str]) -> Optional["imagehash.ImageHash"]:
+    """Inverse of compute_phash_hex. Returns None on missing/bad input."""
+    if not value:
+        return None
+    try:
+        return image_stack()[1].hex_to_hash(value)
+    except Exception:
+        return None
+
+async def build_features(title: str, thumbnail: Optional[str]) -> Dict:
+    """
+    Title features + thumbnail pHash, ready to persist on an Amazon doc.
+
+    `phash_src` records which URL was hashed so a changed thumbnail
+    is detected and re-hashed at scoring time.
+    """
+    features = title_features(title)
+    features["phash"] = await compute_phash_hex(thumbnail)
+    features["phash_src"] = thumbnail
+    return features
 
 def sizes_compatible(wm_title: str, amz_title: str, threshold: float = 0.85) -> bool:
     """
@@ -190,66 +435,241 @@ def extract_price_from_text(text: str) -> float:
     except:
         return None
 
-# Deal Scoring Engine (shared by dashboard + Chrome extension)
-async def _score_offers_for_extension(payload: ExtensionFullProduct, all_offers: list[Offer]):
-    """
-    Core scoring algorithm for Google Shopping offers:
-    - Normalize Amazon title
-    - Compare text similarity (RapidFuzz)
-    - Compare images via pHash
-    - Adjust price using unit normalization where logical
-    - Filter out weak matches
-    - Compute savings
-    - Return top 5 matches
+# Ranking Helpers (top-k without full sorts)
+class TopK:
     """
+    Keep the k largest items by key in a bounded min-heap: O(n log k).
 
-    best_deals = []
-
-    amz_title_norm = norm(payload.title)
-    amz_price = float(payload.price)
+    Ties keep arrival order (earlier item ranks higher), matching
+    sorted(..., reverse=True)[:k].
+    """
+    __slots__ = ("k", "_heap", "_seq")
+
+    def __init__(self, k: int):
+        self.k = k
+        self._heap: list = []
+        self._seq = 0
+
+    def push(self, key, item, seq: Optional[int] = None) -> None:
+        """`seq` overrides arrival order for ties (lower ranks higher)."""
+        if self.k <= 0:
+            return
+        entry = (key, -(self._seq if seq is None else seq), item)
+        self._seq += 1
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, entry)
+        elif entry > self._heap[0]:
+            heapq.heapreplace(self._heap, entry)
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def floor(self):
+        """Smallest kept key once k items are held (else None)."""
+        if self.k <= 0 or len(self._heap) < self.k:
+            return None
+        return self._heap[0][0]
+
+    def items(self) -> list:
+        """Best first."""
+        return [e[2] for e in sorted(self._heap, key=lambda e: (e[0], e[1]), reverse=True)]
+
+_END = object()
+
+class _Desc:
+    """Heap entry wrapper that inverts ordering (heapq is a min-heap)."""
+    __slots__ = ("key", "idx", "item")
+
+    def __init__(self, key, idx, item):
+        self.key, self.idx, self.item = key, idx, item
+
+    def __lt__(self, other):
+        if self.key != other.key:
+            return self.key > other.key
+        return self.idx < other.idx
+
+async def merge_sorted_desc(
+    sources: List[AsyncIterator[Any]],
+    key: Callable[[Any], Any],
+    k: Optional[int] = None,
+) -> AsyncIterator[Any]:
+    """
+    k-way merge of async iterators that are each already sorted by `key`
+    descending (e.g. Mongo cursors with a server-side sort).
 
-    # Parse Amazon size (for unit-normalized price matching)
-    amz_size = extract_size_and_count(payload.title)
-    amz_grams = amz_size.get("grams")
-    amz_count = amz_size.get("count") or 1
+    - Holds only one pending item per source
+    - Primes all sources concurrently
+    - Stops after `k` items if given; unconsumed sources are never drained
+    """
+    iters = [s.__aiter__() for s in sources]
+
+    async def _next(it):
+        try:
+            return await it.__anext__()
+        except StopAsyncIteration:
+            return _END
+
+    heap = []
+    for idx, item in enumerate(await asyncio.gather(*(_next(it) for it in iters))):
+        if item is not _END:
+            heap.append(_Desc(key(item), idx, item))
+    heapq.heapify(heap)
+
+    emitted = 0
+    while heap and (k is None or emitted < k):
+        top = heap[0]
+        yield top.item
+        emitted += 1
+
+        nxt = await _next(iters[top.idx])
+        if nxt is _END:
+            heapq.heappop(heap)
+        else:
+            heapq.heapreplace(heap, _Desc(key(nxt), top.idx, nxt))
 
-    amz_units: Optional[float] = None
-    amz_unit_mode: Optional[str] = None
+# Offer Pre-filter (before fuzzy matching and image fetch)
+# Offers sizes may differ by at most this ratio for unit-normalized prices
+UNIT_SIZE_RATIO = 0.6
 
-    if amz_grams:
-        amz_units = amz_grams * max(1, amz_count)
-        amz_unit_mode = "weight"
-    elif amz_count:
-        amz_units = max(1, amz_count)
-        amz_unit_mode = "count"
+# Band of offer price / Amazon price worth scoring. Above 1 / UNIT_SIZE_RATIO
+# no offer can show savings, even unit-normalized; far below it's almost
+# always an accessory or a part.
+OFFER_PRICE_MIN_RATIO = float(os.getenv("OFFER_PRICE_MIN_RATIO", "0.1"))
+OFFER_PRICE_MAX_RATIO = float(os.getenv("OFFER_PRICE_MAX_RATIO", str(1 / UNIT_SIZE_RATIO)))
 
-    amazon_hash = await compute_phash(payload.thumbnail or payload.image_url)
+def prefilter_offers(offers: list[ParsedOffer], amz_price: float) -> Tuple[list, Dict[str, int]]:
+    """
+    Cheap rules, in order; returns (kept offers in input order, removed per rule):
+    - duplicate_url: same URL as an earlier offer
+    - duplicate_listing: same merchant domain + title + price as an earlier offer
+    - price_low / price_high: price outside the OFFER_PRICE_*_RATIO band
+    """
+    removed = {"duplicate_url": 0, "duplicate_listing": 0, "price_low": 0, "price_high": 0}
+    lo = amz_price * OFFER_PRICE_MIN_RATIO
+    hi = amz_price * OFFER_PRICE_MAX_RATIO
+    seen_urls = set()
+    seen_listings = set()
+    kept = []
+    for o in offers:
+        if o.url:
+            if o.url in seen_urls:
+                removed["duplicate_url"] += 1
+                continue
+            seen_urls.add(o.url)
+        listing = ((o.source_domain or "").lower(), o.title.strip().lower(), o.price)
+        if listing in seen_listings:
+            removed["duplicate_listing"] += 1
+            continue
+        seen_listings.add(listing)
+        if amz_price > 0:
+            if o.price < lo:
+                removed["price_low"] += 1
+                continue
+            if o.price > hi:
+                removed["price_high"] += 1
+                continue
+        kept.append(o)
+    return kept, removed
 
-    for o in all_offers:
+# Deal Scoring Engine (shared by dashboard + Chrome extension)
+def _text_candidates(offers: list[ParsedOffer], amz_title_norm: str) -> list:
+    """
+    CPU phase of scoring: title features + RapidFuzz for every offer.
+    Returns [(offer, offer_feats, text_sim)] for offers with text_sim >= 60,
+    in input order. Pure function, so it can run off the event loop.
+    Offer titles recur across runs; the analysis behind title_features is
+    LRU-cached.
+    """
+    out = []
+    with timed("fuzzy"):
+        for o in offers:
+            offer_feats = title_features(o.title)
 
-        # TEXT SIMILARITY
-        text_sim = fuzz.token_set_ratio(amz_title_norm, norm(o["title"]))
-        o["sim"] = text_sim
+            # TEXT SIMILARITY
+            text_sim = fuzz.token_set_ratio(amz_title_norm, offer_feats["title_norm"])
 
-        if text_sim < 60:  # reject weak matches early
-            continue
+            if text_sim < 60:  # reject weak matches early
+                continue
+            out.append((o, offer_feats, text_sim))
+    return out
+
+@timed_async("score")
+async def _score_offers_for_extension(
+    payload: ExtensionFullProduct, all_offers: list[ParsedOffer], top_k: int = 5,
+    amz_features: Optional[dict] = None,
+) -> ScoreResult:
+    """
+    Core scoring algorithm for Google Shopping offers:
+    - Normalize Amazon title
+    - Pre-filter offers: duplicates, prices outside the plausible band
+    - Compare text similarity (RapidFuzz)
+    - Adjust price using unit normalization where logical
+    - Compute savings, drop offers without meaningful savings
+    - Compare images via pHash
+    - Filter out weak matches
+    - Return top `top_k` matches (bounded heap, no full sort), stopping
+      once no remaining offer can make the top `top_k`
 
-        # IMAGE SIMILARITY
-        offer_hash = await compute_phash(o.get("thumbnail"))
+    `amz_features` are the Amazon doc's stored build_features() (indexer
+    only, never client input). result.filtered counts the offers each
+    rule removed; result.phashes maps image URLs to their pHash hex.
 
-        if amazon_hash and offer_hash:
-            img_sim = phash_similarity(amazon_hash, offer_hash)
-        else:
-            img_sim = 0.0
+    Offers are read, never mutated. Call .to_dict() on the result
+    only at the response / storage boundary.
+    """
 
-        combined_sim = (text_sim * 0.6) + (img_sim * 0.4)
+    best_deals = TopK(top_k)
 
-        if combined_sim < 55:
-            continue
+    # Use features precomputed at scrape/index time when present
+    amz_feats = amz_features
+    if features_current(amz_feats):
+        CACHE.inc(cache="amazon_features", result="hit")
+    else:
+        CACHE.inc(cache="amazon_features", result="miss")
+        amz_feats = title_features(payload.title)
 
-        price = o["price"]
+    amz_title_norm = amz_feats["title_norm"]
+    amz_price = float(payload.price)
 
-        # SAVINGS CALCULATION
+    # Amazon size (for unit-normalized price matching)
+    amz_units: Optional[float] = amz_feats.get("units")
+    amz_unit_mode: Optional[str] = amz_feats.get("unit_mode")
+
+    amz_thumb = payload.thumbnail or payload.image_url
+    # pHashes seen in this run, returned so callers can share them
+    phashes: Dict[str, str] = {}
+    amazon_hash = None
+    if amz_feats.get("phash") and amz_feats.get("phash_src") == amz_thumb:
+        amazon_hash = phash_from_hex(amz_feats["phash"])
+    if amazon_hash is None:
+        amazon_hash = await compute_phash(amz_thumb)
+        if amazon_hash is not None:
+            phashes[amz_thumb] = str(amazon_hash)
+
+    # Dedupe + price band before any fuzzy matching or image fetch
+    offers, filtered = prefilter_offers(all_offers, amz_price)
+
+    # Text matching for large offer lists runs in the CPU pool
+    candidates = await run_cpu_batch(_text_candidates, offers, amz_title_norm)
+    filtered["weak_text"] = len(offers) - len(candidates)
+    filtered.update(no_savings=0, weak_match=0, early_stop=0)
+
+    # Strongest text first, so the loop can stop once no remaining offer can
+    # reach the top k; ranking ties still go by input order (seq)
+    order = sorted(range(len(candidates)), key=lambda i: -candidates[i][2])
+    max_img_sim = 100.0 if amazon_hash else 0.0
+
+    for n, seq in enumerate(order):
+        o, offer_feats, text_sim = candidates[seq]
+
+        floor = best_deals.floor()
+        if floor is not None and (text_sim * 0.6) + (max_img_sim * 0.4) < floor[0]:
+            filtered["early_stop"] = len(order) - n
+            break
+
+        price = o.price
+
+        # SAVINGS CALCULATION (before the image fetch: most offers fail here)
         savings_abs: float
         savings_pct: float
 
@@ -257,9 +677,8 @@ async def _score_offers_for_extension(payload: ExtensionFullProduct, all_offers:
         offer_units: Optional[float] = None
 
         if amz_units and amz_unit_mode:
-            offer_size = extract_size_and_count(o["title"])
-            offer_grams = offer_size.get("grams")
-            offer_count = offer_size.get("count") or 1
+            offer_grams = offer_feats.get("grams")
+            offer_count = offer_feats.get("count") or 1
 
             if amz_unit_mode == "weight" and offer_grams:
                 offer_units = offer_grams * max(1, offer_count)
@@ -268,7 +687,7 @@ async def _score_offers_for_extension(payload: ExtensionFullProduct, all_offers:
 
             if offer_units:
                 ratio = min(amz_units, offer_units) / max(amz_units, offer_units)
-                if ratio >= 0.6:   # avoid mismatched sizes
+                if ratio >= UNIT_SIZE_RATIO:   # avoid mismatched sizes
                     use_unit_normalization = True
 
         if use_unit_normalization and amz_units and offer_units:
@@ -277,6 +696,7 @@ async def _score_offers_for_extension(payload: ExtensionFullProduct, all_offers:
             unit_savings = amz_unit_price - offer_unit_price
 
             if unit_savings <= 0:
+                filtered["no_savings"] += 1
                 continue
 
             savings_abs = unit_savings * amz_units
@@ -284,39 +704,58 @@ async def _score_offers_for_extension(payload: ExtensionFullProduct, all_offers:
         else:
             savings_abs = amz_price - price
             if savings_abs <= 0:
+                filtered["no_savings"] += 1
                 continue
             savings_pct = (savings_abs / amz_price) * 100 if amz_price > 0 else 0
 
         # Require meaningful savings
         if savings_abs < 2.0 and savings_pct < 5.0:
+            filtered["no_savings"] += 1
             continue
 
-        best_deals.append({
-            "merchant": o["merchant"],
-            "source_domain": o.get("source_domain"),
-            "title": o["title"],
-            "price": price,
-            "url": o["url"],
-            "thumbnail": o.get("thumbnail"),
-            "brand": o.get("brand"),
-            "sim": text_sim,
-            "img_sim": img_sim,
-            "combined_sim": combined_sim,
-            "savings_abs": savings_abs,
-            "savings_pct": savings_pct,
-        })
-
-    # Sort by strongest match + best savings
-    best_deals.sort(key=lambda d: (d["combined_sim"], d["savings_abs"]), reverse=True)
+        # IMAGE SIMILARITY (no Amazon hash: nothing to compare, skip the fetch)
+        img_sim = 0.0
+        img_hash = None
+        if amazon_hash:
+            offer_hash = await compute_phash(o.thumbnail)
+            if offer_hash:
+                img_sim = phash_similarity(amazon_hash, offer_hash)
+                img_hash = phashes[o.thumbnail] = str(offer_hash)
 
-    return {
-        "match_found": len(best_deals) > 0,
-        "amazon": {
+        combined_sim = (text_sim * 0.6) + (img_sim * 0.4)
+
+        if combined_sim < 55:
+            filtered["weak_match"] += 1
+            continue
+
+        # Rank by strongest match + best savings
+        best_deals.push(
+            (combined_sim, savings_abs),
+            ScoredDeal(
+                offer=o,
+                sim=text_sim,
+                img_sim=img_sim,
+                combined_sim=combined_sim,
+                savings_abs=savings_abs,
+                savings_pct=savings_pct,
+                img_hash=img_hash,
+            ),
+            seq=seq,
+        )
+
+    for rule, count in filtered.items():
+        if count:
+            OFFERS_FILTERED.inc(count, rule=rule)
+
+    return ScoreResult(
+        amazon={
             "asin": payload.asin,
             "title": payload.title,
             "price": amz_price,
             "brand": payload.brand,
             "thumbnail": payload.thumbnail,
         },
-        "best_deals": best_deals[:5],
-    }
+        best_deals=best_deals.items(),
+        filtered=filtered,
+        phashes=phashes,
+    )